@@ -5,23 +5,164 @@ This module simplies the drawing process for scripts that automate AutoCAD.
 It draws various shapes by printing to a script file defined by the user, 
 which is then run on AutoCAD.
 
+Shapes are first collected in a LayoutGeometry (per layer NumPy buffers) and
+written to the script in one pass by flush(), which exportDXF(), runScript()
+and close() call for you.
+
+Pieces that repeat (meanders, launch pads) can be drawn once with makeCell()
+and placed with placeCell(). The script defines each cell once as a block and
+places it with -INSERT (and ARRAY for arrays), DXF and GDSII files keep them
+as blocks and structures.
+
+With a cache (a directory or a GeometryCache) the bigger drawing calls are
+looked up by a hash of their arguments, so re-running a design only redraws
+the pieces that changed, see cached().
+
+Wafer-scale designs can also be written as a grid of smaller files, one per
+tile, with writeTiles().
+
+newScript(..., precision = 0.001) writes coordinates on a 1 nm grid with no
+more digits than they need, polyline points relative to each other, for
+scripts less than half the size.
+
 *** NOTE: When exporting dxf file in AutoCAD, use the 2000 DXF version format.
 """
 from math import *
 import subprocess
 from os import getcwd
+import os
+import re
 import shlex
+import functools
+import hashlib
+import numpy as np
+from DXFWriter import writeDXF
+from GDSWriter import writeGDS
+from SonnetWriter import writeSonnet
+from GeometryCache import GeometryCache
+from DesignRules import checkDesign
+from ScriptProfile import ScriptProfile, recordVertices
+from TileWriter import writeTiles
+from GridFormat import GridFormat
+from LayoutGeometry import LayoutGeometry, Cell, LAYER_MAKE, LAYER_SET, POLYGON, \
+    RECT, ARC, CIRCLE, JOIN, INSERT
+
+# "PLINE ... c" format strings by vertex count, each ending in a \0 to split
+# the text of many polylines formatted at once
+plineFormats = {}
+# An annular sector as two arcs and two lines that joinAll() turns into one
+# closed polyline: arc at r1, line at the end, arc at r2, line at the start
+arcFormat = "ARC\nC\n%f,%f\n%f,%f\n%f,%f\nLINE\n%f,%f\n%f,%f\n" \
+    "\nARC\nC\n%f,%f\n%f,%f\n%f,%f\nLINE\n%f,%f\n%f,%f\n\n"
+# Columns of [cx, cy, LayerGeometry.arcEndPoints()] in arcFormat order
+arcColumns = [0,1, 2,3, 4,5, 4,5, 8,9, 0,1, 6,7, 8,9, 2,3, 6,7]
+# The same sector as one closed polyline with two three point arc segments:
+# r1 start, (second point) r1 middle, r1 end, r2 end, r2 middle, r2 start
+closedArcFormat = "PLINE\n%f,%f\nA\nS\n%f,%f\n%f,%f\nL\n%f,%f\nA\nS\n%f,%f\n%f,%f\nL\nc\n"
+# Columns of [cx, cy, LayerGeometry.arcEndPoints(), arcMidPoints()] in closedArcFormat order
+closedArcColumns = [2,3, 10,11, 4,5, 8,9, 12,13, 6,7]
+# On a grid the points of each command after its first are written relative
+# ("@dx,dy") to the one before: which points of arcFormat and closedArcFormat
+# start a command
+arcAbsolute = [True,False,False, True,False, True,False,False, True,False]
+closedArcAbsolute = [True,False,False,False,False,False]
+arcGridFormat = arcFormat.replace("%f,%f", "%s")
+closedArcGridFormat = closedArcFormat.replace("%f,%f", "%s")
+# Turns everything drawn after the entity saved in asMark into the set asSet,
+# so the cell content just written can be made into a block
+joinText = "PEDIT\nM\nALL\n\n\nJ\n\n\n" # Joins everything touching into polylines
+blockSetText = "(setq asSet (ssadd) asEnt (if asMark (entnext asMark) (entnext)))\n" \
+    "(while asEnt (ssadd asEnt asSet) (setq asEnt (entnext asEnt)))\n"
+
+def cacheable(method):
+    """ Makes a drawing method go through newScript.cached() when the script
+        has a cache"""
+    @functools.wraps(method)
+    def cachedMethod(self, *args, **kwargs):
+        if self.cache is None or self.cacheDepth:
+            return method(self, *args, **kwargs)
+        return self.cached(method, *args, **kwargs)
+    return cachedMethod
+
+def keyValue(value):
+    """ Arguments as plain Python values, so a NumPy float hashes like the
+        float it is"""
+    if isinstance(value, (list, tuple)):
+        return [keyValue(x) for x in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+codeHashes = {} # Function -> hash of its code, see codeHash()
+def codeHash(function):
+    """ Hash of a function's code, its module and the drawing modules, so
+        editing any of them makes cached geometry stale"""
+    if function not in codeHashes:
+        code = function.__code__
+        text = repr((code.co_code, code.co_consts, code.co_names))
+        modules = set([__file__, LayoutGeometry.fragment.__code__.co_filename, code.co_filename])
+        for module in sorted(modules):
+            if not os.path.isfile(module): # Typed in at the prompt
+                continue
+            with open(module, 'rb') as f:
+                text += hashlib.sha256(f.read()).hexdigest()
+        codeHashes[function] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return codeHashes[function]
 
 class newScript:
-    def __init__(self,filename):
+    def __init__(self,filename, closedBends = False, cache = None, profile = False, precision = None):
+        """ filename None only keeps the geometry, for designs that go
+            straight to writeDXF(), writeSonnet() and the like.
+            closedBends writes every bend gap as one closed polyline with arc
+            segments, so AutoCAD never has to PEDIT join the whole drawing.
+            cache is a GeometryCache (left open by close()) or a directory
+            for one (closed with the script), see cached().
+            profile True counts calls, time and output in self.profile and
+            prints them at close(), a file name writes them there as JSON
+            instead, see ScriptProfile.
+            precision snaps every coordinate written to the script (and the
+            Sonnet project) to a grid, e.g. 0.001 for 1 nm on a um design,
+            and writes the numbers as short as they go, with the points of a
+            polyline relative to each other. None keeps %f."""
         self.filename = filename
-        self.script = open(filename,'w')
-        self.script.write("(setvar \"CmdEcho\" 0)\n-osnap\n\n") # Script set up commands
+        self.closedBends = closedBends
+        self.precision = precision
+        self.grid = None if precision is None else GridFormat(precision)
+        self.script = None
+        if filename is not None:
+            self.script = open(filename,'w')
+            self.script.write("(setvar \"CmdEcho\" 0)\n-osnap\n\n") # Script set up commands
         self.prevAngleRad = 0.0
         self.prevEnd = [0.0,0.0]
+        # Everything drawn is kept here and only turned into script text by flush()
+        self.geometry = LayoutGeometry()
+        self.nFlushed = 0 # Geometry records already written to the script
+        self.cells = {} # (method, arguments, layer) -> cell index, see makeCell()
+        self.blocksWritten = set() # Cells already defined as blocks in the script
+        self.cache = GeometryCache(cache) if isinstance(cache, str) else cache
+        self.ownsCache = isinstance(cache, str) # A cache passed in is closed by whoever opened it
+        self.cacheDepth = 0 # Calls within a cached call are not cached on their own
+        self.cachedText = {} # First record -> (number of records, script text, already profiled) from the cache
+        self.profile = None
+        self.profileOutput = profile
+        if profile:
+            self.profile = ScriptProfile(self)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
     def runScript(self,pathAutoCAD):
         """ Runs AutoCAD with the script you are working with via subprocess"""
+        if self.script is None:
+            raise ValueError("There is no script file to run, newScript was made with filename None")
+        # AutoCAD has to see the whole drawing
+        self.flush()
+        self.script.flush()
         # Get acad.exe path from AutoCAD Folder
         programPath = '\"%s%s\"' % (pathAutoCAD, "\\acad.exe") 
         # Get script path from current Folder
@@ -35,84 +176,329 @@ class newScript:
 
     def exportDXF(self):
         """ Exports a DXF file (version 2000) with the same name as script """
+        if self.script is None:
+            raise ValueError("There is no script file to export from, newScript was made with " \
+                "filename None: use writeDXF()")
+        self.flush()
         nameDXF = self.filename.replace(".scr", "")
         # Zoom out to full view, not sure where else to have this happen
         self.script.write("ZOOM\nALL\n") 
         self.script.write("DXFOUT\n%s\nV\nLT2000\n\n" % nameDXF)
 
+    def writeDXF(self, filename = None, sectorsAsArcs = False):
+        """ Writes a DXF file (version 2000) directly, without AutoCAD. Uses
+            the script name with .dxf unless given a filename."""
+        if filename is None:
+            filename = self.filename.replace(".scr", "") + ".dxf"
+        return writeDXF(self.geometry, filename, sectorsAsArcs)
+
+    def writeSonnet(self, filename = None, **options):
+        """ Writes a Sonnet project directly, without AutoCAD or dxfgeo. Uses
+            the script name with .son unless given a filename, see
+            SonnetWriter for the options."""
+        if filename is None:
+            filename = self.filename.replace(".scr", "") + ".son"
+        if self.precision is not None:
+            options.setdefault("precision", self.precision)
+        return writeSonnet(self.geometry, filename, **options)
+
+    def writeGDS(self, filename = None, **options):
+        """ Writes a GDSII stream file, one structure per layer. Uses the
+            script name with .gds unless given a filename, see GDSWriter for
+            the options."""
+        if filename is None:
+            filename = self.filename.replace(".scr", "") + ".gds"
+        return writeGDS(self.geometry, filename, **options)
+
+    def writeTiles(self, directory = None, **options):
+        """ Writes the design as a grid of tiles, one set of files per tile,
+            plus a manifest of the region each covers. Uses the script name
+            with _tiles as directory unless given one, see TileWriter for the
+            options."""
+        if directory is None:
+            directory = self.filename.replace(".scr", "") + "_tiles"
+        options.setdefault("closedBends", self.closedBends)
+        options.setdefault("precision", self.precision)
+        return writeTiles(self.geometry, directory, **options)
+
+    def checkDesign(self, minSpacing, **options):
+        """ Checks spacing, overlaps and shapes outside the frame, returns the
+            list of Violations (empty if all is well), see DesignRules"""
+        return checkDesign(self.geometry, minSpacing, **options)
+
+    def flush(self):
+        """ Writes all geometry drawn since the last flush to the script
+            in one pass"""
+        geometry = self.geometry
+        records = geometry.records.view()[self.nFlushed:]
+        if not len(records) or self.script is None:
+            return
+        parts = []
+        for text in self.flushText(geometry, records):
+            parts.append(text)
+            if len(parts) > 4096: # Keep the text in memory bounded
+                self.script.write("".join(parts))
+                parts = []
+        self.script.write("".join(parts))
+        self.nFlushed += len(records)
+        self.cachedText = {}
+
+    def flushText(self, geometry, records):
+        """ Script text for the unflushed records, using the text that came
+            with cached calls where there is some"""
+        position = 0
+        for first in sorted(self.cachedText):
+            if first < self.nFlushed:
+                continue
+            count, text, counted = self.cachedText[first]
+            first -= self.nFlushed
+            if first > position:
+                for part in self.scriptText(geometry, records[position:first], self.closedBends):
+                    yield part
+            if self.profile is not None and not counted:
+                self.profiledCachedText(geometry, records[first:first + count], text)
+            yield text
+            position = first + count
+        if position < len(records):
+            for part in self.scriptText(geometry, records[position:], self.closedBends):
+                yield part
+
+    def profiledCachedText(self, geometry, records, text):
+        """ Counts text that came from the cache: the shapes between two
+            layer changes on their layer, without the layer and PEDIT
+            commands"""
+        profile = self.profile
+        position, layerIndex, nShapes, nVertices = 0, -1, 0, 0
+        for kind, layer, index in records.tolist() + [[None, -1, -1]]:
+            if kind == JOIN:
+                continue
+            if kind is not None and kind != LAYER_MAKE and kind != LAYER_SET:
+                layerIndex, nShapes = layer, nShapes + 1
+                nVertices += recordVertices(geometry, kind, layer, index)
+                continue
+            change = self.layerText(geometry, kind, layer) if kind is not None else ""
+            end = text.find(change, position) if kind is not None else len(text)
+            shapes = text[position:end]
+            profile.issued("PEDIT", shapes.count(joinText))
+            profile.issued("ARRAY", shapes.count("ARRAY\n"))
+            if nShapes:
+                profile.emitted(geometry.layers[layerIndex].name, shapes.replace(joinText, ""), \
+                    nShapes, nVertices)
+            position, nShapes, nVertices = end + len(change), 0, 0
+
+    def layerText(self, geometry, kind, layerIndex):
+        """ Script text of a LAYER_MAKE or LAYER_SET record"""
+        layer = geometry.layers[layerIndex]
+        if kind == LAYER_MAKE:
+            return "-LAYER\nMAKE\n%s\nCOLOR\nTRUECOLOR\n%d,%d,%d\n\n\n" % ((layer.name,) + tuple(layer.color))
+        return "-LAYER\nSET\n%s\n\n" % layer.name
+
+    def scriptText(self, geometry, records, closedBends):
+        """ Yields the script text for the given geometry records. The
+            polylines and bends of each layer are formatted up front, all of
+            them with one string format, and the text split per shape."""
+        vertexLists = {} # layer -> (first vertex, grid point lines)
+        polygonTexts = {} # layer -> {polygon: PLINE text}, without a grid
+        arcLists = {} # layer -> (first arc, arc texts or rows of grid point lines)
+        grid = self.grid
+        for layerIndex in set(records[:,1].tolist()) - set([-1]):
+            layer = geometry.layers[layerIndex]
+            ofLayer = records[records[:,1] == layerIndex]
+            polygons = ofLayer[(ofLayer[:,0] == POLYGON) | (ofLayer[:,0] == RECT), 2]
+            if len(polygons):
+                if grid is None:
+                    polygonTexts[layerIndex] = self.plineTexts(layer, ofLayer[ofLayer[:,0] == POLYGON, 2])
+                else:
+                    offsets = layer.offsets.view()
+                    first = int(offsets[polygons.min()])
+                    vertices = layer.vertices.view()[first:int(offsets[polygons.max() + 1])]
+                    absolute = np.zeros(len(vertices), bool)
+                    absolute[offsets[polygons.min():polygons.max() + 1] - first] = True
+                    vertexLists[layerIndex] = (first, grid.pointLines(grid.units(vertices), absolute))
+            arcs = ofLayer[ofLayer[:,0] == ARC, 2]
+            if len(arcs):
+                first, last = int(arcs.min()), int(arcs.max()) + 1
+                if closedBends:
+                    values = np.hstack([layer.arcs.view()[first:last,:2], \
+                        layer.arcEndPoints(first, last), layer.arcMidPoints(first, last)])
+                    columns, absolute = closedArcColumns, closedArcAbsolute
+                else:
+                    values = np.hstack([layer.arcs.view()[first:last,:2], layer.arcEndPoints(first, last)])
+                    columns, absolute = arcColumns, arcAbsolute
+                if grid is None:
+                    # Every bend in one format, split at the \0 after each
+                    text = ((closedArcFormat if closedBends else arcFormat) + "\0")*(last - first) \
+                        % tuple(values[:,columns].ravel().tolist())
+                    arcLists[layerIndex] = (first, text.split("\0"))
+                else:
+                    # The arc format with a "%s" per point, rows of point lines
+                    lines = grid.pointLines(grid.units(values[:,columns]), np.tile(absolute, last - first))
+                    arcLists[layerIndex] = (first, [lines[i:i + len(absolute)] \
+                        for i in range(0, len(lines), len(absolute))])
+        profile = self.profile
+        for kind, layerIndex, index in records.tolist():
+            if kind == POLYGON:
+                if grid is None:
+                    text = polygonTexts[layerIndex][index]
+                else:
+                    first, lines = vertexLists[layerIndex]
+                    offsets = geometry.layers[layerIndex].offsets.data
+                    lines = lines[int(offsets[index]) - first:int(offsets[index + 1]) - first]
+                    text = "PLINE\n%s\nc\n" % "\n".join(lines)
+            elif kind == ARC:
+                first, rows = arcLists[layerIndex]
+                if grid is None:
+                    text = rows[index - first]
+                else:
+                    text = (closedArcGridFormat if closedBends else arcGridFormat) % tuple(rows[index - first])
+            elif kind == JOIN:
+                if profile is not None:
+                    profile.issued("PEDIT")
+                yield joinText
+                continue
+            elif kind == LAYER_MAKE or kind == LAYER_SET:
+                yield self.layerText(geometry, kind, layerIndex)
+                continue
+            elif kind == RECT:
+                if grid is not None:
+                    # First corner, then the opposite one relative to it
+                    corners = grid.units(geometry.layers[layerIndex].polygon(index)[[0, 2]])
+                    text = "RECTANGLE\n%s\n%s\n" % tuple(grid.pointLines(corners, [True, False]))
+                else:
+                    corners = geometry.layers[layerIndex].polygon(index)[[0, 2]]
+                    text = "RECTANGLE\n%f,%f\n%f,%f\n" % tuple(corners.ravel().tolist())
+            elif kind == CIRCLE:
+                text = self.circleText(geometry.layers[layerIndex].circles.view()[index])
+            elif kind == INSERT:
+                cellIndex, x, y, angle, nx, ny, dx, dy = geometry.instances.view()[index].tolist()
+                cell = geometry.cells[int(cellIndex)]
+                if cell.name not in self.blocksWritten:
+                    for text in self.blockText(cell, geometry.layers[layerIndex].name):
+                        yield text
+                text = "-INSERT\n%s\n%s,%s\n1\n1\n%f\n" % (cell.name, self.numberText(x), \
+                    self.numberText(y), degrees(angle)) + self.arrayText(nx, ny, dx, dy)
+            else:
+                continue
+            if profile is not None:
+                profile.emitted(geometry.layers[layerIndex].name, text, 1, \
+                    recordVertices(geometry, kind, layerIndex, index))
+                if kind == CIRCLE or kind == INSERT:
+                    profile.issued("ARRAY", text.count("ARRAY\n"))
+            yield text
+
+    def plineTexts(self, layer, polygons):
+        """ {polygon: PLINE text} for an array of polygon indices of a layer,
+            formatted in one go"""
+        polygons = np.unique(polygons)
+        if not len(polygons):
+            return {}
+        offsets = layer.offsets.view()
+        counts = offsets[polygons + 1] - offsets[polygons]
+        # The vertices of the polygons, in order
+        rows = np.repeat(offsets[polygons] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        for n in set(counts.tolist()) - set(plineFormats):
+            plineFormats[n] = "PLINE\n" + "%f,%f\n"*n + "c\n\0"
+        text = "".join([plineFormats[n] for n in counts.tolist()]) \
+            % tuple(layer.vertices.view()[rows].ravel().tolist())
+        return dict(zip(polygons.tolist(), text.split("\0")))
+
+    def blockText(self, cell, layerName):
+        """ Yields the script text that draws a cell and makes it a block,
+            then goes back to layer layerName. Bends in a cell are always
+            closed polylines: PEDIT joining the whole drawing in the middle of
+            a block definition would pull in shapes outside the cell."""
+        self.blocksWritten.add(cell.name)
+        records = cell.geometry.records.view()
+        records = records[records[:,0] != JOIN]
+        yield "(setq asMark (entlast))\n"
+        for text in self.scriptText(cell.geometry, records, True):
+            yield text
+        yield blockSetText
+        yield "-BLOCK\n%s\n0,0\n!asSet\n\n" % cell.name
+        yield "-LAYER\nSET\n%s\n\n" % layerName
+
+    def arrayText(self, nx, ny, dx, dy):
+        """ ARRAY of the most recent object into ny rows dy apart and nx
+            columns dx apart, nothing for a single copy"""
+        if nx == 1 and ny == 1:
+            return ""
+        text = "ARRAY\nLAST\n\n\n" # Array the most recent object
+        text += "%d\n%d\n" % (ny, nx) # Row and column repeat
+        if ny == 1:
+            text += "%s\n" % self.numberText(dx) # Spacing for columns
+        elif nx == 1:
+            text += "%s\n" % self.numberText(dy) # Spacing for rows
+        else:
+            text += "%s\n%s\n" % (self.numberText(dy), self.numberText(dx))
+        return text
+
+    def circleText(self, circle):
+        """ CIRCLE command, followed by ARRAY for a circle array"""
+        cx, cy, r, nx, ny, dx, dy = circle
+        return "CIRCLE\n%s,%s\n%s\n" % (self.numberText(cx), self.numberText(cy), \
+            self.numberText(r)) + self.arrayText(nx, ny, dx, dy)
+
+    def numberText(self, value):
+        """ A coordinate or distance as script text, on the grid if there is one"""
+        return "%f" % value if self.grid is None else self.grid.number(value)
+
+    def close(self):
+        """ Writes out the remaining geometry and closes the script (and
+            the cache if it opened it, a GeometryCache passed in is only
+            saved)"""
+        if self.script is not None and not self.script.closed:
+            self.flush()
+            self.script.close()
+        if self.cache is not None:
+            if self.ownsCache:
+                self.cache.close()
+            else:
+                self.cache.save()
+        if self.profile is not None and self.profileOutput:
+            self.profile.dump(self.profileOutput)
+            self.profileOutput = None # Only once
+
     def addLayer(self, name = "NameMe", color = [255,255,255]): 
         """ Creates a new layer with the specified name and 
             RGB color"""
-        self.script.write("-LAYER\nMAKE\n%s\n" % name)
-        self.script.write("COLOR\nTRUECOLOR\n%d,%d,%d\n\n\n" \
-            % tuple(color))
+        self.geometry.addLayer(name, color)
 
     def setLayer(self, name): 
         """ Changes current layer to specified by name"""
-        self.script.write("-LAYER\nSET\n%s\n\n" % name)
+        self.geometry.setLayer(name)
 
     def addRect(self, base, xlen, ylen): 
         """ Adds a rectangle with corners (base[0],base[1]) and 
             (base[0] + xlen, base[1] + ylen)"""
-        self.script.write("RECTANGLE\n%f,%f\n%f,%f\n" \
-            % (base[0], base[1], base[0] + xlen, base[1] + ylen))
+        self.geometry.addPolygon([[base[0], base[1]], [base[0] + xlen, base[1]], \
+            [base[0] + xlen, base[1] + ylen], [base[0], base[1] + ylen]], rect = True)
+
     def addCPWRectGap(self, width, gap, length, start, startAngleRad): 
         """ Adds a rectangle with corners (base[0],base[1]) and 
             (base[0] + xlen, base[1] + ylen)"""
-        self.script.write("PLINE\n")
-        self.rotateAndWritePoint(startAngleRad, start[0], \
-            start[1],start)
-        self.rotateAndWritePoint(startAngleRad, start[0], \
-            start[1] - width/2 - gap,start)
-        self.rotateAndWritePoint(startAngleRad, start[0] + length, \
-            start[1] - width/2 - gap,start)
-        self.rotateAndWritePoint(startAngleRad, start[0] + length, \
-            start[1] + width/2 + gap,start)
-        self.rotateAndWritePoint(startAngleRad, start[0], \
-            start[1] + width/2 + gap,start)
-        self.script.write("c\n")
+        wg2 = width/2 + gap
+        self.geometry.addPolygon([[0, 0], [0, -wg2], [length, -wg2], [length, wg2], \
+            [0, wg2]], startAngleRad, start)
         self.prevAngleRad = startAngleRad
         self.prevEnd = [start[0] + length*cos(startAngleRad), start[1] + length*sin(startAngleRad)]
 
     def addCircle(self, base, r): 
         """ Adds a circle with radius r with center (base[0],base[1])"""
-        self.script.write("CIRCLE\n%f,%f\n%f\n" % (base[0],base[1],r))
+        self.geometry.addCircle(base, r)
 
     def addCircleArray(self, base, r, space = [2,2], nRepeat = [2,2]):
         """ Repeats a circle nRepeat times upwards and rightwards with 
             separation given by space"""
-        self.script.write("CIRCLE\n%f,%f\n%f\n" % (base[0],base[1], r))
-        self.script.write("ARRAY\nLAST\n\n\n") # Array the most recent object
-        self.script.write("%d\n%d\n" % tuple(nRepeat)) # Column and row repeat
-        if nRepeat[0] == 1:
-            self.script.write("%f\n" % space[1]) # Spacing for columns
-        elif nRepeat[1] == 1:
-            self.script.write("%f\n" % space[0]) # Spacing for rows
-        else:
-            self.script.write("%f\n%f\n" % tuple(space))
+        self.geometry.addCircle(base, r, space, nRepeat)
+
     def addCPWStraightSrtEnd(self, width, gap, start, end):
         """ Adds a coplanar waveguide with the specified width and gap from start to end"""
         [disp, theta] = self.getDisplacementAndAngle(start, end)
-        self.script.write("PLINE\n")
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] - width/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] - width/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] - width/2 - gap,start)
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] - width/2 - gap,start)
-        self.script.write("c\n")
-        self.script.write("PLINE\n")
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] + width/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] + width/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] + width/2 + gap,start)
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] + width/2 + gap,start)
-        self.script.write("c\n")
+        w2 = width/2
+        self.geometry.addPolygon([[0, -w2], [disp, -w2], [disp, -w2 - gap], \
+            [0, -w2 - gap]], theta, start)
+        self.geometry.addPolygon([[0, w2], [disp, w2], [disp, w2 + gap], \
+            [0, w2 + gap]], theta, start)
         self.prevAngleRad = theta
         self.prevEnd = end
 
@@ -124,10 +510,16 @@ class newScript:
 
     def rotateAndWritePoint(self,theta,x,y,pivot):
         """ Rotates the specified point (x,y) by an angle theta
-            around the pivot and write the result to the script"""
+            around the pivot and write the result to the script (if there
+            is one)"""
         [x_rot,y_rot] = self.rotatePoint(theta,x,y,pivot)
-        self.script.write("%f,%f\n" \
-            % (x_rot, y_rot))
+        if self.script is None:
+            return
+        self.flush() # Keep the point behind everything drawn before it
+        text = "%s,%s\n" % (self.numberText(x_rot), self.numberText(y_rot))
+        if self.profile is not None:
+            self.profile.emitted(self.geometry.currentLayerName(), text, 0, 1)
+        self.script.write(text)
 
     def rotatePoint(self,theta,x,y,pivot):
         """ Rotates the specified point (x,y) by an angle theta
@@ -156,28 +548,14 @@ class newScript:
     def addCPWRamp(self, widthStart, gapStart, widthEnd, gapEnd, start, end):
         """ Adds a coplanar waveguide with a linear ramp."""
         [disp, theta] = self.getDisplacementAndAngle(start, end)
+        ws2 = widthStart/2
+        we2 = widthEnd/2
         # Right side etch pattern
-        self.script.write("PLINE\n")
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] - widthStart/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] - widthEnd/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] - widthEnd/2 - gapEnd,start)
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] - widthStart/2 - gapStart,start)
-        self.script.write("c\n")
+        self.geometry.addPolygon([[0, -ws2], [disp, -we2], [disp, -we2 - gapEnd], \
+            [0, -ws2 - gapStart]], theta, start)
         # Left side etch pattern
-        self.script.write("PLINE\n")
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] + widthStart/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] + widthEnd/2,start)
-        self.rotateAndWritePoint(theta, start[0] + disp, \
-            start[1] + widthEnd/2 + gapEnd,start)
-        self.rotateAndWritePoint(theta, start[0], \
-            start[1] + widthStart/2 + gapStart,start)
-        self.script.write("c\n")
+        self.geometry.addPolygon([[0, ws2], [disp, we2], [disp, we2 + gapEnd], \
+            [0, ws2 + gapStart]], theta, start)
         self.prevAngleRad = theta # Keeping track of angles
         self.prevEnd = end # Keeping track of end points
 
@@ -212,89 +590,37 @@ class newScript:
 
         self.prevAngleRad = startAngleRad + angleRad # Keeping track of angles
         self.prevEnd = self.rotatePoint(startAngleRad,x,y,start) # Keeping track of end points
-        self.joinAll()
+        if not self.closedBends:
+            self.joinAll()
         
     def joinAll(self):
         """ Join all into a single polyline """
-        self.script.write("PEDIT\nM\nALL\n\n\nJ\n\n\n")
+        self.geometry.addJoin()
 
     def CPWAngBendHelperPositive(self, center, start, radius, width ,gap, angleRad ,startAngleRad):
         """ This is pretty much just the ugly geometry part of the bent CPW with angleRad > 0"""
-        for i in range(0,2):
-            # i = 0 makes the right side etch pattern
-            # i = 1 makes the left side etch pattern
-            if i == 0:
-                sign = 1
-            else:
-                sign = -1
-            # Some short hard notation
-            rw2 = radius + sign*width/2
-            rw2g = radius + sign*width/2 + sign*gap
-            # Inner arc
-            self.script.write("ARC\nC\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1],start)               
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] - rw2, start)
-            arcEnd = [center[0] + rw2*sin(angleRad), \
-                center[1] - rw2*cos(angleRad)]
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            # Connecting line
-            self.script.write("LINE\n")
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1],start)
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0] + sign*gap*sin(angleRad), \
-                arcEnd[1] - sign*gap*cos(angleRad),start)
-            # Inner arc
-            self.script.write("\nARC\nC\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1],start)
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] - rw2g, start)
-            arcEnd = [center[0] + rw2g*sin(angleRad), \
-                center[1] - rw2g*cos(angleRad)]
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            # Connecting line
-            self.script.write("LINE\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] - rw2, start)
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] - rw2g, start)
-            self.script.write("\n")
+        # Arcs sweep counterclockwise from straight below the center
+        centerRot = self.rotatePoint(startAngleRad, center[0], center[1], start)
+        angleStart = startAngleRad - pi/2
+        for sign in [1, -1]:
+            # sign = 1 makes the right side etch pattern
+            # sign = -1 makes the left side etch pattern
+            self.geometry.addArc(centerRot, radius + sign*width/2, \
+                radius + sign*width/2 + sign*gap, angleStart, angleStart + angleRad)
 
     def CPWAngBendHelperNegative(self, center, start, radius, width ,gap, angleRad ,startAngleRad):
         """ This is pretty much just the ugly geometry part of the bent CPW with angleRad < 0"""
+        # Arcs sweep counterclockwise up to straight above the center
         angleRad = -angleRad
-        for i in range(0,2):
-            # i = 0 makes the right side etch pattern
-            # i = 1 makes the left side etch pattern
-            if i == 0:
-                sign = 1
-            else:
-                sign = -1
-            # Some short hard notation
-            rw2 = radius + sign*width/2
-            rw2g = radius + sign*width/2 + sign*gap
-
-            # Inner arc
-            self.script.write("ARC\nC\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1], start)
-            arcEnd = [center[0] + rw2*sin(angleRad), \
-                center[1] + rw2*cos(angleRad)]
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] + rw2, start)
-            # Connecting line
-            self.script.write("LINE\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] + rw2, start)
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] + rw2g, start)
-            # Outer arc
-            self.script.write("\nARC\nC\n")
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1],start)
-            arcEnd = [center[0] + rw2g*sin(angleRad), \
-                center[1] + rw2g*cos(angleRad)]
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            self.rotateAndWritePoint(startAngleRad, center[0], center[1] + rw2g, start)
-            # Connecting line
-            self.script.write("LINE\n")
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0], arcEnd[1], start)
-            self.rotateAndWritePoint(startAngleRad, arcEnd[0] - sign*gap*sin(angleRad), \
-                arcEnd[1] - sign*gap*cos(angleRad),start)
-            self.script.write("\n")
+        centerRot = self.rotatePoint(startAngleRad, center[0], center[1], start)
+        angleEnd = startAngleRad + pi/2
+        for sign in [1, -1]:
+            # sign = 1 makes the right side etch pattern
+            # sign = -1 makes the left side etch pattern
+            self.geometry.addArc(centerRot, radius + sign*width/2, \
+                radius + sign*width/2 + sign*gap, angleEnd - angleRad, angleEnd)
 
+    @cacheable
     def CPWMeander(self, width, gap, lengthTotal, radius, straightLength, startPhaseRad, start, startAngleRad):
         """ Generates a CPW meander which starts with a phase defined as follows: http://i.imgur.com/K03NLCl.png
             lengthTotal, radius, and straightLength more or less set the overall size of the meander"""
@@ -335,6 +661,97 @@ class newScript:
             self.addCPWAngBend(width, gap, radius, turn*lastAngle, self.prevEnd, self.prevAngleRad)
             lengthSoFar += straightLength + pi*lastAngle/180*radius
 
+    def makeCell(self, method, *args):
+        """ Draws a piece once into a cell and returns it, for placeCell().
+            method is the name of a drawing method taking start and
+            startAngleRad, e.g. makeCell("CPWMeander", 4, 4, 8000, 100, 500, pi),
+            or a function f(script, *args) that draws around the origin.
+            The piece is drawn from the origin at angle 0 on the current
+            layer. Cells are memoized: the same method (the same function
+            object, not just one of the same name), arguments and layer give
+            back the same cell."""
+        name = method if isinstance(method, str) else method.__name__
+        key = (method, repr(args), self.geometry.currentLayerName())
+        if key in self.cells:
+            return self.geometry.cells[self.cells[key]]
+        # Draw into a geometry of its own, starting from the origin
+        parent = self.geometry
+        prevEnd, prevAngleRad = self.prevEnd, self.prevAngleRad
+        self.geometry = LayoutGeometry(parent.cells)
+        self.geometry.setLayer(key[2])
+        self.geometry.layers[0].color = parent.layer(key[2]).color
+        self.prevEnd, self.prevAngleRad = [0.0,0.0], 0.0
+        self.cacheDepth += 1
+        try:
+            if isinstance(method, str):
+                getattr(self, method)(*args, start = [0.0,0.0], startAngleRad = 0.0)
+            else:
+                method(self, *args)
+            # Block names take letters, digits and _ ("<lambda>" does not do)
+            cell = Cell("%s_%d" % (re.sub(r"[^A-Za-z0-9_]", "", name) or "cell", len(parent.cells)), self.geometry, \
+                self.prevEnd, self.prevAngleRad)
+        finally:
+            self.geometry = parent
+            self.prevEnd, self.prevAngleRad = prevEnd, prevAngleRad
+            self.cacheDepth -= 1
+        self.cells[key] = parent.addCell(cell)
+        return cell
+
+    def placeCell(self, cell, start, startAngleRad = 0, nRepeat = [1,1], space = [0,0]):
+        """ Places a cell from makeCell() at start rotated by startAngleRad.
+            nRepeat = [rows, columns] and space = [row distance, column
+            distance] make an array like addCircleArray. The trace carries on
+            from the end of the (first) placed cell."""
+        self.geometry.addInstance(self.geometry.cells.index(cell), start, \
+            startAngleRad, space, nRepeat)
+        self.prevEnd = self.rotatePoint(startAngleRad, start[0] + cell.end[0], \
+            start[1] + cell.end[1], start)
+        self.prevAngleRad = startAngleRad + cell.endAngleRad
+
+    def cached(self, method, *args, **kwargs):
+        """ Calls method (a method name or a function f(script, *args))
+            through the cache: if the same call was made before with the
+            same code, layer and trace position, its shapes are copied in
+            from the cache instead of being drawn again. The result of a
+            cache hit is None. Calls that place cells, and calls made while
+            drawing a cell for makeCell(), are never cached.
+            CPWMeander, launchPadBegin and launchPadEnd always go through
+            here when there is a cache."""
+        if isinstance(method, str):
+            method = getattr(newScript, method)
+        method = getattr(method, "__wrapped__", method)
+        if self.cache is None or self.cacheDepth:
+            return method(self, *args, **kwargs)
+        key = self.cache.key(method.__name__, codeHash(method), keyValue(args), \
+            sorted(keyValue(list(kwargs.items()))), self.geometry.currentLayerName(), \
+            keyValue(self.prevEnd), keyValue(self.prevAngleRad), self.closedBends, self.precision)
+        first = len(self.geometry.records)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.geometry.addFragment(entry)
+            self.prevEnd = entry["state"][:2].tolist()
+            self.prevAngleRad = float(entry["state"][2])
+            if entry["text"] is not None and self.script is not None:
+                self.cachedText[first] = (len(entry["records"]), entry["text"], False)
+            return None
+        self.cacheDepth += 1
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            self.cacheDepth -= 1
+        fragment = self.geometry.fragment(first)
+        if fragment is not None:
+            fragment["state"] = np.array([self.prevEnd[0], self.prevEnd[1], self.prevAngleRad], np.float64)
+            if self.script is not None:
+                # Formatted now and kept, so flush() does not do it again
+                # (nor count it again in the profile, scriptText did)
+                fragment["text"] = "".join(self.scriptText(self.geometry, \
+                    self.geometry.records.view()[first:], self.closedBends))
+                self.cachedText[first] = (len(fragment["records"]), fragment["text"], True)
+            self.cache.put(key, fragment)
+        return result
+
+    @cacheable
     def launchPadBegin(self, padWidth, totalWidth, traceWidth, traceGap, padLength, rampLength, start, startAngleRad):
         """  Begin a trace with a lunach pad """
         padGap = (totalWidth - padWidth)/2
@@ -342,6 +759,7 @@ class newScript:
         self.addCPWStraightLenAng(padWidth, padGap, padLength, self.prevEnd, self.prevAngleRad)
         self.addCPWRampLenAng(padWidth, padGap, traceWidth, traceGap, rampLength, self.prevEnd, self.prevAngleRad)
 
+    @cacheable
     def launchPadEnd(self, padWidth, totalWidth, traceWidth, traceGap, padLength, rampLength, start, startAngleRad):
         """ End a trace with a lunach pad """
         padGap = (totalWidth - padWidth)/2
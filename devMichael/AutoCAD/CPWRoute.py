@@ -0,0 +1,265 @@
+""" CPW Route
+A CPWRoute records the pieces of a coplanar waveguide path (straights, ramps,
+bends and meanders) without drawing anything. Its length, end point and
+bounding box are worked out in closed form, so trying many meander lengths
+for a resonator costs a few multiplications each instead of thousands of
+drawn segments. draw() turns the route into geometry with the usual newScript
+methods, chaining prevEnd and prevAngleRad for you.
+
+e.g. a resonator tuned to a length before anything is drawn:
+    for length in range(6000, 12000, 10):
+        route = CPWRoute(4, 4, [1750, 4984], -pi).straight(500).meander(length, 100, 500, pi)
+        if route.bbox()[1] > 1000:
+            break
+    route.draw(a)
+
+Angles of bends are in degrees like addCPWAngBend, positive turns left.
+"""
+from math import *
+
+class CPWRoute:
+    """ A CPW path kept as pieces, start is where the center conductor
+        begins and startAngleRad the direction it leaves in"""
+    def __init__(self, width, gap, start = [0,0], startAngleRad = 0):
+        self.start = list(start)
+        self.startAngleRad = startAngleRad
+        self.startWidth = width
+        self.startGap = gap
+        self.width = width # Width and gap at the end of the route so far
+        self.gap = gap
+        # ("straight", length, width, gap), ("ramp", length, width, gap,
+        # widthEnd, gapEnd), ("bend", radius, angle, width, gap) and
+        # ("meander", lengthTotal, radius, straightLength, startPhaseRad, width, gap)
+        self.segments = []
+
+    def straight(self, length):
+        self.segments.append(("straight", length, self.width, self.gap))
+        return self
+
+    def ramp(self, length, width, gap):
+        """ Tapers from the current width and gap to the given ones"""
+        self.segments.append(("ramp", length, self.width, self.gap, width, gap))
+        self.width = width
+        self.gap = gap
+        return self
+
+    def bend(self, radius, angle):
+        if angle != 0:
+            self.segments.append(("bend", radius, angle, self.width, self.gap))
+        return self
+
+    def meander(self, lengthTotal, radius, straightLength, startPhaseRad):
+        """ A meander as drawn by newScript.CPWMeander"""
+        self.segments.append(("meander", lengthTotal, radius, straightLength, \
+            startPhaseRad, self.width, self.gap))
+        return self
+
+    def length(self):
+        """ Length along the center of the trace"""
+        total = 0.0
+        for segment in self.segments:
+            if segment[0] == "bend":
+                total += segment[1]*abs(segment[2])*pi/180
+            else: # A meander always ends at exactly lengthTotal
+                total += segment[1]
+        return total
+
+    def end(self):
+        """ ([x, y], angleRad) where the route finishes. The angle can differ
+            by a whole turn from the prevAngleRad draw() leaves behind, which
+            straights work out again from their end points."""
+        x, y, theta = self.start[0], self.start[1], self.startAngleRad
+        for segment in self.segments:
+            if segment[0] == "meander":
+                x, y, theta = meanderEnd(segment, (x, y, theta))
+            else:
+                x, y, theta = advance((x, y, theta), segment)
+        return [x, y], theta
+
+    def bbox(self):
+        """ [xmin, ymin, xmax, ymax] of everything the route draws. For a
+            meander only the first and last two turns of its bulk are looked
+            at: every other turn is one of these moved along the meander."""
+        xmin = ymin = inf
+        xmax = ymax = -inf
+        pose = (self.start[0], self.start[1], self.startAngleRad)
+        for segment in self.segments:
+            if segment[0] == "meander":
+                pieces = meanderPieces(segment, pose, bulk = "ends")
+                pose = meanderEnd(segment, pose)
+            else:
+                pieces = [(pose, segment)]
+                pose = advance(pose, segment)
+            for piecePose, piece in pieces:
+                x0, y0, x1, y1 = pieceBox(piecePose, piece)
+                xmin, ymin = min(xmin, x0), min(ymin, y0)
+                xmax, ymax = max(xmax, x1), max(ymax, y1)
+        if xmin == inf:
+            return None
+        return [xmin, ymin, xmax, ymax]
+
+    def pieces(self):
+        """ Yields (pose, piece) for every straight, ramp and bend, meanders
+            broken up the way CPWMeander draws them"""
+        pose = (self.start[0], self.start[1], self.startAngleRad)
+        for segment in self.segments:
+            if segment[0] == "meander":
+                for piece in meanderPieces(segment, pose):
+                    yield piece
+                pose = meanderEnd(segment, pose)
+            else:
+                yield pose, segment
+                pose = advance(pose, segment)
+
+    def draw(self, script):
+        """ Draws the route with a newScript, returns its end like end().
+            Each piece starts where the script says the last one ended, as
+            if the calls had been chained by hand. A route with a piece that
+            cannot be drawn (see pieceProblem) raises ValueError before
+            anything is drawn."""
+        pieces = list(self.pieces())
+        for pose, piece in pieces:
+            problem = pieceProblem(piece)
+            if problem is not None:
+                raise ValueError("Cannot draw %s at (%.3f, %.3f): %s" % (piece[0], pose[0], pose[1], problem))
+        script.prevEnd = list(self.start)
+        script.prevAngleRad = self.startAngleRad
+        for pose, piece in pieces:
+            kind = piece[0]
+            if kind == "straight":
+                script.addCPWStraightLenAng(piece[2], piece[3], piece[1], \
+                    script.prevEnd, script.prevAngleRad)
+            elif kind == "ramp":
+                script.addCPWRampLenAng(piece[2], piece[3], piece[4], piece[5], \
+                    piece[1], script.prevEnd, script.prevAngleRad)
+            elif kind == "bend":
+                script.addCPWAngBend(piece[3], piece[4], piece[1], piece[2], \
+                    script.prevEnd, script.prevAngleRad)
+        return script.prevEnd, script.prevAngleRad
+
+def pieceProblem(piece):
+    """ Why a straight, ramp or bend cannot be drawn, None if it can. A
+        meander too short for its first bend ends in a negative straight."""
+    if piece[0] == "bend":
+        radius, width, gap = piece[1], piece[3], piece[4]
+        if radius < width/2.0 + gap:
+            return "radius %g is less than half the trace, %g" % (radius, width/2.0 + gap)
+    elif piece[1] < 0:
+        return "negative length %g" % piece[1]
+    return None
+
+def advance(pose, piece):
+    """ Pose (x, y, angleRad) at the end of a straight, ramp or bend"""
+    x, y, theta = pose
+    if piece[0] != "bend":
+        return (x + piece[1]*cos(theta), y + piece[1]*sin(theta), theta)
+    radius, angleRad = piece[1], piece[2]*pi/180
+    # The center is to the left for a left turn, to the right otherwise
+    side = 1 if angleRad > 0 else -1
+    cx = x - side*radius*sin(theta)
+    cy = y + side*radius*cos(theta)
+    phi = theta - side*pi/2 + angleRad
+    return (cx + radius*cos(phi), cy + radius*sin(phi), theta + angleRad)
+
+def pieceBox(pose, piece):
+    """ [xmin, ymin, xmax, ymax] of the gaps drawn for one piece"""
+    x, y, theta = pose
+    c, s = cos(theta), sin(theta)
+    if piece[0] == "straight" or piece[0] == "ramp":
+        length = piece[1]
+        h0 = piece[2]/2.0 + piece[3]
+        h1 = h0 if piece[0] == "straight" else piece[4]/2.0 + piece[5]
+        xs = [x - h0*s, x + h0*s, x + length*c - h1*s, x + length*c + h1*s]
+        ys = [y + h0*c, y - h0*c, y + length*s + h1*c, y + length*s - h1*c]
+        return [min(xs), min(ys), max(xs), max(ys)]
+    radius, angleRad = piece[1], piece[2]*pi/180
+    h = piece[3]/2.0 + piece[4]
+    side = 1 if angleRad > 0 else -1
+    cx = x - side*radius*s
+    cy = y + side*radius*c
+    # Counterclockwise sweep from phi0 to phi1
+    phi0 = theta - side*pi/2
+    phi0, phi1 = min(phi0, phi0 + angleRad), max(phi0, phi0 + angleRad)
+    xs = []
+    ys = []
+    for r in [radius - h, radius + h]:
+        for phi in [phi0, phi1]:
+            xs.append(cx + r*cos(phi))
+            ys.append(cy + r*sin(phi))
+    # The outer edge reaches further where the sweep crosses an axis
+    k = ceil(phi0/(pi/2))
+    while k*pi/2 < phi1:
+        xs.append(cx + (radius + h)*cos(k*pi/2))
+        ys.append(cy + (radius + h)*sin(k*pi/2))
+        k += 1
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def meanderLayout(segment):
+    """ (first bend angle, its length, turn, number of straight and U-turn
+        pairs in the bulk) of a meander, the closed form of CPWMeander's loop"""
+    kind, lengthTotal, radius, straightLength, startPhaseRad, width, gap = segment
+    startPhaseRad = startPhaseRad % (2*pi)
+    if startPhaseRad == 0:
+        angle, lengthFirst, turn = -180, radius*pi, 1
+    elif startPhaseRad == pi:
+        angle, lengthFirst, turn = 180, radius*pi, -1
+    else:
+        angle = 180*(startPhaseRad - pi)/pi
+        lengthFirst = abs(radius*(startPhaseRad - pi))
+        turn = 1 if startPhaseRad < pi and startPhaseRad > 0 else -1
+    pair = straightLength + radius*pi
+    nPairs = max(0, int(ceil((lengthTotal - pair - lengthFirst)/pair)))
+    return angle, lengthFirst, turn, nPairs
+
+def meanderPieces(segment, pose, bulk = "all"):
+    """ Yields (pose, piece) for the pieces of a meander starting at pose.
+        bulk "ends" gives only the first and last two straight and U-turn
+        pairs of the bulk, enough for a bounding box, "none" none of them."""
+    kind, lengthTotal, radius, straightLength, startPhaseRad, width, gap = segment
+    angle, lengthFirst, turn, nPairs = meanderLayout(segment)
+    first = ("bend", radius, angle, width, gap)
+    yield pose, first
+    x, y, theta = advance(pose, first)
+    if bulk == "all":
+        pairs = range(nPairs)
+    elif bulk == "none":
+        pairs = []
+    else:
+        pairs = sorted(set([0, 1, nPairs - 2, nPairs - 1]) & set(range(nPairs)))
+    # Pair k starts straightLength along the meander for odd k, always
+    # 2*radius*k across, and runs the opposite way every other pair
+    c, s = cos(theta), sin(theta)
+    for k in pairs:
+        along = straightLength*(k % 2)
+        across = 2*radius*turn*k
+        sign = 1 - 2*(k % 2)
+        start = (x + along*c - across*s, y + along*s + across*c, theta + turn*pi*(k % 2))
+        piece = ("straight", straightLength, width, gap)
+        yield start, piece
+        yield advance(start, piece), ("bend", radius, sign*turn*180, width, gap)
+    # The tail
+    x, y = x + straightLength*(nPairs % 2)*c - 2*radius*turn*nPairs*s, \
+        y + straightLength*(nPairs % 2)*s + 2*radius*turn*nPairs*c
+    pose = (x, y, theta + turn*pi*(nPairs % 2))
+    turn = turn*(1 - 2*(nPairs % 2))
+    if bulk == "all":
+        # Added up like CPWMeander does, so the tail comes out the same
+        lengthSoFar = lengthFirst
+        for k in pairs:
+            lengthSoFar += straightLength + radius*pi
+    else:
+        lengthSoFar = lengthFirst + nPairs*(straightLength + radius*pi)
+    if lengthTotal - lengthSoFar < straightLength:
+        yield pose, ("straight", lengthTotal - lengthSoFar, width, gap)
+    else:
+        piece = ("straight", straightLength, width, gap)
+        yield pose, piece
+        lastAngle = 180*(lengthTotal - lengthSoFar - straightLength)/(pi*radius)
+        if lastAngle != 0:
+            yield advance(pose, piece), ("bend", radius, turn*lastAngle, width, gap)
+
+def meanderEnd(segment, pose):
+    """ Pose at the end of a meander, from its last two pieces"""
+    for pose, piece in meanderPieces(segment, pose, bulk = "none"):
+        pass
+    return advance(pose, piece)
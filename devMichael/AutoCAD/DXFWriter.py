@@ -0,0 +1,267 @@
+""" DXF Writer
+Writes a LayoutGeometry straight to an AutoCAD 2000 (AC1015) DXF file, so no
+AutoCAD is needed to get a DXF out of a newScript design.
+    polygons - closed LWPOLYLINE
+    arcs     - closed LWPOLYLINE with bulges, what PEDIT Join makes of the
+               arcs and lines in the script (or ARC and LINE entities)
+    circles  - CIRCLE, circle arrays are written out one circle at a time
+    cells    - a BLOCK each, placed with INSERT (MINSERT for arrays that are
+               not rotated, rotated arrays get one INSERT per copy)
+Layers go into the LAYER table with their true color (420) and the nearest
+AutoCAD color index (62), which is all AutoCAD 2000 itself understands.
+
+Entities are formatted in small batches and written through a buffered file,
+so the text of the drawing is never held in memory as a whole.
+"""
+from math import *
+from LayoutGeometry import POLYGON, RECT, ARC, CIRCLE, INSERT
+
+def aciPalette():
+    """ RGB values of the AutoCAD color index, entry i is ACI i"""
+    palette = [[0,0,0], [255,0,0], [255,255,0], [0,255,0], [0,255,255], \
+        [0,0,255], [255,0,255], [255,255,255], [128,128,128], [192,192,192]]
+    # 10 to 249: 24 hues in 15 degree steps, 5 values, full and half saturation
+    for aci in range(10, 250):
+        hue = ((aci - 10)//10)*15
+        value = [255, 204, 153, 127, 76][((aci - 10) % 10)//2]
+        low = value/2.0 if aci % 2 else 0.0
+        sector = hue//60
+        frac = (hue % 60)/60.0
+        rising = low + (value - low)*frac
+        falling = value - (value - low)*frac
+        rgb = [[value, rising, low], [falling, value, low], [low, value, rising], \
+            [low, falling, value], [rising, low, value], [value, low, falling]][sector]
+        palette.append([int(c) for c in rgb])
+    for gray in [51, 91, 132, 173, 214, 255]:
+        palette.append([gray, gray, gray])
+    return palette
+
+ACI = aciPalette()
+
+def nearestACI(color):
+    """ Color index closest to an RGB color, as AutoCAD picks it when saving
+        true colors to a 2000 DXF"""
+    best = 7
+    bestDistance = None
+    for i in range(1, 256):
+        distance = sum((a - b)**2 for a, b in zip(ACI[i], color))
+        if bestDistance is None or distance < bestDistance:
+            best = i
+            bestDistance = distance
+    return best
+
+# LWPOLYLINE vertex lists by vertex count
+vertexFormats = {}
+
+class DXFWriter:
+    """ Streams a LayoutGeometry into a DXF file"""
+    def __init__(self, filename, sectorsAsArcs = False, bufferSize = 1 << 16, chunkSize = 1024):
+        self.filename = filename
+        self.sectorsAsArcs = sectorsAsArcs # ARC and LINE entities instead of closed polylines
+        self.bufferSize = bufferSize
+        self.chunkSize = chunkSize # Entities formatted before each write
+        self.nextHandle = 0x30 # Handles up to here are the fixed table and block ones
+        self.owner = "1F" # Block record the entities being written belong to
+        self.blockRecords = [] # Block record handle of each cell
+
+    def handle(self):
+        self.nextHandle += 1
+        return "%X" % self.nextHandle
+
+    def write(self, geometry):
+        """ Writes the geometry and returns the number of entities"""
+        with open(self.filename, 'w', buffering = self.bufferSize) as self.dxf:
+            self.writeHeader(geometry)
+            self.writeTables(geometry)
+            self.writeBlocks(geometry)
+            self.dxf.write("  0\nSECTION\n  2\nENTITIES\n")
+            nEntities = self.writeEntities(geometry)
+            self.dxf.write("  0\nENDSEC\n")
+            self.writeObjects()
+            self.dxf.write("  0\nEOF\n")
+        return nEntities
+
+    def writeHeader(self, geometry):
+        box = geometry.bbox() or [0, 0, 0, 0]
+        self.dxf.write("  0\nSECTION\n  2\nHEADER\n"
+            "  9\n$ACADVER\n  1\nAC1015\n"
+            "  9\n$INSBASE\n 10\n0.0\n 20\n0.0\n 30\n0.0\n"
+            "  9\n$EXTMIN\n 10\n%f\n 20\n%f\n 30\n0.0\n"
+            "  9\n$EXTMAX\n 10\n%f\n 20\n%f\n 30\n0.0\n"
+            "  9\n$INSUNITS\n 70\n    13\n" # Microns
+            "  9\n$HANDSEED\n  5\nFFFFFF\n"
+            "  0\nENDSEC\n"
+            "  0\nSECTION\n  2\nCLASSES\n  0\nENDSEC\n" % tuple(box))
+
+    def writeTables(self, geometry):
+        write = self.dxf.write
+        write("  0\nSECTION\n  2\nTABLES\n")
+        write("  0\nTABLE\n  2\nVPORT\n  5\n8\n330\n0\n100\nAcDbSymbolTable\n 70\n     0\n  0\nENDTAB\n")
+        write("  0\nTABLE\n  2\nLTYPE\n  5\n5\n330\n0\n100\nAcDbSymbolTable\n 70\n     3\n")
+        for handle, name in [("14", "ByBlock"), ("15", "ByLayer"), ("16", "Continuous")]:
+            write("  0\nLTYPE\n  5\n%s\n330\n5\n100\nAcDbSymbolTableRecord\n"
+                "100\nAcDbLinetypeTableRecord\n  2\n%s\n 70\n     0\n  3\n%s\n"
+                " 72\n    65\n 73\n     0\n 40\n0.0\n" \
+                % (handle, name, "Solid line" if name == "Continuous" else ""))
+        write("  0\nENDTAB\n")
+        layers = [("0", [255,255,255])] + [(layer.name, layer.color) \
+            for layer in geometry.layers if layer.name != "0"]
+        write("  0\nTABLE\n  2\nLAYER\n  5\n2\n330\n0\n100\nAcDbSymbolTable\n 70\n%6d\n" % len(layers))
+        for name, color in layers:
+            write("  0\nLAYER\n  5\n%s\n330\n2\n100\nAcDbSymbolTableRecord\n"
+                "100\nAcDbLayerTableRecord\n  2\n%s\n 70\n     0\n 62\n%6d\n"
+                "420\n%d\n  6\nContinuous\n370\n    -3\n390\nF\n" % (self.handle(), name, \
+                nearestACI(color), (color[0] << 16) + (color[1] << 8) + color[2]))
+        write("  0\nENDTAB\n")
+        write("  0\nTABLE\n  2\nSTYLE\n  5\n3\n330\n0\n100\nAcDbSymbolTable\n 70\n     1\n"
+            "  0\nSTYLE\n  5\n11\n330\n3\n100\nAcDbSymbolTableRecord\n"
+            "100\nAcDbTextStyleTableRecord\n  2\nStandard\n 70\n     0\n 40\n0.0\n"
+            " 41\n1.0\n 50\n0.0\n 71\n     0\n 42\n0.2\n  3\ntxt\n  4\n\n  0\nENDTAB\n")
+        for handle, table in [("6", "VIEW"), ("7", "UCS")]:
+            write("  0\nTABLE\n  2\n%s\n  5\n%s\n330\n0\n100\nAcDbSymbolTable\n"
+                " 70\n     0\n  0\nENDTAB\n" % (table, handle))
+        write("  0\nTABLE\n  2\nAPPID\n  5\n9\n330\n0\n100\nAcDbSymbolTable\n 70\n     1\n"
+            "  0\nAPPID\n  5\n12\n330\n9\n100\nAcDbSymbolTableRecord\n"
+            "100\nAcDbRegAppTableRecord\n  2\nACAD\n 70\n     0\n  0\nENDTAB\n")
+        write("  0\nTABLE\n  2\nDIMSTYLE\n  5\nA\n330\n0\n100\nAcDbSymbolTable\n 70\n     1\n"
+            "100\nAcDbDimStyleTable\n  0\nDIMSTYLE\n105\n27\n330\nA\n"
+            "100\nAcDbSymbolTableRecord\n100\nAcDbDimStyleTableRecord\n"
+            "  2\nStandard\n 70\n     0\n  0\nENDTAB\n")
+        self.blockRecords = [self.handle() for cell in geometry.cells]
+        write("  0\nTABLE\n  2\nBLOCK_RECORD\n  5\n1\n330\n0\n100\nAcDbSymbolTable\n"
+            " 70\n%6d\n" % (2 + len(geometry.cells)))
+        for handle, name in [("1F", "*Model_Space"), ("1B", "*Paper_Space")] \
+                + list(zip(self.blockRecords, [cell.name for cell in geometry.cells])):
+            write("  0\nBLOCK_RECORD\n  5\n%s\n330\n1\n100\nAcDbSymbolTableRecord\n"
+                "100\nAcDbBlockTableRecord\n  2\n%s\n" % (handle, name))
+        write("  0\nENDTAB\n  0\nENDSEC\n")
+
+    def writeBlocks(self, geometry):
+        write = self.dxf.write
+        write("  0\nSECTION\n  2\nBLOCKS\n")
+        blocks = [("20", "21", "1F", "*Model_Space", None), ("1C", "1D", "1B", "*Paper_Space", None)]
+        for cell, owner in zip(geometry.cells, self.blockRecords):
+            blocks.append((self.handle(), self.handle(), owner, cell.name, cell.geometry))
+        for block, end, owner, name, content in blocks:
+            write("  0\nBLOCK\n  5\n%s\n330\n%s\n100\nAcDbEntity\n  8\n0\n"
+                "100\nAcDbBlockBegin\n  2\n%s\n 70\n     0\n"
+                " 10\n0.0\n 20\n0.0\n 30\n0.0\n  3\n%s\n  1\n\n" % (block, owner, name, name))
+            if content is not None:
+                self.owner = owner
+                self.writeEntities(content)
+                self.owner = "1F"
+            write("  0\nENDBLK\n  5\n%s\n330\n%s\n100\nAcDbEntity\n  8\n0\n"
+                "100\nAcDbBlockEnd\n" % (end, owner))
+        write("  0\nENDSEC\n")
+
+    def writeObjects(self):
+        self.dxf.write("  0\nSECTION\n  2\nOBJECTS\n"
+            "  0\nDICTIONARY\n  5\nC\n330\n0\n100\nAcDbDictionary\n281\n     1\n"
+            "  3\nACAD_GROUP\n350\nD\n"
+            "  0\nDICTIONARY\n  5\nD\n330\nC\n100\nAcDbDictionary\n281\n     1\n"
+            "  0\nENDSEC\n")
+
+    def entityStart(self, kind, layerName):
+        return "  0\n%s\n  5\n%s\n330\n%s\n100\nAcDbEntity\n  8\n%s\n" \
+            % (kind, self.handle(), self.owner, layerName)
+
+    def polylineText(self, layerName, points, bulges = None):
+        """ Closed LWPOLYLINE through points, bulges (one per vertex) turn
+            the edge starting at that vertex into an arc"""
+        n = len(points)
+        text = self.entityStart("LWPOLYLINE", layerName) \
+            + "100\nAcDbPolyline\n 90\n%9d\n 70\n     1\n 43\n0.0\n" % n
+        if bulges is None:
+            if n not in vertexFormats:
+                vertexFormats[n] = " 10\n%f\n 20\n%f\n"*n
+            return text + vertexFormats[n] % tuple(points.ravel().tolist())
+        for (x, y), bulge in zip(points, bulges):
+            text += " 10\n%f\n 20\n%f\n" % (x, y)
+            if bulge != 0:
+                text += " 42\n%.15f\n" % bulge
+        return text
+
+    def sectorText(self, layerName, arc, endPoints):
+        """ An annular sector as a closed polyline with bulges, or as ARC
+            and LINE entities"""
+        cx, cy, r1, r2, angleStart, angleEnd = arc
+        r1Start, r1End = endPoints[0:2], endPoints[2:4]
+        r2Start, r2End = endPoints[4:6], endPoints[6:8]
+        if not self.sectorsAsArcs:
+            bulge = tan((angleEnd - angleStart)/4)
+            return self.polylineText(layerName, [r1Start, r1End, r2End, r2Start], \
+                [bulge, 0, -bulge, 0])
+        text = ""
+        for r in [r1, r2]:
+            text += self.entityStart("ARC", layerName) \
+                + "100\nAcDbCircle\n 10\n%f\n 20\n%f\n 30\n0.0\n 40\n%f\n" \
+                "100\nAcDbArc\n 50\n%f\n 51\n%f\n" % (cx, cy, abs(r), \
+                degrees(angleStart), degrees(angleEnd))
+        for p, q in [(r1End, r2End), (r2Start, r1Start)]:
+            text += self.entityStart("LINE", layerName) \
+                + "100\nAcDbLine\n 10\n%f\n 20\n%f\n 30\n0.0\n" \
+                " 11\n%f\n 21\n%f\n 31\n0.0\n" % (p[0], p[1], q[0], q[1])
+        return text
+
+    def circleText(self, layerName, circle):
+        cx, cy, r, nx, ny, dx, dy = circle
+        text = ""
+        for i in range(int(nx)):
+            for j in range(int(ny)):
+                text += self.entityStart("CIRCLE", layerName) \
+                    + "100\nAcDbCircle\n 10\n%f\n 20\n%f\n 30\n0.0\n 40\n%f\n" \
+                    % (cx + i*dx, cy + j*dy, r)
+        return text
+
+    def insertText(self, layerName, geometry, instance):
+        """ INSERT of a cell, a MINSERT for an array along the drawing axes"""
+        cellIndex, x, y, angle, nx, ny, dx, dy = instance
+        name = geometry.cells[int(cellIndex)].name
+        if angle != 0 and nx*ny > 1:
+            # MINSERT would rotate the array with the block
+            placements = geometry.placements(instance)
+        else:
+            placements = [(x, y, angle)]
+        text = ""
+        for x, y, angle in placements:
+            text += self.entityStart("INSERT", layerName) \
+                + "100\nAcDbBlockReference\n  2\n%s\n 10\n%f\n 20\n%f\n 30\n0.0\n 50\n%f\n" \
+                % (name, x, y, degrees(angle))
+        if len(placements) == 1 and nx*ny > 1:
+            text += " 70\n%6d\n 71\n%6d\n 44\n%f\n 45\n%f\n" % (nx, ny, dx, dy)
+        return text
+
+    def writeEntities(self, geometry):
+        """ Writes every shape in drawing order, chunkSize at a time"""
+        records = geometry.records.view()
+        arcEndPoints = {} # Layer -> end points of all its arcs
+        parts = []
+        nEntities = 0
+        for kind, layerIndex, index in records.tolist():
+            if kind == POLYGON or kind == RECT:
+                layer = geometry.layers[layerIndex]
+                parts.append(self.polylineText(layer.name, layer.polygon(index)))
+            elif kind == ARC:
+                layer = geometry.layers[layerIndex]
+                if layerIndex not in arcEndPoints:
+                    arcEndPoints[layerIndex] = layer.arcEndPoints()
+                parts.append(self.sectorText(layer.name, layer.arcs.view()[index].tolist(), \
+                    arcEndPoints[layerIndex][index].tolist()))
+            elif kind == CIRCLE:
+                layer = geometry.layers[layerIndex]
+                parts.append(self.circleText(layer.name, layer.circles.view()[index].tolist()))
+            elif kind == INSERT:
+                parts.append(self.insertText(geometry.layers[layerIndex].name, geometry, \
+                    geometry.instances.view()[index].tolist()))
+            else:
+                continue
+            nEntities += 1
+            if len(parts) >= self.chunkSize:
+                self.dxf.write("".join(parts))
+                parts = []
+        self.dxf.write("".join(parts))
+        return nEntities
+
+def writeDXF(geometry, filename, sectorsAsArcs = False):
+    """ Writes geometry to a DXF file, returns the number of shapes written"""
+    return DXFWriter(filename, sectorsAsArcs).write(geometry)
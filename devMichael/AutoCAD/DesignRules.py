@@ -0,0 +1,387 @@
+""" Design Rules
+Checks a LayoutGeometry for the mistakes we used to find by eye in AutoCAD
+or from a failed Sonnet run:
+    spacing - two shapes on a layer closer than minSpacing without touching
+    overlap - two shapes on a layer whose insides overlap
+    frame   - a shape not wholly inside a frame rectangle (see addRect)
+Shapes that only touch (the pieces of one trace meet edge to edge) are
+fine. Edges lying along each other with both shapes on the same side, a
+duplicate shape for one, overlap. Spacing is judged per pair of edges, so
+two shapes touching at one end can still be too close at the other.
+
+On a layer of etched gaps the space between two shapes is metal, so the
+center conductor of every CPW counts as spacing too: minSpacing is the
+narrowest metal the process can make.
+
+Arcs and circles are broken into chords within tolerance first. A chord
+can lie up to tolerance inside or outside its arc, so spacing next to one
+is allowed to fall short of minSpacing by tolerance per shape. Candidate
+pairs come from a uniform grid over the bounding boxes of the edges (and of
+the shapes, for one shape inside another), so only edges near each other are
+ever compared. Sorting the grid entries keeps the whole check O(n log n).
+"""
+from math import *
+import numpy as np
+from LayoutGeometry import circlePolygon
+
+class Violation:
+    """ A broken rule: shapes are (layer, kind, index) of the shapes involved,
+        kind being "polygon", "arc" or "circle" (index (circle, copy) for
+        circle arrays). distance is the spacing found and location a point
+        near the problem."""
+    def __init__(self, rule, shapes, distance = None, location = None):
+        self.rule = rule
+        self.shapes = shapes
+        self.distance = distance
+        self.location = location
+
+    def __repr__(self):
+        text = "%s: %s" % (self.rule, ", ".join(["%s %s %s" % shape for shape in self.shapes]))
+        if self.distance is not None:
+            text += " %.4g apart" % self.distance
+        if self.location is not None:
+            text += " at (%.3f, %.3f)" % tuple(self.location)
+        return text
+
+def layerShapes(layer, tolerance):
+    """ (ids, vertex arrays) of every shape on a layer"""
+    ids = []
+    shapes = []
+    for i, points in enumerate(layer.polygons()):
+        ids.append((layer.name, "polygon", i))
+        shapes.append(points)
+    arcs = layer.arcs.view()
+    ids += [(layer.name, "arc", i) for i in range(len(arcs))]
+    shapes += sectorPolygons(arcs, tolerance)
+    for i, (cx, cy, r, nx, ny, dx, dy) in enumerate(layer.circles.view().tolist()):
+        circle = circlePolygon(0, 0, r, tolerance)
+        for j in range(int(ny)):
+            for k in range(int(nx)):
+                ids.append((layer.name, "circle", (i, j*int(nx) + k) if nx*ny > 1 else i))
+                shapes.append(circle + [cx + k*dx, cy + j*dy])
+    return ids, shapes
+
+def segmentCounts(radius, sweep, tolerance):
+    """ arcSegments for arrays of radii and sweeps"""
+    radius = np.abs(radius)
+    small = radius <= tolerance
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        step = np.where(small, pi/2, 2*np.arccos(1 - tolerance/np.where(small, 1, radius)))
+    return np.maximum(1, np.ceil(np.abs(sweep)/step)).astype(np.int64)
+
+def sectorPolygons(arcs, tolerance):
+    """ sectorPolygon of every row of arcs. Sectors with the same number of
+        chords (most of them: bends share a few radii) are done together."""
+    polygons = [None]*len(arcs)
+    if not len(arcs):
+        return polygons
+    cx, cy, r1, r2, angleStart, angleEnd = arcs.T
+    rInner, rOuter = np.minimum(np.abs(r1), np.abs(r2)), np.maximum(np.abs(r1), np.abs(r2))
+    sweep = angleEnd - angleStart
+    nOuter = segmentCounts(rOuter, sweep, tolerance)
+    nInner = segmentCounts(rInner, sweep, tolerance)
+    nInner[rInner == 0] = 0
+    groups = nOuter*(nInner.max() + 1) + nInner
+    for group in np.unique(groups).tolist():
+        rows = np.nonzero(groups == group)[0]
+        m, n = nOuter[rows[0]], nInner[rows[0]]
+        t = np.linspace(0, 1, m + 1)
+        angles = angleStart[rows,None] + sweep[rows,None]*t
+        xs = [cx[rows,None] + rOuter[rows,None]*np.cos(angles)]
+        ys = [cy[rows,None] + rOuter[rows,None]*np.sin(angles)]
+        if n == 0:
+            xs.append(cx[rows,None])
+            ys.append(cy[rows,None])
+        else:
+            angles = angleEnd[rows,None] - sweep[rows,None]*np.linspace(0, 1, n + 1)
+            xs.append(cx[rows,None] + rInner[rows,None]*np.cos(angles))
+            ys.append(cy[rows,None] + rInner[rows,None]*np.sin(angles))
+        vertices = np.dstack([np.hstack(xs), np.hstack(ys)])
+        for row, points in zip(rows.tolist(), vertices):
+            polygons[row] = points
+    return polygons
+
+def candidatePairs(boxes, cellSize, groups = None):
+    """ Index pairs (i, j), i < j, of boxes [xmin, ymin, xmax, ymax] that
+        overlap, leaving out pairs in the same group if groups (sorted
+        group numbers, one per box) are given.
+        Each box is entered in the grid cells it covers and only boxes
+        sharing a cell are compared."""
+    n = len(boxes)
+    if n < 2:
+        return np.empty((0, 2), np.int64)
+    cells = np.floor(boxes/cellSize).astype(np.int64)
+    nx = cells[:,2] - cells[:,0] + 1
+    ny = cells[:,3] - cells[:,1] + 1
+    counts = nx*ny
+    owner = np.repeat(np.arange(n), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = cells[owner,0] + k % nx[owner]
+    cy = cells[owner,1] + k//nx[owner]
+    key = (cx - cx.min())*(cy.max() - cy.min() + 1) + (cy - cy.min())
+    order = np.argsort(key, kind = "stable")
+    key, owner, cx, cy = key[order], owner[order], cx[order], cy[order]
+    # Pair every entry with the entries after it in the same cell. Groups
+    # are runs of boxes (the edges of one shape), which the stable sort
+    # keeps together within a cell, so a whole run is skipped at once.
+    ends = np.searchsorted(key, key, side = "right")
+    if groups is None:
+        runEnds = np.arange(1, len(key) + 1)
+    else:
+        run = key*(int(groups.max()) + 1) + groups[owner]
+        runEnds = np.searchsorted(run, run, side = "right")
+    partners = ends - runEnds
+    i = np.repeat(np.arange(len(key)), partners)
+    j = np.repeat(runEnds, partners) + np.arange(len(i)) - np.repeat(np.cumsum(partners) - partners, partners)
+    # Two boxes that overlap share several cells: keep the pair only in the
+    # cell holding the corner where their overlap starts. The cheap tests
+    # go first, on arrays per entry.
+    x0, y0 = cells[owner,0], cells[owner,1]
+    keep = (cx[i] == np.maximum(x0[i], x0[j])) & (cy[i] == np.maximum(y0[i], y0[j]))
+    a, b = owner[i[keep]], owner[j[keep]]
+    keep = (boxes[a,0] <= boxes[b,2]) & (boxes[b,0] <= boxes[a,2]) \
+        & (boxes[a,1] <= boxes[b,3]) & (boxes[b,1] <= boxes[a,3])
+    a, b = a[keep], b[keep]
+    return np.column_stack([np.minimum(a, b), np.maximum(a, b)])
+
+def cellSizeFor(boxes, minimum):
+    """ Grid cell about twice the typical box, so most boxes cover a few cells"""
+    extent = np.maximum(boxes[:,2] - boxes[:,0], boxes[:,3] - boxes[:,1])
+    return max(2*float(np.median(extent)), minimum)
+
+def pointSegment(p, a, b):
+    """ Distance from points p to segments ab and the closest points"""
+    ab = b - a
+    lengths = np.maximum((ab*ab).sum(axis = 1), 1e-300)
+    t = np.clip(((p - a)*ab).sum(axis = 1)/lengths, 0, 1)
+    closest = a + t[:,None]*ab
+    return np.hypot(*(p - closest).T), closest
+
+def segmentDistances(p0, p1, q0, q1, eps):
+    """ Distances between segments p0p1 and q0q1, the closest points on
+        each, and whether they cross (each passes strictly through the
+        other)"""
+    candidates = [pointSegment(p0, q0, q1), pointSegment(p1, q0, q1), \
+        pointSegment(q0, p0, p1), pointSegment(q1, p0, p1)]
+    best = np.argmin([d for d, closest in candidates], axis = 0)
+    rows = np.arange(len(best))
+    d = np.array([d for d, closest in candidates])[best, rows]
+    onP = np.array([p0, p1, candidates[2][1], candidates[3][1]])[best, rows]
+    onQ = np.array([candidates[0][1], candidates[1][1], q0, q1])[best, rows]
+    s1, s2 = side(p0, p1, q0), side(p0, p1, q1)
+    s3, s4 = side(q0, q1, p0), side(q0, q1, p1)
+    crossing = (((s1 > eps) & (s2 < -eps)) | ((s1 < -eps) & (s2 > eps))) \
+        & (((s3 > eps) & (s4 < -eps)) | ((s3 < -eps) & (s4 > eps)))
+    return np.where(crossing, 0.0, d), onP, onQ, crossing
+
+def crossingPoints(p0, p1, q0, q1):
+    """ Where the lines through p0p1 and q0q1 meet, p0 where they are
+        parallel"""
+    p, q = p1 - p0, q1 - q0
+    denominator = p[:,0]*q[:,1] - p[:,1]*q[:,0]
+    numerator = (q0[:,0] - p0[:,0])*q[:,1] - (q0[:,1] - p0[:,1])*q[:,0]
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        t = np.where(denominator != 0, numerator/denominator, 0.0)
+    return p0 + t[:,None]*p
+
+def side(a, b, c):
+    """ Signed distance of points c from the lines through a and b, positive
+        to the left"""
+    ab = b - a
+    return (ab[:,0]*(c[:,1] - a[:,1]) - ab[:,1]*(c[:,0] - a[:,0])) \
+        /np.maximum(np.hypot(ab[:,0], ab[:,1]), 1e-300)
+
+def sharedLengths(p0, p1, q0, q1, eps):
+    """ Length of segment p0p1 that q0q1 lies along (both on one line),
+        0 where they are not on one line"""
+    length = np.maximum(np.hypot(*(p1 - p0).T), 1e-300)
+    along = (p1 - p0)/length[:,None]
+    t0 = ((q0 - p0)*along).sum(axis = 1)
+    t1 = ((q1 - p0)*along).sum(axis = 1)
+    shared = np.minimum(np.maximum(t0, t1), length) - np.maximum(np.minimum(t0, t1), 0)
+    collinear = (np.abs(side(p0, p1, q0)) <= eps) & (np.abs(side(p0, p1, q1)) <= eps)
+    return np.where(collinear, np.maximum(shared, 0), 0.0)
+
+def shapeDistances(points, which, p0, p1, starts, counts):
+    """ Whether each of points is inside shape which[i] (even-odd) and its
+        distance to the edges of that shape. Done for all points at once,
+        every point against every edge of its shape."""
+    n = counts[which]
+    first = np.cumsum(n) - n
+    edges = np.repeat(starts[which] - first, n) + np.arange(n.sum())
+    p = points[np.repeat(np.arange(len(points)), n)]
+    a, b = p0[edges], p1[edges]
+    straddle = (a[:,1] > p[:,1]) != (b[:,1] > p[:,1])
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        xCross = a[:,0] + (p[:,1] - a[:,1])*(b[:,0] - a[:,0])/(b[:,1] - a[:,1])
+    crossings = (straddle & (p[:,0] < xCross)).astype(np.int64)
+    inside = np.add.reduceat(crossings, first) % 2 == 1
+    return inside, np.minimum.reduceat(pointSegment(p, a, b)[0], first)
+
+def coveredPoints(points, exclude, boxes, p0, p1, starts, counts, eps, allowances):
+    """ Whether each of points is inside (or within eps of) a shape other
+        than the two in its row of exclude. boxes are the boxes of the
+        shapes, the shapes with boxes holding a point are found on a grid
+        as in candidatePairs. A point up to its allowance outside a shape
+        broken into chords may be inside the true shape, so counts."""
+    n = len(boxes)
+    boxes = boxes + np.outer(allowances, [-1, -1, 1, 1])
+    everything = np.vstack([boxes, np.hstack([points, points])])
+    groups = np.repeat([0, 1], [n, len(points)])
+    shape, point = candidatePairs(everything, cellSizeFor(boxes, eps), groups).T
+    point -= n
+    keep = (shape != exclude[point,0]) & (shape != exclude[point,1])
+    shape, point = shape[keep], point[keep]
+    covered = np.zeros(len(points), bool)
+    if len(point):
+        inside, distance = shapeDistances(points[point], shape, p0, p1, starts, counts)
+        covered[point[inside | (distance <= eps + allowances[shape])]] = True
+    return covered
+
+def checkSpacing(ids, shapes, minSpacing, eps, allowances = None, chunkSize = 1 << 20):
+    """ Spacing and overlap violations among the shapes of one layer.
+        allowances is how far each shape's edges may stray from the true
+        shape (tolerance for arcs and circles broken into chords), taken
+        off minSpacing for the edges of that shape."""
+    violations = []
+    if len(shapes) < 2:
+        return violations
+    if allowances is None:
+        allowances = np.zeros(len(shapes))
+    allowances = np.asarray(allowances, float)
+    counts = np.array([len(points) for points in shapes])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    p0 = np.vstack(shapes)
+    # Each vertex to the next, the last back to the first
+    nextIndex = np.arange(len(p0)) + 1
+    nextIndex[starts + counts - 1] = starts
+    p1 = p0[nextIndex]
+    edgeShape = np.repeat(np.arange(len(shapes)), counts)
+    # Which side of its edges a shape is on: left where it runs anticlockwise
+    area = np.add.reduceat(p0[:,0]*p1[:,1] - p1[:,0]*p0[:,1], starts)
+    inward = np.column_stack([p0[:,1] - p1[:,1], p1[:,0] - p0[:,0]])*np.sign(area)[edgeShape,None]
+    shapeBoxes = np.array([list(points.min(axis = 0)) + list(points.max(axis = 0)) for points in shapes])
+    margin = minSpacing/2.0
+    boxes = np.column_stack([np.minimum(p0, p1) - margin, np.maximum(p0, p1) + margin])
+    pairs = candidatePairs(boxes, cellSizeFor(boxes, minSpacing), edgeShape)
+    # Every pair of edges near each other is judged on its own: edges that
+    # cross, or lie along each other with both shapes on the same side,
+    # overlap; edges closer than minSpacing with nothing but space between
+    # them break the spacing rule
+    overlaps = [] # (shape pair key, location)
+    spacings = [] # (shape pair key, distance, closest points on each edge)
+    for c in range(0, len(pairs), chunkSize):
+        a, b = pairs[c:c + chunkSize].T
+        d, onA, onB, crossing = segmentDistances(p0[a], p1[a], p0[b], p1[b], eps)
+        sa, sb = edgeShape[a], edgeShape[b]
+        keys = np.minimum(sa, sb)*len(shapes) + np.maximum(sa, sb)
+        sameSide = (inward[a]*inward[b]).sum(axis = 1) > 0
+        overlap = crossing | (sameSide & (sharedLengths(p0[a], p1[a], p0[b], p1[b], eps) > eps))
+        if overlap.any():
+            # Edges that cross are reported where they cross
+            location = np.where(crossing[:,None], crossingPoints(p0[a], p1[a], p0[b], p1[b]), onB)
+            overlaps.append((keys[overlap], location[overlap]))
+        # The gap has to leave each edge on the outside of its shape
+        gap = onB - onA
+        facing = ((gap*inward[a]).sum(axis = 1) < 0) & ((gap*inward[b]).sum(axis = 1) > 0)
+        limit = minSpacing - eps - allowances[sa] - allowances[sb]
+        close = np.flatnonzero(~overlap & facing & (d > eps) & (d < limit))
+        if len(close):
+            spacings.append((keys[close], d[close], onA[close], onB[close]))
+    overlapping = set()
+    if overlaps:
+        keys = np.concatenate([k for k, location in overlaps])
+        locations = np.vstack([location for k, location in overlaps])
+        keys, first = np.unique(keys, return_index = True)
+        overlapping = set(keys.tolist())
+        for key, location in zip(keys.tolist(), locations[first].tolist()):
+            violations.append(Violation("overlap", [ids[key//len(shapes)], ids[key % len(shapes)]], \
+                location = location))
+    # What is left is a shape inside another, edges at most touching. Their
+    # boundaries do not cross, so a point just inside the one (off the
+    # middle of its longest edge) is inside the other exactly when the one
+    # is inside. Near pairs are no exception: a shape with its corners on
+    # the other's edges has nothing crossing or lying along them.
+    inner, outer = candidatePairs(shapeBoxes, cellSizeFor(shapeBoxes, minSpacing)).T
+    inner, outer = np.concatenate([inner, outer]), np.concatenate([outer, inner])
+    keys = np.minimum(inner, outer)*len(shapes) + np.maximum(inner, outer)
+    keep = (shapeBoxes[inner,:2] >= shapeBoxes[outer,:2] - eps).all(axis = 1) \
+        & (shapeBoxes[inner,2:] <= shapeBoxes[outer,2:] + eps).all(axis = 1) \
+        & ~np.isin(keys, list(overlapping))
+    inner, outer, keys = inner[keep], outer[keep], keys[keep]
+    if len(inner):
+        lengths = np.hypot(*(p1 - p0).T)
+        longest = np.lexsort([-lengths, edgeShape])[starts] # Longest edge of each shape
+        step = 10*eps/np.maximum(lengths[longest], 1e-300)
+        points = (p0[longest] + p1[longest])/2 + inward[longest]*step[:,None]
+        inside, distance = shapeDistances(points[inner], outer, p0, p1, starts, counts)
+        for key in np.unique(keys[inside]).tolist():
+            overlapping.add(key)
+            k = np.flatnonzero(keys == key)[0]
+            violations.append(Violation("overlap", [ids[key//len(shapes)], ids[key % len(shapes)]], \
+                location = points[inner[k]].tolist()))
+    if spacings:
+        keys, distances, onA, onB = [np.concatenate([spacing[i] for spacing in spacings]) for i in range(4)]
+        keep = ~np.isin(keys, list(overlapping))
+        order = np.lexsort([distances[keep], keys[keep]])
+        pending = np.flatnonzero(keep)[order]
+        # Closest edges of each pair of shapes first: where the middle of
+        # the gap is outside both, that is their spacing. Nearer than d/2 to
+        # either shape, other edges of the two are closer there (touching
+        # ones included), and inside a third shape (a bend between two
+        # straights) there is no space. The pair's next closest edges are
+        # tried then.
+        while len(pending):
+            first = np.concatenate([[True], keys[pending[1:]] != keys[pending[:-1]]])
+            tried = pending[first]
+            middle = (onA[tried] + onB[tried])/2
+            insideA, distanceA = shapeDistances(middle, keys[tried]//len(shapes), p0, p1, starts, counts)
+            insideB, distanceB = shapeDistances(middle, keys[tried] % len(shapes), p0, p1, starts, counts)
+            gap = ~insideA & ~insideB & (distanceA > distances[tried]/2 - eps) \
+                & (distanceB > distances[tried]/2 - eps)
+            pairShapes = np.column_stack([keys[tried]//len(shapes), keys[tried] % len(shapes)])
+            gap[gap] = ~coveredPoints(middle[gap], pairShapes[gap], shapeBoxes, p0, p1, starts, counts, \
+                eps, allowances)
+            for key, d, location in zip(keys[tried[gap]].tolist(), distances[tried[gap]].tolist(), \
+                    onA[tried[gap]].tolist()):
+                violations.append(Violation("spacing", [ids[key//len(shapes)], ids[key % len(shapes)]], \
+                    d, location))
+            pending = pending[~first & ~np.isin(keys[pending], keys[tried[gap]])]
+    return violations
+
+def checkFrame(ids, shapes, frames, eps, chunkSize = 4096):
+    """ Violations for shapes not wholly inside one of the frame boxes"""
+    violations = []
+    if not len(frames) or not shapes:
+        return violations
+    boxes = np.array([list(points.min(axis = 0)) + list(points.max(axis = 0)) for points in shapes])
+    for c in range(0, len(boxes), chunkSize):
+        chunk = boxes[c:c + chunkSize, None, :]
+        inside = (chunk[...,0] >= frames[:,0] - eps) & (chunk[...,1] >= frames[:,1] - eps) \
+            & (chunk[...,2] <= frames[:,2] + eps) & (chunk[...,3] <= frames[:,3] + eps)
+        for i in np.nonzero(~inside.any(axis = 1))[0].tolist():
+            box = boxes[c + i]
+            violations.append(Violation("frame", [ids[c + i]], \
+                location = [(box[0] + box[2])/2, (box[1] + box[3])/2]))
+    return violations
+
+def checkDesign(geometry, minSpacing, frameLayer = "Frame", tolerance = 0.1, layers = None, eps = 1e-6):
+    """ Runs every check on geometry and returns the list of Violations.
+        layers limits the spacing and overlap checks to the named layers
+        (default all but the frame layer). Shapes that come within eps are
+        taken to touch."""
+    if len(geometry.instances):
+        geometry = geometry.flattened()
+    frames = np.empty((0, 4))
+    if frameLayer in geometry.layerIndex:
+        frames = np.array([list(points.min(axis = 0)) + list(points.max(axis = 0)) \
+            for points in geometry.layer(frameLayer).polygons()]).reshape(-1, 4)
+    violations = []
+    for layer in geometry.layers:
+        if layer.name == frameLayer or (layers is not None and layer.name not in layers):
+            continue
+        ids, shapes = layerShapes(layer, tolerance)
+        allowances = [0.0 if kind == "polygon" else tolerance for name, kind, i in ids]
+        violations += checkSpacing(ids, shapes, minSpacing, eps, allowances)
+        violations += checkFrame(ids, shapes, frames, eps)
+    return violations
@@ -0,0 +1,208 @@
+""" GDSII Writer
+Writes a LayoutGeometry as a GDSII stream for mask and e-beam tools. Each
+layer becomes its own structure holding BOUNDARY elements, named L<layer
+number>_<layer name> (e.g. L2_CPW), and a top structure places every layer
+structure once. Each cell is a structure too, placed with SREF (AREF for
+arrays that are not rotated). Structure names are reduced to the GDSII
+character set (letters, digits, _, ? and $) and 32 characters, and a
+ValueError is raised if two structures would still get the same name.
+
+Coordinates are stored as integers in database units: with the defaults the
+design unit is 1 um and the database unit 1 nm. Arcs and circles are broken
+into chords with at most tolerance (design units) between chord and arc.
+"""
+import datetime
+import itertools
+import re
+import struct
+from math import degrees
+import numpy as np
+from LayoutGeometry import INSERT
+
+# Record types, with their data type in the low byte
+HEADER = 0x0002
+BGNLIB = 0x0102
+LIBNAME = 0x0206
+UNITS = 0x0305
+ENDLIB = 0x0400
+BGNSTR = 0x0502
+STRNAME = 0x0606
+ENDSTR = 0x0700
+BOUNDARY = 0x0800
+SREF = 0x0A00
+AREF = 0x0B00
+LAYER = 0x0D02
+DATATYPE = 0x0E02
+XY = 0x1003
+ENDEL = 0x1100
+SNAME = 0x1206
+COLROW = 0x1302
+STRANS = 0x1A01
+ANGLE = 0x1C05
+
+# Longest structure name most tools read
+MAX_NAME = 32
+
+# A record is at most 65535 bytes, so an XY record holds at most 8191 points
+MAX_POINTS = 8191
+
+def record(recordType, data = b""):
+    """ One record: 2 byte length, 2 byte type, then the data"""
+    return struct.pack(">HH", 4 + len(data), recordType) + data
+
+def int2(*values):
+    return struct.pack(">%dh" % len(values), *values)
+
+def ascii(text):
+    """ String data, padded to an even length"""
+    data = text.encode("ascii")
+    return data + b"\0" if len(data) % 2 else data
+
+def structureName(name):
+    """ name with every character GDSII does not allow in a structure name
+        replaced by _, cut to MAX_NAME characters"""
+    return re.sub(r"[^A-Za-z0-9_?$]", "_", name)[:MAX_NAME] or "_"
+
+def real8(x):
+    """ GDSII 8 byte real: sign, excess-64 base 16 exponent, 56 bit mantissa"""
+    if x == 0:
+        return b"\0"*8
+    sign = 0x80 if x < 0 else 0
+    x = abs(x)
+    exponent = 64
+    while x >= 1:
+        x /= 16.0
+        exponent += 1
+    while x < 1/16.0:
+        x *= 16.0
+        exponent -= 1
+    mantissa = int(round(x*2**56))
+    if mantissa >= 2**56: # Rounded up to the next power of 16
+        mantissa >>= 4
+        exponent += 1
+    return struct.pack(">BB", sign | exponent, mantissa >> 48) + \
+        struct.pack(">HI", (mantissa >> 32) & 0xFFFF, mantissa & 0xFFFFFFFF)
+
+class GDSWriter:
+    """ Writes LayoutGeometry objects to GDSII files"""
+    def __init__(self, libName = "AUTOSCRIPTER", topName = "TOP", userUnit = 1e-6, \
+            dbUnit = 1e-9, tolerance = 0.01, layerNumbers = None):
+        self.libName = libName
+        self.topName = topName
+        self.userUnit = userUnit # Size of a design unit in meters
+        self.dbUnit = dbUnit # Size of a database unit in meters
+        self.tolerance = tolerance # Largest chord error for arcs and circles
+        self.layerNumbers = layerNumbers # Layer name -> GDS layer, None: 1, 2, 3... in creation order
+
+    def timestamp(self):
+        now = datetime.datetime.now()
+        stamp = (now.year, now.month, now.day, now.hour, now.minute, now.second)
+        return int2(*(stamp + stamp))
+
+    def layerNumber(self, geometry, name):
+        """ GDS layer of the named layer, None if it is left out"""
+        if self.layerNumbers is None:
+            return geometry.layerIndex[name] + 1
+        return self.layerNumbers.get(name)
+
+    def structureNames(self, geometry):
+        """ (cell structure names, {layer name: structure name}) of a design.
+            Raises ValueError if two structures would get the same name."""
+        cellNames = [structureName(cell.name) for cell in geometry.cells]
+        layerNames = {}
+        for layer in geometry.layers:
+            layerNumber = self.layerNumber(geometry, layer.name)
+            if layerNumber is not None:
+                layerNames[layer.name] = structureName("L%d_%s" % (layerNumber, layer.name))
+        seen = {}
+        for source, name in [("top structure %r" % self.topName, structureName(self.topName))] + \
+                [("cell %r" % cell.name, name) for cell, name in zip(geometry.cells, cellNames)] + \
+                [("layer %r" % layer, name) for layer, name in layerNames.items()]:
+            if name in seen:
+                raise ValueError("GDSII structure name %s of %s is already used by %s" % \
+                    (name, source, seen[name]))
+            seen[name] = source
+        return cellNames, layerNames
+
+    def references(self, geometry, cellNames):
+        """ SREF and AREF elements for the cell placements of a geometry"""
+        scale = self.userUnit/self.dbUnit
+        for instance in geometry.instances.view().tolist():
+            cellIndex, x, y, angle, nx, ny, dx, dy = instance
+            head = record(SNAME, ascii(cellNames[int(cellIndex)]))
+            if angle != 0:
+                head += record(STRANS, int2(0)) + record(ANGLE, real8(degrees(angle)))
+            if nx*ny > 1 and angle == 0:
+                points = np.rint(np.array([[x, y], [x + nx*dx, y], [x, y + ny*dy]])*scale)
+                yield record(AREF) + head + record(COLROW, int2(int(nx), int(ny))) \
+                    + record(XY, points.astype(">i4").tobytes()) + record(ENDEL)
+                continue
+            for x, y, angle in geometry.placements(instance):
+                point = np.rint(np.array([x, y])*scale).astype(">i4")
+                yield record(SREF) + head + record(XY, point.tobytes()) + record(ENDEL)
+
+    def writeStructure(self, gds, name, elements):
+        """ One structure, elements written 4096 at a time. Returns the number
+            of elements."""
+        gds.write(record(BGNSTR, self.timestamp()) + record(STRNAME, ascii(name)))
+        count = 0
+        chunk = []
+        for element in elements:
+            chunk.append(element)
+            if len(chunk) >= 4096:
+                gds.write(b"".join(chunk))
+                count += len(chunk)
+                chunk = []
+        gds.write(b"".join(chunk))
+        gds.write(record(ENDSTR))
+        return count + len(chunk)
+
+    def boundaries(self, polygons, layerNumber):
+        """ BOUNDARY elements for an iterable of vertex arrays"""
+        scale = self.userUnit/self.dbUnit
+        head = record(BOUNDARY) + record(LAYER, int2(layerNumber)) + record(DATATYPE, int2(0))
+        tail = record(ENDEL)
+        for points in polygons:
+            points = np.rint(np.asarray(points)*scale).astype(">i4")
+            # Outlines are closed by repeating the first point
+            if len(points) + 1 > MAX_POINTS:
+                raise ValueError("Polygon with %d points is too big for GDSII, " \
+                    "use a larger tolerance" % len(points))
+            data = points.tobytes() + points[0].tobytes()
+            yield head + struct.pack(">HH", 4 + len(data), XY) + data + tail
+
+    def write(self, geometry, filename):
+        """ Writes one design, returns the number of boundaries and references"""
+        cellNames, layerNames = self.structureNames(geometry)
+        nElements = 0
+        with open(filename, 'wb', buffering = 1 << 20) as gds:
+            gds.write(record(HEADER, int2(600)))
+            gds.write(record(BGNLIB, self.timestamp()))
+            gds.write(record(LIBNAME, ascii(self.libName)))
+            gds.write(record(UNITS, real8(self.dbUnit/self.userUnit) + real8(self.dbUnit)))
+            # Cells first, then the layers of the design itself
+            for cell, cellName in zip(geometry.cells, cellNames):
+                elements = [self.references(cell.geometry, cellNames)]
+                for layer in cell.geometry.layers:
+                    layerNumber = self.layerNumber(geometry, layer.name)
+                    if layerNumber is not None:
+                        elements.append(self.boundaries(layer.flatPolygons(self.tolerance), layerNumber))
+                nElements += self.writeStructure(gds, cellName, itertools.chain(*elements))
+            names = []
+            for layer in geometry.layers:
+                if layer.name not in layerNames:
+                    continue
+                layerNumber = self.layerNumber(geometry, layer.name)
+                names.append(layerNames[layer.name])
+                nElements += self.writeStructure(gds, layerNames[layer.name], \
+                    self.boundaries(layer.flatPolygons(self.tolerance), layerNumber))
+            # Top structure placing every layer structure at the origin, and the cells
+            nElements += self.writeStructure(gds, structureName(self.topName), itertools.chain( \
+                (record(SREF) + record(SNAME, ascii(name)) + record(XY, struct.pack(">ii", 0, 0)) \
+                + record(ENDEL) for name in names), self.references(geometry, cellNames))) - len(names)
+            gds.write(record(ENDLIB))
+        return nElements
+
+def writeGDS(geometry, filename, **options):
+    """ Writes geometry to a GDSII file, see GDSWriter for the options"""
+    return GDSWriter(**options).write(geometry, filename)
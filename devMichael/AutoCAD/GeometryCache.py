@@ -0,0 +1,239 @@
+""" Geometry Cache
+An on-disk cache of the geometry drawn by newScript calls, so re-running a
+layout script only redraws what changed. Each cached call is keyed by a hash
+of its name, code, arguments, the current layer and where the trace stood
+(prevEnd, prevAngleRad). The entry holds the shapes the call drew (see
+LayoutGeometry.fragment), where it left the trace and the script text for
+the shapes, so a hit costs neither drawing nor formatting.
+
+    a = AutoScripter.newScript("chip.scr", cache = "chipCache")
+    a.CPWMeander(...)                # Cached, like launchPadBegin and launchPadEnd
+    a.cached(drawResonator, 8000)    # Any function f(script, *args)
+
+Entries are appended to one data file and found through an index that is
+read once when the cache is opened and written back by save() (newScript
+calls it from close()). The live entries are kept within maxBytes: when the
+data file grows past that, the least recently used entries are dropped and
+the rest copied to a new data file.
+
+Only one process writes to a cache directory at a time (a lock file says
+which). Others that open it meanwhile still get hits but store nothing.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import numpy as np
+try:
+    import fcntl
+except ImportError: # Windows
+    import msvcrt
+    fcntl = None
+
+# Bump when the entry layout changes so old entries are never read
+CACHE_VERSION = 2
+# Counts at the start of an entry: records, layers, vertices, polygons, arcs,
+# circles, bytes of layer names, bytes of script text (-1 for none)
+entryHeader = struct.Struct("<8q")
+
+def packEntry(fragment):
+    """ Bytes of a fragment dict, with its state and optional text"""
+    names = "\0".join(fragment["layerNames"].tolist()).encode("utf-8")
+    text = fragment.get("text")
+    text = None if text is None else text.encode("utf-8")
+    head = entryHeader.pack(len(fragment["records"]), len(fragment["colors"]), \
+        len(fragment["vertices"]), len(fragment["counts"]), len(fragment["arcs"]), \
+        len(fragment["circles"]), len(names), -1 if text is None else len(text))
+    arrays = [np.ascontiguousarray(fragment[name], dtype).tobytes() for name, dtype in \
+        [("records", np.int64), ("colors", np.int64), ("vertices", np.float64), \
+        ("counts", np.int64), ("arcs", np.float64), ("circles", np.float64), ("state", np.float64)]]
+    return head + b"".join(arrays) + names + (text or b"")
+
+def unpackEntry(data):
+    """ Fragment dict back from packEntry() bytes"""
+    nRecords, nLayers, nVertices, nPolygons, nArcs, nCircles, nNames, nText = \
+        entryHeader.unpack_from(data, 0)
+    offset = entryHeader.size
+    entry = {}
+    for name, dtype, shape in [("records", np.int64, (nRecords, 2)), ("colors", np.int64, (nLayers, 3)), \
+            ("vertices", np.float64, (nVertices, 2)), ("counts", np.int64, (nPolygons,)), \
+            ("arcs", np.float64, (nArcs, 6)), ("circles", np.float64, (nCircles, 7)), \
+            ("state", np.float64, (3,))]:
+        count = shape[0]*shape[1] if len(shape) == 2 else shape[0]
+        entry[name] = np.frombuffer(data, dtype, count, offset).reshape(shape)
+        offset += 8*count
+    names = bytes(data[offset:offset + nNames]).decode("utf-8")
+    entry["layerNames"] = np.array(names.split("\0") if nLayers else [], dtype = str)
+    offset += nNames
+    entry["text"] = None if nText < 0 else bytes(data[offset:offset + nText]).decode("utf-8")
+    return entry
+
+class GeometryCache:
+    """ Size bounded LRU cache of geometry fragments in a directory"""
+    def __init__(self, directory, maxBytes = 256 << 20):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.indexPath = os.path.join(directory, "index.json")
+        self.lockPath = os.path.join(directory, "lock")
+        self.writable = self.lock()
+        # key -> [offset, length, last use] in the data file
+        self.entries = {}
+        self.dataName = "data-0.bin"
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath) as f:
+                index = json.load(f)
+            if index.get("version") == CACHE_VERSION:
+                self.dataName = index["data"]
+                self.entries = index["entries"]
+        self.dataPath = os.path.join(directory, self.dataName)
+        if not os.path.exists(self.dataPath):
+            self.entries = {}
+        self.nBytes = sum(length for offset, length, used in self.entries.values())
+        self.data = None # Read only map of the data file
+        self.appendFile = None
+        self.changed = False
+        self.openData()
+
+    def lock(self):
+        """ Takes the writer lock, False if another process has it. The
+            system lets go of it if this process dies."""
+        self.lockFile = open(self.lockPath, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.lockFile.seek(0)
+                msvcrt.locking(self.lockFile.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.lockFile.close()
+            self.lockFile = None
+            return False
+        return True
+
+    def openData(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if os.path.exists(self.dataPath) and os.path.getsize(self.dataPath):
+            with open(self.dataPath, 'rb') as f:
+                self.data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def key(self, *parts):
+        """ Hash of the repr of parts, which must not hold object addresses"""
+        return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """ Fragment stored under key (see packEntry), None if there is none"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        offset, length, used = entry
+        if self.appendFile is not None and (self.data is None or offset + length > len(self.data)):
+            # Still in the append buffer of this session
+            self.appendFile.flush()
+            self.openData()
+        if self.data is None or offset + length > len(self.data):
+            # The data file lost it or was cut short (a run that died
+            # before writing everything out)
+            return self.drop(key)
+        try:
+            fragment = unpackEntry(self.data[offset:offset + length])
+        except (struct.error, ValueError):
+            return self.drop(key)
+        entry[2] = time.time()
+        self.changed = True
+        self.hits += 1
+        return fragment
+
+    def drop(self, key):
+        """ Forgets a bad entry and counts a miss, returns None"""
+        self.nBytes -= self.entries.pop(key)[1]
+        self.changed = True
+        self.misses += 1
+        return None
+
+    def put(self, key, fragment):
+        """ Stores a fragment under key, keeping at most maxBytes of entries"""
+        if not self.writable:
+            return
+        if self.appendFile is None:
+            self.appendFile = open(self.dataPath, 'ab')
+        data = packEntry(fragment)
+        if key in self.entries:
+            self.nBytes -= self.entries[key][1]
+        self.entries[key] = [self.appendFile.tell(), len(data), time.time()]
+        self.appendFile.write(data)
+        self.nBytes += len(data)
+        self.changed = True
+        if self.nBytes > self.maxBytes:
+            self.evict(3*self.maxBytes//4)
+
+    def evict(self, maxBytes):
+        """ Drops least recently used entries until at most maxBytes are
+            left, then copies the rest to a new data file"""
+        if not self.writable:
+            return
+        for key in sorted(self.entries, key = lambda key: self.entries[key][2]):
+            if self.nBytes <= maxBytes:
+                break
+            self.nBytes -= self.entries.pop(key)[1]
+        if self.appendFile is not None:
+            self.appendFile.close()
+            self.appendFile = None
+        self.openData()
+        generation = int(self.dataName[5:-4]) + 1
+        dataName = "data-%d.bin" % generation
+        with open(os.path.join(self.directory, dataName), 'wb') as f:
+            for key, entry in self.entries.items():
+                offset, length = entry[0], entry[1]
+                entry[0] = f.tell()
+                f.write(self.data[offset:offset + length])
+        oldPath = self.dataPath
+        self.dataName = dataName
+        self.dataPath = os.path.join(self.directory, dataName)
+        self.changed = True
+        self.save()
+        self.openData()
+        try:
+            os.remove(oldPath)
+        except OSError:
+            pass # Still open elsewhere, removed by a later compaction
+
+    def save(self):
+        """ Writes the index back so the next run sees the new entries"""
+        if not self.writable:
+            return
+        if self.appendFile is not None:
+            self.appendFile.flush()
+        if not self.changed:
+            return
+        temporary = self.indexPath + ".tmp"
+        with open(temporary, 'w') as f:
+            f.write(json.dumps({"version": CACHE_VERSION, "data": self.dataName, "entries": self.entries}))
+        os.replace(temporary, self.indexPath)
+        self.changed = False
+
+    def close(self):
+        """ Saves the index and lets other processes write"""
+        self.save()
+        self.entries = {} # Everything misses from here on
+        if self.appendFile is not None:
+            self.appendFile.close()
+            self.appendFile = None
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self.writable:
+            self.writable = False
+            self.lockFile.close() # Releases the lock
+            self.lockFile = None
+
+    def clear(self):
+        self.evict(0)
@@ -0,0 +1,93 @@
+""" Grid Format
+Writes coordinates on a grid of database units in as few characters as they
+need, instead of %f with six decimals:
+    grid = GridFormat(0.001)   # 1 nm grid on a um design
+    grid.number(12.3456789)    # "12.346"
+    grid.number(-0.5)          # "-.5"
+Coordinates are snapped to whole units once (units()), so differences of
+snapped points are exact and a point can be written relative to the one
+before it (pointLines(), "@dx,dy" in AutoCAD) without the error adding up
+along a polyline.
+"""
+import re
+import numpy as np
+
+# Trailing zeros of the decimals (every number has its decimal point, so a
+# run of zeros at the end never reaches into the integer part), then a bare
+# decimal point, a leading zero and a negative zero. Fixed replacements keep
+# the substitutions in C.
+trailingZeros = re.compile(r"0+(?![0-9.])")
+barePoint = re.compile(r"\.(?![0-9])")
+leadingZero = re.compile(r"(?<![0-9])0(?=\.)")
+negativeZero = re.compile(r"-0(?![0-9.])")
+
+def shortest(text):
+    """ text with every %.Nf number (N > 0) in it as short as it goes"""
+    text = trailingZeros.sub("", text)
+    text = barePoint.sub("", text)
+    text = leadingZero.sub("", text)
+    return negativeZero.sub("0", text)
+
+class GridFormat:
+    """ Numbers on a grid of precision (in drawing units)"""
+    def __init__(self, precision):
+        self.precision = float(precision)
+        # Decimals that write any multiple of precision exactly
+        self.decimals = 0
+        while self.decimals < 12:
+            scaled = self.precision*10**self.decimals
+            if abs(scaled - round(scaled)) < 1e-6*scaled:
+                break
+            self.decimals += 1
+        self.format = "%%.%df" % self.decimals
+
+    def shortest(self, text):
+        """ text of numbers written with self.format, as short as they go"""
+        return shortest(text) if self.decimals else negativeZero.sub("0", text)
+
+    def units(self, values):
+        """ values (any array) snapped to whole units"""
+        return np.round(np.asarray(values, np.float64)/self.precision).astype(np.int64)
+
+    def numbers(self, units):
+        """ Shortest text of each of an array of units"""
+        units = np.asarray(units, np.int64).ravel()
+        if not len(units):
+            return []
+        # Each distinct value formatted once
+        unique, inverse = np.unique(units, return_inverse = True)
+        values = (unique*self.precision).tolist()
+        text = self.shortest((self.format + "\n")*len(values) % tuple(values))
+        return np.array(text.split("\n")[:-1], object)[inverse.ravel()].tolist()
+
+    def number(self, value):
+        """ Shortest text of value snapped to the grid"""
+        return self.shortest(self.format % (round(value/self.precision)*self.precision))
+
+    def pointLines(self, points, absolute):
+        """ "x,y" text of every row of (n,2) units where absolute is True,
+            "@dx,dy" from the row before elsewhere"""
+        points = np.asarray(points, np.int64).reshape(-1, 2)
+        if not len(points):
+            return []
+        absolute = np.asarray(absolute, bool)
+        relative = points.copy()
+        relative[1:] -= points[:-1]
+        relative[absolute] = points[absolute]
+        # Deltas repeat a lot (the same trace widths and lengths), so only
+        # the distinct rows are formatted
+        offset = relative - relative.min(axis = 0)
+        span = offset.max(axis = 0) + 1
+        if float(span[0])*float(span[1]) < 2.0**61:
+            # One integer per row sorts much faster than rows
+            keys = (offset[:,0]*span[1] + offset[:,1])*2 + absolute
+            unique, first, inverse = np.unique(keys, return_index = True, return_inverse = True)
+        else:
+            unique, first, inverse = np.unique(np.column_stack([absolute, relative]), axis = 0, \
+                return_index = True, return_inverse = True)
+        values = np.empty((len(first), 3), object)
+        values[:,0] = np.where(absolute[first], "", "@")
+        values[:,1:] = relative[first]*self.precision
+        text = ("%s" + self.format + "," + self.format + "\n")*len(first) % tuple(values.ravel().tolist())
+        lines = np.array(self.shortest(text).split("\n")[:-1], object)
+        return lines[inverse.ravel()].tolist()
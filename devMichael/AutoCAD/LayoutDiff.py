@@ -0,0 +1,177 @@
+""" Layout Diff
+Compares two generations of a design shape by shape instead of line by line
+through 70 KB of %f,%f text:
+    diff = diffLayouts("ReadoutSimple_old.scr", a)   # files, newScripts or geometries
+    print(diffSummary(diff))
+For every layer it lists the shapes
+    added / removed - found in only one of the two
+    moved           - the same shape somewhere else, with the offset
+    changed         - a different shape in the place of the old one
+and counts the unchanged ones. Shapes are named (layer, kind, index) like in
+DesignRules.
+
+Every shape is first turned into a polygon (arcs and circles into chords) and
+its vertices put on a grid of size tolerance, starting from the lowest vertex
+and running counterclockwise, so the same shape always gives the same bytes
+however it was written. Unchanged shapes are then found by hashing these,
+moved ones by hashing them relative to their first vertex (the offset most
+shapes share wins) and changed ones through the grid index of DesignRules:
+only shapes whose boxes overlap are compared.
+"""
+from math import *
+import numpy as np
+from DesignRules import layerShapes, candidatePairs, cellSizeFor
+
+def asGeometry(layout):
+    """ LayoutGeometry of a file name, newScript or LayoutGeometry, cells
+        flattened"""
+    if isinstance(layout, str):
+        from LayoutReader import readLayout
+        layout = readLayout(layout)
+    geometry = getattr(layout, "geometry", layout)
+    return geometry.flattened() if len(geometry.instances) else geometry
+
+def shapeKeys(shapes, tolerance):
+    """ (keys, relative keys, first vertices) of vertex arrays on a grid of
+        size tolerance. Shapes with the same number of vertices are done
+        together."""
+    n = len(shapes)
+    keys = [None]*n
+    relativeKeys = [None]*n
+    firsts = np.zeros((n, 2))
+    counts = np.array([len(points) for points in shapes])
+    for count in np.unique(counts).tolist():
+        rows = np.nonzero(counts == count)[0]
+        vertices = np.stack([shapes[i] for i in rows.tolist()])
+        # Counterclockwise
+        x, y = vertices[...,0], vertices[...,1]
+        area = (x*np.roll(y, -1, axis = 1) - np.roll(x, -1, axis = 1)*y).sum(axis = 1)
+        vertices[area < 0] = vertices[area < 0, ::-1]
+        grid = np.round(vertices/tolerance).astype(np.int64)
+        # From the lowest (then leftmost) vertex
+        lowest = np.lexsort([grid[...,0], grid[...,1]], axis = 1)[:,0] if count > 1 \
+            else np.zeros(len(rows), np.int64)
+        order = (lowest[:,None] + np.arange(count)) % count
+        grid = np.take_along_axis(grid, order[...,None], axis = 1)
+        relative = grid - grid[:,:1]
+        firsts[rows] = grid[:,0]*tolerance
+        for i, key, relativeKey in zip(rows.tolist(), grid.reshape(len(rows), -1), \
+                relative.reshape(len(rows), -1)):
+            keys[i] = key.tobytes()
+            relativeKeys[i] = relativeKey.tobytes()
+    return keys, relativeKeys, firsts
+
+def greedyPairs(a, b, order):
+    """ Pairs (a[k], b[k]) taken in the given order of k, each index used once"""
+    usedA = set()
+    usedB = set()
+    pairs = []
+    for k in order.tolist():
+        if a[k] not in usedA and b[k] not in usedB:
+            usedA.add(a[k])
+            usedB.add(b[k])
+            pairs.append((a[k], b[k]))
+    return pairs
+
+def diffLayer(oldIds, oldShapes, newIds, newShapes, tolerance, maxMove):
+    """ Diff of the shapes of one layer, see diffLayouts"""
+    diff = {"unchanged": 0, "added": [], "removed": [], "moved": [], "changed": []}
+    oldKeys, oldRelative, oldFirsts = shapeKeys(oldShapes, tolerance)
+    newKeys, newRelative, newFirsts = shapeKeys(newShapes, tolerance)
+    # Unchanged: the same key on both sides
+    unmatched = {}
+    for i, key in enumerate(oldKeys):
+        unmatched.setdefault(key, []).append(i)
+    newLeft = []
+    for j, key in enumerate(newKeys):
+        if unmatched.get(key):
+            unmatched[key].pop()
+            diff["unchanged"] += 1
+        else:
+            newLeft.append(j)
+    oldLeft = sorted(i for rows in unmatched.values() for i in rows)
+    matched = set() # (side, index) of shapes paired up below
+    # Moved: the same relative key within maxMove, nearest first
+    if oldLeft and newLeft:
+        margin = maxMove/2.0
+        points = np.vstack([oldFirsts[oldLeft], newFirsts[newLeft]])
+        boxes = np.hstack([points - margin, points + margin])
+        groups = np.repeat([0, 1], [len(oldLeft), len(newLeft)])
+        pairs = candidatePairs(boxes, maxMove, groups)
+        a = [oldLeft[k] for k in pairs[:,0].tolist()]
+        b = [newLeft[k - len(oldLeft)] for k in pairs[:,1].tolist()]
+        same = [k for k in range(len(a)) if oldRelative[a[k]] == newRelative[b[k]]]
+        a = [a[k] for k in same]
+        b = [b[k] for k in same]
+        offsets = newFirsts[b] - oldFirsts[a] if same else np.zeros((0, 2))
+        # The pieces of a moved trace all move the same way: the offsets most
+        # shapes agree on go first, so the two gaps of a CPW are not mixed up
+        votes = np.unique(np.round(offsets/tolerance), axis = 0, return_inverse = True, \
+            return_counts = True)
+        counts = votes[2][votes[1].ravel()] if same else np.zeros(0)
+        order = np.lexsort([np.hypot(offsets[:,0], offsets[:,1]), -counts])
+        for i, j in greedyPairs(a, b, order):
+            offset = newFirsts[j] - oldFirsts[i]
+            if abs(offset[0]) <= tolerance and abs(offset[1]) <= tolerance:
+                diff["unchanged"] += 1 # Rounded to neighboring grid points
+            else:
+                diff["moved"].append((oldIds[i], newIds[j], offset.tolist()))
+            matched.update([(0, i), (1, j)])
+        oldLeft = [i for i in oldLeft if (0, i) not in matched]
+        newLeft = [j for j in newLeft if (1, j) not in matched]
+    # Changed: shapes left over whose boxes overlap, most overlap first
+    if oldLeft and newLeft:
+        shapes = [oldShapes[i] for i in oldLeft] + [newShapes[j] for j in newLeft]
+        boxes = np.array([list(points.min(axis = 0)) + list(points.max(axis = 0)) for points in shapes])
+        groups = np.repeat([0, 1], [len(oldLeft), len(newLeft)])
+        pairs = candidatePairs(boxes, cellSizeFor(boxes, tolerance), groups)
+        p, q = boxes[pairs[:,0]], boxes[pairs[:,1]]
+        overlap = (np.minimum(p[:,2], q[:,2]) - np.maximum(p[:,0], q[:,0])) \
+            *(np.minimum(p[:,3], q[:,3]) - np.maximum(p[:,1], q[:,1]))
+        a = [oldLeft[k] for k in pairs[:,0].tolist()]
+        b = [newLeft[k - len(oldLeft)] for k in pairs[:,1].tolist()]
+        for i, j in greedyPairs(a, b, np.argsort(-overlap, kind = "stable")):
+            diff["changed"].append((oldIds[i], newIds[j]))
+            matched.update([(0, i), (1, j)])
+        oldLeft = [i for i in oldLeft if (0, i) not in matched]
+        newLeft = [j for j in newLeft if (1, j) not in matched]
+    diff["removed"] = [oldIds[i] for i in oldLeft]
+    diff["added"] = [newIds[j] for j in newLeft]
+    return diff
+
+def diffLayouts(old, new, tolerance = 1e-3, maxMove = 1000.0, flatten = 0.5):
+    """ Per layer diff of two layouts (file names, newScripts or
+        LayoutGeometry): {layer: {"unchanged": count, "added": [shape],
+        "removed": [shape], "moved": [(old, new, [dx, dy])], "changed":
+        [(old, new)]}}. Vertices closer than tolerance are the same, shapes
+        are looked for up to maxMove away, arcs and circles are broken into
+        chords within flatten."""
+    old, new = asGeometry(old), asGeometry(new)
+    diff = {}
+    for name in old.layerNames() + [name for name in new.layerNames() if name not in old.layerIndex]:
+        oldIds, oldShapes = layerShapes(old.layer(name), flatten) if name in old.layerIndex else ([], [])
+        newIds, newShapes = layerShapes(new.layer(name), flatten) if name in new.layerIndex else ([], [])
+        if oldShapes or newShapes:
+            diff[name] = diffLayer(oldIds, oldShapes, newIds, newShapes, tolerance, maxMove)
+    return diff
+
+def diffSummary(diff, nShown = 5):
+    """ Text report of a diffLayouts result, nShown shapes of each kind"""
+    lines = []
+    for name, layerDiff in diff.items():
+        lines.append("%s: %d unchanged, %d moved, %d changed, %d added, %d removed" % (name, \
+            layerDiff["unchanged"], len(layerDiff["moved"]), len(layerDiff["changed"]), \
+            len(layerDiff["added"]), len(layerDiff["removed"])))
+        for old, new, (dx, dy) in layerDiff["moved"][:nShown]:
+            lines.append("    moved   %s %s -> %s %s by (%.4f, %.4f)" % (old[1], old[2], new[1], new[2], dx, dy))
+        for old, new in layerDiff["changed"][:nShown]:
+            lines.append("    changed %s %s -> %s %s" % (old[1], old[2], new[1], new[2]))
+        for kind in ["added", "removed"]:
+            for shape in layerDiff[kind][:nShown]:
+                lines.append("    %-7s %s %s" % (kind, shape[1], shape[2]))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # python LayoutDiff.py old.scr new.scr
+    import sys
+    print(diffSummary(diffLayouts(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,493 @@
+""" Layout Geometry
+In-memory model of the shapes drawn through newScript. Every layer keeps its
+shapes in contiguous NumPy buffers:
+    polygons - closed polylines. All vertices of a layer sit in one (n,2)
+               buffer and polygon i spans offsets[i]:offsets[i+1]
+    arcs     - annular sectors, which is what one gap of a bent CPW is.
+               Rows are (cx, cy, r1, r2, angleStart, angleEnd), swept
+               counterclockwise from angleStart to angleEnd
+    circles  - rows of (cx, cy, r, nx, ny, dx, dy): an array of nx columns
+               dx apart and ny rows dy apart (1, 1 for a single circle)
+A global record table keeps the order in which layers and shapes were made so
+a writer can replay the whole design in a single pass.
+
+Repeated pieces can be drawn once into a Cell and placed many times. The
+placements are rows of (cell, x, y, angle, nx, ny, dx, dy) in the instance
+table: the cell is rotated by angle, moved to x, y and, like a circle, arrayed
+along the drawing axes. Writers that know about blocks or structures keep the
+cells, the rest work on flattened().
+"""
+from math import pi, cos, sin
+import numpy as np
+
+# Record kinds
+LAYER_MAKE, LAYER_SET, POLYGON, RECT, ARC, CIRCLE, JOIN, INSERT = range(8)
+
+def arcSegments(radius, sweep, tolerance):
+    """ Number of chords needed so an arc of radius and sweep (radians) strays
+        no more than tolerance from the true arc"""
+    radius = abs(radius)
+    if radius <= tolerance:
+        return max(1, int(np.ceil(abs(sweep)/(pi/2))))
+    return max(1, int(np.ceil(abs(sweep)/(2*np.arccos(1 - tolerance/radius)))))
+
+def sectorPolygon(arc, tolerance):
+    """ Vertex array of an annular sector (cx, cy, r1, r2, angleStart, angleEnd)
+        with both arcs broken into chords, counterclockwise"""
+    cx, cy, r1, r2, angleStart, angleEnd = arc
+    rInner, rOuter = min(abs(r1), abs(r2)), max(abs(r1), abs(r2))
+    angles = np.linspace(angleStart, angleEnd, \
+        arcSegments(rOuter, angleEnd - angleStart, tolerance) + 1)
+    outer = np.column_stack([cx + rOuter*np.cos(angles), cy + rOuter*np.sin(angles)])
+    if rInner == 0:
+        return np.vstack([outer, [[cx, cy]]])
+    angles = np.linspace(angleEnd, angleStart, \
+        arcSegments(rInner, angleEnd - angleStart, tolerance) + 1)
+    inner = np.column_stack([cx + rInner*np.cos(angles), cy + rInner*np.sin(angles)])
+    return np.vstack([outer, inner])
+
+def circlePolygon(cx, cy, r, tolerance):
+    """ Vertex array of a circle broken into chords, counterclockwise"""
+    angles = np.linspace(0, 2*pi, max(arcSegments(r, 2*pi, tolerance), 3), endpoint = False)
+    return np.column_stack([cx + r*np.cos(angles), cy + r*np.sin(angles)])
+
+class GrowableArray:
+    """ Contiguous array of fixed width rows. Appends go to a plain list first
+        and are copied into the (amortized doubling) NumPy buffer in one block
+        the next time the array is read."""
+    def __init__(self, width = None, dtype = np.float64, capacity = 64):
+        self.width = width
+        shape = (capacity,) if width is None else (capacity, width)
+        self.data = np.empty(shape, dtype)
+        self.size = 0
+        self.pending = []
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def reserve(self, n):
+        """ Makes sure there is room for n more rows"""
+        if self.size + n > len(self.data):
+            capacity = max(2*len(self.data), self.size + n)
+            shape = (capacity,) if self.width is None else (capacity, self.width)
+            data = np.empty(shape, self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def append(self, row):
+        self.pending.append(row)
+        return self.size + len(self.pending) - 1
+
+    def extend(self, rows):
+        """ Adds a block of rows, a NumPy array goes straight into the buffer"""
+        if isinstance(rows, np.ndarray):
+            self.view()
+            n = len(rows)
+            self.reserve(n)
+            self.data[self.size:self.size + n] = rows
+            self.size += n
+            return self.size - n
+        self.pending.extend(rows)
+        return len(self) - len(rows)
+
+    def view(self):
+        """ Array of all the rows so far (no copy)"""
+        if self.pending:
+            n = len(self.pending)
+            self.reserve(n)
+            self.data[self.size:self.size + n] = self.pending
+            self.size += n
+            self.pending = []
+        return self.data[:self.size]
+
+class LayerGeometry:
+    """ All the shapes on a single layer. Polygons are handed over in local
+        coordinates with the rotation and origin they are placed with, the
+        transforms of everything added since the last read are then applied
+        to all vertices at once."""
+    def __init__(self, name, color = [255,255,255]):
+        self.name = name
+        self.color = list(color)
+        self.placedVertices = GrowableArray(2)
+        self.offsets = GrowableArray(dtype = np.int64)
+        self.offsets.append(0)
+        self.vertexCount = 0
+        self.localPoints = [] # Vertices waiting for their transform
+        self.transforms = [] # (theta, x, y, number of vertices) per polygon
+        self.arcs = GrowableArray(6)
+        self.circles = GrowableArray(7)
+
+    @property
+    def vertices(self):
+        """ GrowableArray of all polygon vertices in drawing coordinates"""
+        if self.transforms:
+            self.applyTransforms()
+        return self.placedVertices
+
+    def applyTransforms(self):
+        """ Rotates and moves all waiting vertices in one vectorized step"""
+        points = np.array(self.localPoints, np.float64).reshape(-1, 2)
+        transforms = np.array(self.transforms, np.float64)
+        counts = transforms[:,3].astype(np.int64)
+        c = np.repeat(np.cos(transforms[:,0]), counts)
+        s = np.repeat(np.sin(transforms[:,0]), counts)
+        placed = np.empty_like(points)
+        placed[:,0] = c*points[:,0] - s*points[:,1] + np.repeat(transforms[:,1], counts)
+        placed[:,1] = s*points[:,0] + c*points[:,1] + np.repeat(transforms[:,2], counts)
+        self.placedVertices.extend(placed)
+        self.localPoints = []
+        self.transforms = []
+
+    def nPolygons(self):
+        return len(self.offsets) - 1
+
+    def nVertices(self):
+        return self.vertexCount
+
+    def polygon(self, i):
+        """ Vertex array of polygon i"""
+        vertices = self.vertices.view()
+        offsets = self.offsets.view()
+        return vertices[offsets[i]:offsets[i + 1]]
+
+    def polygons(self):
+        """ Iterates over the vertex arrays of all polygons"""
+        vertices = self.vertices.view()
+        offsets = self.offsets.view().tolist()
+        for i in range(len(offsets) - 1):
+            yield vertices[offsets[i]:offsets[i + 1]]
+
+    def addPolygon(self, points, theta = 0.0, origin = [0,0]):
+        """ Adds the polygon with local vertices points, rotated by theta
+            and moved onto origin"""
+        n = len(points)
+        self.localPoints.extend(points)
+        self.transforms.append((theta, origin[0], origin[1], n))
+        self.vertexCount += n
+        return self.offsets.append(self.vertexCount) - 1
+
+    def addPlacedPolygons(self, vertices, counts):
+        """ Adds polygons whose vertices are already in drawing coordinates,
+            counts[i] vertices each. Returns the index of the first."""
+        first = self.nPolygons()
+        if len(counts):
+            self.vertices.extend(np.asarray(vertices, np.float64).reshape(-1, 2))
+            ends = self.vertexCount + np.cumsum(counts)
+            self.offsets.extend(ends)
+            self.vertexCount = int(ends[-1])
+        return first
+
+    def addArc(self, center, r1, r2, angleStart, angleEnd):
+        return self.arcs.append([center[0], center[1], r1, r2, angleStart, angleEnd])
+
+    def addCircle(self, center, r, space = [0,0], nRepeat = [1,1]):
+        """ Adds a circle, or an array of nRepeat = [rows, columns] circles
+            space = [row distance, column distance] apart like addCircleArray"""
+        return self.circles.append([center[0], center[1], r, \
+            nRepeat[1], nRepeat[0], space[1], space[0]])
+
+    def arcEndPoints(self, first = 0, last = None):
+        """ (n,8) array with the start and end points at r1 followed by the
+            start and end points at r2 for arcs first onwards (up to last)"""
+        a = self.arcs.view()[first:last]
+        cosStart, sinStart = np.cos(a[:,4]), np.sin(a[:,4])
+        cosEnd, sinEnd = np.cos(a[:,5]), np.sin(a[:,5])
+        points = np.empty((len(a), 8))
+        for j, r in enumerate([a[:,2], a[:,3]]):
+            points[:,4*j] = a[:,0] + r*cosStart
+            points[:,4*j + 1] = a[:,1] + r*sinStart
+            points[:,4*j + 2] = a[:,0] + r*cosEnd
+            points[:,4*j + 3] = a[:,1] + r*sinEnd
+        return points
+
+    def arcMidPoints(self, first = 0, last = None):
+        """ (n,4) array with the middle points of the arcs at r1 and at r2
+            for arcs first onwards (up to last)"""
+        a = self.arcs.view()[first:last]
+        middle = (a[:,4] + a[:,5])/2
+        cosMiddle, sinMiddle = np.cos(middle), np.sin(middle)
+        return np.column_stack([a[:,0] + a[:,2]*cosMiddle, a[:,1] + a[:,2]*sinMiddle, \
+            a[:,0] + a[:,3]*cosMiddle, a[:,1] + a[:,3]*sinMiddle])
+
+    def flatPolygons(self, tolerance):
+        """ Iterates over every shape on the layer as a plain vertex array:
+            polygons as they are, arcs and circles (each circle of an array)
+            broken into chords within tolerance"""
+        for points in self.polygons():
+            yield points
+        for arc in self.arcs.view().tolist():
+            yield sectorPolygon(arc, tolerance)
+        for cx, cy, r, nx, ny, dx, dy in self.circles.view().tolist():
+            circle = circlePolygon(0, 0, r, tolerance)
+            for i in range(int(nx)):
+                for j in range(int(ny)):
+                    yield circle + [cx + i*dx, cy + j*dy]
+
+    def bbox(self):
+        """ [xmin, ymin, xmax, ymax] of everything on the layer, None if empty"""
+        boxes = []
+        if len(self.vertices):
+            v = self.vertices.view()
+            boxes.append([v[:,0].min(), v[:,1].min(), v[:,0].max(), v[:,1].max()])
+        if len(self.arcs):
+            # Conservative: the full circle of the larger radius
+            a = self.arcs.view()
+            r = np.maximum(np.abs(a[:,2]), np.abs(a[:,3]))
+            boxes.append([(a[:,0] - r).min(), (a[:,1] - r).min(), \
+                (a[:,0] + r).max(), (a[:,1] + r).max()])
+        if len(self.circles):
+            c = self.circles.view()
+            xFar = c[:,0] + (c[:,3] - 1)*c[:,5]
+            yFar = c[:,1] + (c[:,4] - 1)*c[:,6]
+            boxes.append([(np.minimum(c[:,0], xFar) - c[:,2]).min(), \
+                (np.minimum(c[:,1], yFar) - c[:,2]).min(), \
+                (np.maximum(c[:,0], xFar) + c[:,2]).max(), \
+                (np.maximum(c[:,1], yFar) + c[:,2]).max()])
+        if not boxes:
+            return None
+        boxes = np.array(boxes)
+        return [boxes[:,0].min(), boxes[:,1].min(), boxes[:,2].max(), boxes[:,3].max()]
+
+class Cell:
+    """ A piece of geometry drawn once and placed many times. end and
+        endAngleRad are where a trace drawn into the cell finished, so a
+        placed cell can be continued like any other CPW piece."""
+    def __init__(self, name, geometry, end = [0.0,0.0], endAngleRad = 0.0):
+        self.name = name
+        self.geometry = geometry
+        self.end = list(end)
+        self.endAngleRad = endAngleRad
+
+class LayoutGeometry:
+    """ Per layer geometry of a whole design plus the order it was drawn in.
+        Cell geometries share the cell list of the design they belong to."""
+    def __init__(self, cells = None):
+        self.layers = [] # LayerGeometry, in creation order
+        self.layerIndex = {} # name -> position in self.layers
+        self.current = None # Position of the current layer
+        # One row (kind, layer, index) per layer change or shape
+        self.records = GrowableArray(3, np.int64)
+        self.cells = [] if cells is None else cells
+        self.instances = GrowableArray(8)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _getLayer(self, name, color = [255,255,255]):
+        if name not in self.layerIndex:
+            self.layerIndex[name] = len(self.layers)
+            self.layers.append(LayerGeometry(name, color))
+        return self.layerIndex[name]
+
+    def _currentLayer(self):
+        # AutoCAD draws on layer "0" until told otherwise
+        if self.current is None:
+            self.current = self._getLayer("0")
+        return self.current
+
+    def layer(self, name):
+        """ LayerGeometry for the named layer"""
+        return self.layers[self.layerIndex[name]]
+
+    def layerNames(self):
+        return [layer.name for layer in self.layers]
+
+    def currentLayerName(self):
+        return self.layers[self._currentLayer()].name
+
+    def addLayer(self, name, color = [255,255,255]):
+        """ Makes (or recolors) a layer and sets it current"""
+        i = self._getLayer(name, color)
+        self.layers[i].color = list(color)
+        self.current = i
+        self.records.append([LAYER_MAKE, i, -1])
+
+    def setLayer(self, name):
+        i = self._getLayer(name)
+        self.current = i
+        self.records.append([LAYER_SET, i, -1])
+
+    def useLayer(self, name, color = [255,255,255]):
+        """ Draws on an existing layer from here on, without recording a
+            layer change (what a new cell starts out with)"""
+        self.current = self._getLayer(name, color)
+
+    def addPolygon(self, points, theta = 0.0, origin = [0,0], rect = False):
+        """ Adds a closed polygon on the current layer, see
+            LayerGeometry.addPolygon. rect marks the 4 corner polygons made by
+            addRect so they can be written back as rectangles"""
+        i = self._currentLayer()
+        index = self.layers[i].addPolygon(points, theta, origin)
+        self.records.append([RECT if rect else POLYGON, i, index])
+        return index
+
+    def addArc(self, center, r1, r2, angleStart, angleEnd):
+        """ Adds the annular sector between radii r1 and r2 swept
+            counterclockwise from angleStart to angleEnd"""
+        i = self._currentLayer()
+        index = self.layers[i].addArc(center, r1, r2, angleStart, angleEnd)
+        self.records.append([ARC, i, index])
+        return index
+
+    def addCircle(self, center, r, space = [0,0], nRepeat = [1,1]):
+        i = self._currentLayer()
+        index = self.layers[i].addCircle(center, r, space, nRepeat)
+        self.records.append([CIRCLE, i, index])
+        return index
+
+    def addJoin(self):
+        """ Marks the point where AutoCAD should join the loose arcs and lines"""
+        self.records.append([JOIN, -1, -1])
+
+    def addCell(self, cell):
+        """ Adds a cell definition, returns its index. The layers it draws on
+            are made known here too so writers can list them."""
+        for layer in cell.geometry.layers:
+            self._getLayer(layer.name, layer.color)
+        self.cells.append(cell)
+        return len(self.cells) - 1
+
+    def addInstance(self, cellIndex, origin, angle = 0.0, space = [0,0], nRepeat = [1,1]):
+        """ Places cell cellIndex rotated by angle at origin, optionally as an
+            array of nRepeat = [rows, columns] space = [row distance, column
+            distance] apart like addCircleArray"""
+        cell = self.cells[cellIndex]
+        for layer in cell.geometry.layers:
+            self._getLayer(layer.name, layer.color)
+        index = self.instances.append([cellIndex, origin[0], origin[1], angle, \
+            nRepeat[1], nRepeat[0], space[1], space[0]])
+        self.records.append([INSERT, self._currentLayer(), index])
+        return index
+
+    def placements(self, instance):
+        """ (x, y, angle) of every copy made by an instance row"""
+        cellIndex, x, y, angle, nx, ny, dx, dy = instance
+        return [(x + i*dx, y + j*dy, angle) for j in range(int(ny)) for i in range(int(nx))]
+
+    def appendTransformed(self, geometry, theta, origin):
+        """ Appends every shape of geometry rotated by theta and moved to
+            origin, cells included, onto the layers of the same name"""
+        c, s = cos(theta), sin(theta)
+        ox, oy = origin
+        for kind, layerIndex, index in geometry.records.view().tolist():
+            if kind == INSERT:
+                instance = geometry.instances.view()[index].tolist()
+                cell = geometry.cells[int(instance[0])]
+                for x, y, angle in geometry.placements(instance):
+                    self.appendTransformed(cell.geometry, theta + angle, \
+                        [ox + c*x - s*y, oy + s*x + c*y])
+                continue
+            if kind not in (POLYGON, RECT, ARC, CIRCLE):
+                continue
+            source = geometry.layers[layerIndex]
+            target = self._getLayer(source.name, source.color)
+            layer = self.layers[target]
+            if kind == POLYGON or kind == RECT:
+                # Rectangles stop being axis aligned once rotated
+                new = layer.addPolygon(source.polygon(index), theta, origin)
+                kind = POLYGON if theta != 0 else kind
+            elif kind == ARC:
+                cx, cy, r1, r2, angleStart, angleEnd = source.arcs.view()[index].tolist()
+                new = layer.addArc([ox + c*cx - s*cy, oy + s*cx + c*cy], r1, r2, \
+                    angleStart + theta, angleEnd + theta)
+            elif kind == CIRCLE:
+                cx, cy, r, nx, ny, dx, dy = source.circles.view()[index].tolist()
+                if theta == 0:
+                    new = layer.addCircle([ox + cx, oy + cy], r, [dy, dx], [ny, nx])
+                else:
+                    # A rotated array is no longer along the drawing axes
+                    for j in range(int(ny)):
+                        for i in range(int(nx)):
+                            x, y = cx + i*dx, cy + j*dy
+                            new = layer.addCircle([ox + c*x - s*y, oy + s*x + c*y], r)
+                            self.records.append([CIRCLE, target, new])
+                    continue
+            self.records.append([kind, target, new])
+
+    def flattened(self):
+        """ Copy of the geometry with every cell placement expanded into
+            plain shapes, for writers and checks that know nothing of cells"""
+        flat = LayoutGeometry()
+        for layer in self.layers:
+            flat._getLayer(layer.name, layer.color)
+        flat.appendTransformed(self, 0.0, [0.0, 0.0])
+        return flat
+
+    def fragment(self, first):
+        """ Everything drawn from record first on as a dict of arrays, with
+            vertices in drawing coordinates so it can be added to another
+            design with addFragment(). None if cells were placed."""
+        records = self.records.view()[first:]
+        kinds = records[:,0]
+        if (kinds == INSERT).any():
+            return None
+        layerIds = sorted(set(records[:,1].tolist()) - set([-1]))
+        layerMap = np.full(len(self.layers) + 1, -1, np.int64)
+        layerMap[layerIds] = np.arange(len(layerIds))
+        polygons = [self.layers[l].polygon(i) for k, l, i in records.tolist() if k == POLYGON or k == RECT]
+        fragment = {"records": np.column_stack([kinds, layerMap[records[:,1]]]), \
+            "layerNames": np.array([self.layers[l].name for l in layerIds], dtype = str), \
+            "colors": np.array([self.layers[l].color for l in layerIds], np.int64).reshape(-1, 3), \
+            "vertices": np.vstack(polygons) if polygons else np.empty((0, 2)), \
+            "counts": np.array([len(p) for p in polygons], np.int64)}
+        for kind, name in [(ARC, "arcs"), (CIRCLE, "circles")]:
+            rows = [getattr(self.layers[l], name).view()[i] for k, l, i in records.tolist() if k == kind]
+            fragment[name] = np.array(rows).reshape(-1, 6 if kind == ARC else 7)
+        return fragment
+
+    def addFragment(self, fragment):
+        """ Adds geometry saved by fragment(), in one block per layer"""
+        records = fragment["records"]
+        kinds = records[:,0]
+        layerMap = np.array([self._getLayer(name, color) for name, color in \
+            zip(fragment["layerNames"].tolist(), fragment["colors"].tolist())] + [-1], np.int64)
+        rows = np.column_stack([kinds, layerMap[records[:,1]], np.full(len(records), -1, np.int64)])
+        isPolygon = (kinds == POLYGON) | (kinds == RECT)
+        polygonLayers = records[isPolygon, 1]
+        starts = np.concatenate([[0], np.cumsum(fragment["counts"])])
+        for j in range(len(layerMap) - 1):
+            layer = self.layers[layerMap[j]]
+            which = np.nonzero(polygonLayers == j)[0]
+            if len(which):
+                if len(which) == len(polygonLayers):
+                    vertices = fragment["vertices"]
+                else:
+                    vertices = np.vstack([fragment["vertices"][starts[p]:starts[p + 1]] for p in which])
+                first = layer.addPlacedPolygons(vertices, fragment["counts"][which])
+                rows[np.nonzero(isPolygon & (records[:,1] == j))[0], 2] = first + np.arange(len(which))
+            for kind, name in [(ARC, "arcs"), (CIRCLE, "circles")]:
+                mask = kinds == kind
+                which = np.nonzero(records[mask, 1] == j)[0]
+                if len(which):
+                    first = getattr(layer, name).extend(fragment[name][which])
+                    rows[np.nonzero(mask & (records[:,1] == j))[0], 2] = first + np.arange(len(which))
+        # Layer changes made inside the fragment
+        for k, l in records[(kinds == LAYER_MAKE) | (kinds == LAYER_SET)].tolist():
+            if k == LAYER_MAKE:
+                self.layers[layerMap[l]].color = fragment["colors"][l].tolist()
+            self.current = int(layerMap[l])
+        self.records.extend(rows)
+
+    def nPolygons(self):
+        return sum(layer.nPolygons() for layer in self.layers)
+
+    def nVertices(self):
+        return sum(layer.nVertices() for layer in self.layers)
+
+    def bbox(self):
+        """ [xmin, ymin, xmax, ymax] of the whole design, None if empty"""
+        boxes = [b for b in (layer.bbox() for layer in self.layers) if b is not None]
+        for instance in self.instances.view().tolist():
+            box = self.cells[int(instance[0])].geometry.bbox()
+            if box is None:
+                continue
+            corners = np.array([[box[0], box[1]], [box[2], box[1]], \
+                [box[2], box[3]], [box[0], box[3]]])
+            for x, y, angle in self.placements(instance):
+                c, s = cos(angle), sin(angle)
+                placed = np.dot(corners, [[c, s], [-s, c]]) + [x, y]
+                boxes.append(list(placed.min(axis = 0)) + list(placed.max(axis = 0)))
+        if not boxes:
+            return None
+        boxes = np.array(boxes)
+        return [boxes[:,0].min(), boxes[:,1].min(), boxes[:,2].max(), boxes[:,3].max()]
@@ -0,0 +1,601 @@
+""" Layout Reader
+Reads the scripts newScript writes (.scr) and DXF files back into a
+LayoutGeometry, so old designs can be checked, compared and written out again
+without AutoCAD:
+    a = readLayout("ReadoutSimple.scr")
+    checkDesign(a, 2.0)
+    writeGDS(a, "ReadoutSimple.gds")
+
+Script commands understood: -LAYER (MAKE, SET, COLOR), PLINE (with the A/S/L
+arc segments of closed bends), RECTANGLE, CIRCLE, ARC with LINE (the two arcs
+of a bend become one sector, as drawn), PEDIT joins, ARRAY of the last object,
+and cells made with -BLOCK and placed with -INSERT. Everything else (DXFOUT,
+ZOOM, LISP) is skipped. DXF files give their LAYER table, LWPOLYLINE (bulges
+included), POLYLINE, CIRCLE, ARC, INSERT/MINSERT and BLOCKs.
+
+Polylines that are two arcs joined by two lines become sectors again, other
+arcs in a polyline are broken into chords within tolerance.
+
+Files are memory mapped and read a chunk at a time, so only the geometry is
+ever held in memory, not the text. Lines inside merge conflict markers are
+kept from one side only: conflict = "theirs" (the default, the side after
+=======), "ours" (the side after <<<<<<<).
+"""
+from math import *
+import mmap
+import os
+import re
+import numpy as np
+from LayoutGeometry import LayoutGeometry, Cell, arcSegments, RECT
+from DXFWriter import aciPalette
+
+# A line starting a merge conflict
+markers = re.compile(rb"^<<<<<<<", re.MULTILINE)
+
+def fileLines(filename, conflict = "theirs", chunkSize = 1 << 20, stats = None):
+    """ Yields the lines of a file without line endings, reading through a
+        memory map chunkSize bytes at a time. Of each merge conflict only
+        the conflict side is kept; stats["conflicts"] counts them."""
+    if stats is None:
+        stats = {}
+    stats["conflicts"] = 0
+    with open(filename, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            side = None # Which side of a conflict we are on, None outside
+            start = 0
+            while start < len(data):
+                # Chunks end on a line break
+                end = data.find(b"\n", min(start + chunkSize, len(data)) - 1)
+                end = len(data) if end < 0 else end + 1
+                lines = data[start:end].decode("utf-8", "replace").splitlines()
+                if side is None and not markers.search(data, start, end):
+                    yield from lines # The usual case, no conflict in this chunk
+                    start = end
+                    continue
+                for line in lines:
+                    if line.startswith("<<<<<<<"):
+                        side = "ours"
+                        stats["conflicts"] += 1
+                    elif side is not None and line.startswith("|||||||"):
+                        side = "base"
+                    elif side is not None and line.rstrip() == "=======":
+                        side = "theirs"
+                    elif side is not None and line.startswith(">>>>>>>"):
+                        side = None
+                    elif side is None or side == conflict:
+                        yield line
+                start = end
+        finally:
+            data.close()
+
+def parsePoint(text):
+    x, y = text.split(",")[:2]
+    return [float(x), float(y)]
+
+def circleThrough(p, q, r):
+    """ Center of the circle through three points"""
+    ax, ay = q[0] - p[0], q[1] - p[1]
+    bx, by = r[0] - p[0], r[1] - p[1]
+    d = 2*(ax*by - ay*bx)
+    a2, b2 = ax*ax + ay*ay, bx*bx + by*by
+    return [p[0] + (by*a2 - ay*b2)/d, p[1] + (ax*b2 - bx*a2)/d]
+
+def bulgeCenter(p, q, bulge):
+    """ Center of the arc from p to q with a DXF bulge (tan of a quarter of
+        the included angle, positive counterclockwise)"""
+    dx, dy = q[0] - p[0], q[1] - p[1]
+    # Distance from the chord middle to the center, to the left of p->q
+    offset = (1 - bulge*bulge)/(4*bulge)
+    return [(p[0] + q[0])/2 - offset*dy, (p[1] + q[1])/2 + offset*dx]
+
+def arcPoints(center, start, sweep, tolerance):
+    """ Points after start along the arc about center sweeping sweep radians,
+        within tolerance of it, ending on the arc's end point"""
+    r = hypot(start[0] - center[0], start[1] - center[1])
+    a = atan2(start[1] - center[1], start[0] - center[0])
+    n = arcSegments(r, sweep, tolerance)
+    return [[center[0] + r*cos(a + sweep*k/n), center[1] + r*sin(a + sweep*k/n)] for k in range(1, n + 1)]
+
+def sectorOf(arcs, nPoints, tolerance = 0.0):
+    """ (center, r1, r2, angleStart, angleEnd) if a closed polyline of
+        nPoints vertices is two arcs about one center joined by two lines,
+        else None. arcs are (center, start, sweep) with sweep in radians.
+        The second arc may stray up to tolerance from the circle about the
+        first one's center, and cover the same angle to within tolerance
+        along it (snapping points to a grid moves the center of a three
+        point arc, by more than the points move on a short arc)."""
+    if nPoints != 4 or len(arcs) != 2:
+        return None
+    (c1, p1, sweep1), (c2, p2, sweep2) = arcs
+    scale = max(1.0, abs(c1[0]), abs(c1[1]))
+    # Start, middle and end of the second arc, seen from the first center
+    a2 = atan2(p2[1] - c2[1], p2[0] - c2[0])
+    rc2 = hypot(p2[0] - c2[0], p2[1] - c2[1])
+    ends = [[c2[0] + rc2*cos(a2 + sweep2*k/2.0), c2[1] + rc2*sin(a2 + sweep2*k/2.0)] for k in range(3)]
+    radii = [hypot(x - c1[0], y - c1[1]) for x, y in ends]
+    r = max(1e-12, min([hypot(p1[0] - c1[0], p1[1] - c1[1])] + radii))
+    angles = [atan2(y - c1[1], x - c1[0]) for x, y in ends]
+    sweepAbout1 = sweep2 + ((angles[2] - angles[0] - sweep2 + pi) % (2*pi) - pi)
+    if max(radii) - min(radii) > max(1e-6*scale, tolerance) \
+            or abs(abs(sweep1) - abs(sweepAbout1)) > max(1e-6, tolerance/r):
+        return None
+    angles = []
+    for center, start, sweep in arcs:
+        a = atan2(start[1] - center[1], start[0] - center[0])
+        # Always counterclockwise from angleStart
+        angles.append(a if sweep > 0 else a + sweep)
+    r1 = hypot(p1[0] - c1[0], p1[1] - c1[1])
+    r2 = hypot(p2[0] - c1[0], p2[1] - c1[1])
+    return c1, r1, r2, angles[0], angles[0] + abs(sweep1)
+
+class ScriptReader:
+    """ Replays an AutoCAD script into a LayoutGeometry, see readScript"""
+    def __init__(self, lines, tolerance = 0.1):
+        self.lines = iter(lines)
+        self.tolerance = tolerance
+        self.geometry = LayoutGeometry()
+        self.top = self.geometry # The design, geometry is a cell while one is drawn
+        self.cellNames = {} # Block name -> cell index
+        self.pendingArcs = [] # Arcs waiting for the other arc of their bend
+        self.last = None # (kind, geometry, index) of the last object, for ARRAY
+        self.skipped = {} # Command -> times it was not understood
+        self.lastPoint = [0.0, 0.0] # What "@dx,dy" points are relative to
+
+    def next(self):
+        line = next(self.lines, None)
+        return None if line is None else line.strip()
+
+    def read(self):
+        handlers = {"-LAYER": self.layerCommand, "PLINE": self.plineCommand, \
+            "RECTANGLE": self.rectangleCommand, "RECTANG": self.rectangleCommand, \
+            "CIRCLE": self.circleCommand, "ARC": self.arcCommand, "LINE": self.lineCommand, \
+            "PEDIT": self.peditCommand, "ARRAY": self.arrayCommand, "-ARRAY": self.arrayCommand, \
+            "-INSERT": self.insertCommand, "-BLOCK": self.blockCommand, \
+            "DXFOUT": self.skipLines(3), "ZOOM": self.skipLines(1)}
+        while True:
+            line = self.next()
+            if line is None:
+                break
+            if not line:
+                continue # Repeats the last command in AutoCAD, nothing here
+            if line.startswith("("):
+                if line.startswith("(setq asMark"):
+                    # A cell follows, drawn on the current layer from the origin
+                    cell = LayoutGeometry(self.top.cells)
+                    layer = self.top.layers[self.top._currentLayer()]
+                    cell.useLayer(layer.name, layer.color)
+                    self.geometry = cell
+                continue
+            handler = handlers.get(line.upper())
+            if handler is None:
+                self.skipped[line] = self.skipped.get(line, 0) + 1
+            else:
+                handler()
+        self.flushArcs()
+        return self.top
+
+    def point(self, text):
+        """ A point, "@dx,dy" ones relative to the point before"""
+        if text[:1] == "@":
+            dx, dy = parsePoint(text[1:])
+            point = [self.lastPoint[0] + dx, self.lastPoint[1] + dy]
+        else:
+            point = parsePoint(text)
+        self.lastPoint = point
+        return point
+
+    def skipLines(self, n):
+        def skip():
+            for i in range(n):
+                self.next()
+        return skip
+
+    def layerCommand(self):
+        while True:
+            option = self.next()
+            if not option:
+                break
+            option = option.upper()
+            if option in ["MAKE", "M", "NEW", "N"]:
+                name = self.next()
+                if option in ["MAKE", "M"]:
+                    self.flushArcs()
+                    self.geometry.addLayer(name, self.geometry.layers[self.geometry.layerIndex[name]].color \
+                        if name in self.geometry.layerIndex else [255,255,255])
+            elif option in ["SET", "S"]:
+                self.flushArcs()
+                self.geometry.setLayer(self.next())
+            elif option in ["COLOR", "C"]:
+                value = self.next()
+                if value.upper() in ["TRUECOLOR", "T"]:
+                    color = [int(float(c)) for c in self.next().split(",")]
+                else:
+                    color = list(aciPalette()[int(value) % 256])
+                names = self.next()
+                for name in names.split(",") if names else [self.geometry.currentLayerName()]:
+                    self.geometry.layers[self.geometry._getLayer(name.strip())].color = color
+            else:
+                self.next() # Layer names for ON, OFF, FREEZE and the like
+
+    def plineCommand(self):
+        points = []
+        arcs = [] # (center, start, sweep) of each arc segment
+        arcMode = False
+        while True:
+            token = self.next()
+            if token is None or not token or token.upper() in ["C", "CLOSE"]:
+                break
+            option = token.upper()
+            if option in ["A", "ARC"]:
+                arcMode = True
+            elif option in ["L", "LINE"]:
+                arcMode = False
+            elif arcMode and option in ["S", "SECOND"]:
+                middle, end = self.point(self.next()), self.point(self.next())
+                start = points[-1]
+                center = circleThrough(start, middle, end)
+                # Counterclockwise if the middle is left of start->end
+                left = (end[0] - start[0])*(middle[1] - start[1]) - (end[1] - start[1])*(middle[0] - start[0]) < 0
+                a0 = atan2(start[1] - center[1], start[0] - center[0])
+                a1 = atan2(end[1] - center[1], end[0] - center[0])
+                sweep = (a1 - a0) % (2*pi) if left else -((a0 - a1) % (2*pi))
+                arcs.append((center, start, sweep, len(points)))
+                points.append(end)
+            else:
+                points.append(self.point(token))
+        if len(points) > 1 and points[0] == points[-1] and not (arcs and arcs[-1][3] == len(points) - 1):
+            points.pop() # Closed by returning to the start
+        self.addPolyline(points, arcs)
+
+    def addPolyline(self, points, arcs):
+        """ A closed polyline with arc segments (center, start, sweep, index
+            of the segment's end point) as a sector or a polygon"""
+        sector = sectorOf([arc[:3] for arc in arcs], len(points), self.tolerance)
+        if sector is not None:
+            center, r1, r2, angleStart, angleEnd = sector
+            self.last = (None, None, None)
+            self.geometry.addArc(center, r1, r2, angleStart, angleEnd)
+            return
+        if arcs:
+            # Break the arcs into chords, last first so the indices hold
+            points = list(points)
+            for center, start, sweep, index in reversed(arcs):
+                points[index:index + 1] = arcPoints(center, start, sweep, self.tolerance)
+        if len(points) > 2:
+            self.last = ("polygon", self.geometry, self.geometry.addPolygon(points))
+
+    def rectangleCommand(self):
+        p, q = self.point(self.next()), self.point(self.next())
+        self.last = ("polygon", self.geometry, self.geometry.addPolygon([p, [q[0], p[1]], q, [p[0], q[1]]], \
+            rect = True))
+
+    def circleCommand(self):
+        center = self.point(self.next())
+        r = float(self.next())
+        self.last = ("circle", self.geometry, self.geometry.addCircle(center, r))
+
+    def arcCommand(self):
+        token = self.next()
+        if token.upper() in ["C", "CE", "CENTER"]:
+            center, start, end = self.point(self.next()), self.point(self.next()), self.point(self.next())
+        else: # Start, second point, end
+            start, middle, end = self.point(token), self.point(self.next()), self.point(self.next())
+            center = circleThrough(start, middle, end)
+        a0 = atan2(start[1] - center[1], start[0] - center[0])
+        a1 = atan2(end[1] - center[1], end[0] - center[0])
+        if a1 <= a0:
+            a1 += 2*pi # AutoCAD arcs run counterclockwise
+        r = hypot(start[0] - center[0], start[1] - center[1])
+        for i, (c, rOther, b0, b1) in enumerate(self.pendingArcs):
+            # Same center and start angle, within the grid of scripts written
+            # with a precision
+            if hypot(c[0] - center[0], c[1] - center[1]) < 1e-6*max(1.0, r) \
+                    and min(r, rOther)*abs(b0 - a0) < self.tolerance:
+                # The other arc of a bend
+                del self.pendingArcs[i]
+                self.last = (None, None, None)
+                self.geometry.addArc(c, rOther, r, b0, b1)
+                return
+        self.pendingArcs.append((center, r, a0, a1))
+
+    def flushArcs(self):
+        """ Arcs with no partner are not closed shapes: counted and dropped"""
+        if self.pendingArcs:
+            self.skipped["ARC"] = self.skipped.get("ARC", 0) + len(self.pendingArcs)
+            self.pendingArcs = []
+
+    def lineCommand(self):
+        # The straight sides of bends, the arcs make the sectors
+        while self.next():
+            pass
+
+    def peditCommand(self):
+        for i in range(8):
+            token = self.next()
+            if token is None or token.upper() in ["J", "JOIN"]:
+                break
+        self.flushArcs()
+        self.geometry.addJoin()
+
+    def arrayCommand(self):
+        self.next() # The selection, always LAST
+        token = self.next()
+        while token is not None and (not token or token.upper() in ["R", "RECTANGULAR"]):
+            token = self.next()
+        ny = int(float(token))
+        nx = int(float(self.next()))
+        dx = dy = 0.0
+        if ny > 1 and nx > 1:
+            dy, dx = float(self.next()), float(self.next())
+        elif ny > 1:
+            dy = float(self.next())
+        elif nx > 1:
+            dx = float(self.next())
+        kind, geometry, index = self.last or (None, None, None)
+        if kind == "circle":
+            geometry.layers[geometry.records.view()[-1][1]].circles.view()[index][3:7] = [nx, ny, dx, dy]
+        elif kind == "insert":
+            geometry.instances.view()[index][4:8] = [nx, ny, dx, dy]
+        elif kind == "polygon":
+            layer = geometry.layers[geometry.records.view()[-1][1]]
+            points = layer.polygon(index)
+            rect = geometry.records.view()[-1][0] == RECT
+            for j in range(ny):
+                for i in range(nx):
+                    if i or j:
+                        geometry.addPolygon(points + [i*dx, j*dy], rect = rect)
+        else:
+            self.skipped["ARRAY"] = self.skipped.get("ARRAY", 0) + 1
+
+    def insertCommand(self):
+        name = self.next()
+        origin = self.point(self.next())
+        self.next() # x and y scale
+        self.next()
+        angle = radians(float(self.next()))
+        if name not in self.cellNames:
+            self.skipped["-INSERT " + name] = self.skipped.get("-INSERT " + name, 0) + 1
+            self.last = None
+            return
+        self.last = ("insert", self.geometry, \
+            self.geometry.addInstance(self.cellNames[name], origin, angle))
+
+    def blockCommand(self):
+        name = self.next()
+        self.next() # Base point
+        self.next() # Selection and the blank that ends it
+        self.next()
+        if self.geometry is self.top:
+            self.skipped["-BLOCK"] = self.skipped.get("-BLOCK", 0) + 1
+            return
+        self.flushArcs()
+        self.cellNames[name] = self.top.addCell(Cell(name, self.geometry))
+        self.geometry = self.top
+        self.last = None
+
+def readScript(filename, conflict = "theirs", tolerance = 0.1):
+    """ LayoutGeometry of an AutoCAD script, see the module notes. The
+        reader's notes are left in geometry.readStats: merge conflicts found
+        and the commands skipped."""
+    stats = {}
+    reader = ScriptReader(fileLines(filename, conflict, stats = stats), tolerance)
+    geometry = reader.read()
+    stats["skipped"] = reader.skipped
+    geometry.readStats = stats
+    return geometry
+
+class DXFReader:
+    """ Replays the entities of a DXF file into a LayoutGeometry"""
+    def __init__(self, lines, tolerance = 0.1):
+        self.lines = iter(lines)
+        self.tolerance = tolerance
+        self.geometry = LayoutGeometry()
+        self.top = self.geometry
+        self.cellNames = {}
+        self.arcs = [] # Loose ARC entities, paired up like script arcs
+        self.skipped = {}
+
+    def pairs(self):
+        """ Yields (group code, value) pairs"""
+        for code, value in zip(self.lines, self.lines):
+            yield int(code), value.strip()
+
+    def entities(self):
+        """ Yields (type, [(code, value), ...]) for every entity or table
+            entry, with the section it is in"""
+        kind = None
+        groups = []
+        for code, value in self.pairs():
+            if code == 0:
+                if kind is not None:
+                    yield kind, groups
+                kind = value
+                groups = []
+            else:
+                groups.append((code, value))
+        if kind is not None:
+            yield kind, groups
+
+    def read(self):
+        section = None
+        polyline = None # (groups, vertices) of an old style POLYLINE
+        for kind, groups in self.entities():
+            if kind == "SECTION":
+                section = dict(groups).get(2)
+                continue
+            if kind == "ENDSEC":
+                section = None
+                continue
+            if section == "TABLES" and kind == "LAYER":
+                self.layerEntry(dict(groups))
+            elif section == "BLOCKS" and kind == "BLOCK":
+                name = dict(groups).get(2, "")
+                if not name.startswith("*"):
+                    self.geometry = LayoutGeometry(self.top.cells)
+                    self.blockName = name
+            elif section == "BLOCKS" and kind == "ENDBLK":
+                if self.geometry is not self.top:
+                    self.flushArcs()
+                    self.cellNames[self.blockName] = self.top.addCell(Cell(self.blockName, self.geometry))
+                    self.geometry = self.top
+            elif section in ["ENTITIES", "BLOCKS"]:
+                if polyline is not None:
+                    if kind == "VERTEX":
+                        polyline[1].append(groups)
+                        continue
+                    self.polylineEntity(*polyline)
+                    polyline = None
+                    if kind == "SEQEND":
+                        continue
+                if kind == "POLYLINE":
+                    polyline = (groups, [])
+                else:
+                    self.entity(kind, groups)
+        self.flushArcs()
+        return self.top
+
+    def layerEntry(self, groups):
+        name = groups.get(2)
+        if name is None:
+            return
+        if 420 in groups:
+            color = int(groups[420])
+            color = [(color >> 16) & 255, (color >> 8) & 255, color & 255]
+        else:
+            color = list(aciPalette()[abs(int(groups.get(62, 7))) % 256])
+        self.top.addLayer(name, color)
+
+    def useLayer(self, groups):
+        name = dict(groups).get(8, "0")
+        geometry = self.geometry
+        if geometry.current is None or geometry.layers[geometry.current].name != name:
+            self.flushArcs()
+            if geometry is self.top:
+                geometry.setLayer(name)
+            else:
+                color = self.top.layers[self.top._getLayer(name)].color
+                geometry.useLayer(name, color)
+
+    def entity(self, kind, groups):
+        if kind == "LWPOLYLINE":
+            self.useLayer(groups)
+            points = []
+            bulges = []
+            for code, value in groups:
+                if code == 10:
+                    points.append([float(value), 0.0])
+                    bulges.append(0.0)
+                elif code == 20:
+                    points[-1][1] = float(value)
+                elif code == 42 and points:
+                    bulges[-1] = float(value)
+            self.addPolyline(points, bulges)
+        elif kind == "CIRCLE":
+            self.useLayer(groups)
+            values = dict(groups)
+            self.geometry.addCircle([float(values[10]), float(values[20])], float(values[40]))
+        elif kind == "ARC":
+            self.useLayer(groups)
+            values = dict(groups)
+            center = [float(values[10]), float(values[20])]
+            a0, a1 = radians(float(values[50])), radians(float(values[51]))
+            if a1 <= a0:
+                a1 += 2*pi
+            r = float(values[40])
+            for i, (c, rOther, b0, b1) in enumerate(self.arcs):
+                if hypot(c[0] - center[0], c[1] - center[1]) < 1e-6*max(1.0, r) and abs(b0 - a0) < 1e-6:
+                    del self.arcs[i]
+                    self.geometry.addArc(c, rOther, r, b0, b1)
+                    return
+            self.arcs.append((center, r, a0, a1))
+        elif kind == "INSERT":
+            self.useLayer(groups)
+            values = dict(groups)
+            name = values.get(2)
+            if name not in self.cellNames:
+                self.skipped["INSERT " + str(name)] = self.skipped.get("INSERT " + str(name), 0) + 1
+                return
+            x, y = float(values.get(10, 0)), float(values.get(20, 0))
+            angle = radians(float(values.get(50, 0)))
+            nx, ny = int(values.get(70, 1)), int(values.get(71, 1))
+            dx, dy = float(values.get(44, 0)), float(values.get(45, 0))
+            if angle != 0 and nx*ny > 1:
+                # MINSERT arrays turn with the block, ours run along the axes
+                c, s = cos(angle), sin(angle)
+                for j in range(ny):
+                    for i in range(nx):
+                        self.geometry.addInstance(self.cellNames[name], \
+                            [x + i*dx*c - j*dy*s, y + i*dx*s + j*dy*c], angle)
+            else:
+                self.geometry.addInstance(self.cellNames[name], [x, y], angle, [dy, dx], [ny, nx])
+        elif kind != "LINE": # Lines are the sides of sectors made of ARCs
+            self.skipped[kind] = self.skipped.get(kind, 0) + 1
+
+    def polylineEntity(self, groups, vertices):
+        """ An old style POLYLINE with its VERTEX entities"""
+        self.useLayer(groups)
+        points = []
+        bulges = []
+        for vertex in vertices:
+            values = dict(vertex)
+            points.append([float(values.get(10, 0)), float(values.get(20, 0))])
+            bulges.append(float(values.get(42, 0)))
+        self.addPolyline(points, bulges)
+
+    def addPolyline(self, points, bulges):
+        """ A polyline with bulges as a sector or a polygon"""
+        # PEDIT Join leaves zero length edges where a LINE repeated a point
+        n = len(points)
+        keep = [i for i in range(n) if abs(points[i][0] - points[(i + 1) % n][0]) > 1e-5 \
+            or abs(points[i][1] - points[(i + 1) % n][1]) > 1e-5]
+        points = [points[i] for i in keep]
+        bulges = [bulges[i] for i in keep]
+        arcs = []
+        for i, bulge in enumerate(bulges):
+            if bulge != 0:
+                p, q = points[i], points[(i + 1) % len(points)]
+                arcs.append((bulgeCenter(p, q, bulge), p, 4*atan(bulge), i))
+        sector = sectorOf([arc[:3] for arc in arcs], len(points))
+        if sector is not None:
+            self.geometry.addArc(*sector)
+            return
+        for center, start, sweep, i in reversed(arcs):
+            # Chords after vertex i, its end point is the next vertex already
+            points[i + 1:i + 1] = arcPoints(center, start, sweep, self.tolerance)[:-1]
+        if len(points) > 2:
+            self.geometry.addPolygon(points)
+
+    def flushArcs(self):
+        if self.arcs:
+            self.skipped["ARC"] = self.skipped.get("ARC", 0) + len(self.arcs)
+            self.arcs = []
+
+def readDXF(filename, conflict = "theirs", tolerance = 0.1):
+    """ LayoutGeometry of a DXF file, with readStats like readScript"""
+    stats = {}
+    reader = DXFReader(fileLines(filename, conflict, stats = stats), tolerance)
+    geometry = reader.read()
+    stats["skipped"] = reader.skipped
+    geometry.readStats = stats
+    return geometry
+
+def readLayout(filename, **options):
+    """ readDXF for .dxf files, readScript for anything else"""
+    if filename.lower().endswith(".dxf"):
+        return readDXF(filename, **options)
+    return readScript(filename, **options)
+
+if __name__ == "__main__":
+    import sys
+    import time
+    for filename in sys.argv[1:]:
+        t0 = time.perf_counter()
+        geometry = readLayout(filename)
+        seconds = time.perf_counter() - t0
+        print("%s: %d shapes on %s in %.3f s (%.1f MB/s), %d conflicts, skipped %s" % (filename, \
+            len(geometry.records), ", ".join(geometry.layerNames()), seconds, \
+            os.path.getsize(filename)/seconds/1e6, geometry.readStats["conflicts"], \
+            geometry.readStats["skipped"]))
@@ -0,0 +1,126 @@
+""" Script Profile
+Opt-in counters for a newScript, to see whether a slow chip goes into bend
+geometry, into formatting the script or into the joins AutoCAD has to do:
+    a = AutoScripter.newScript("chip.scr", profile = True)  # Report at close
+    a = AutoScripter.newScript("chip.scr", profile = "chip.json")  # JSON
+    ...
+    a.profile.summary()
+Every public drawing method of newScript is timed (calls, seconds with and
+without the methods it called, shapes it drew) and the script text written is
+counted per layer (shapes, vertices of the shapes as drawn, bytes), along with
+the PEDIT joins and ARRAY commands AutoCAD will have to run. Without a profile
+none of this costs anything.
+"""
+import json
+import time
+import weakref
+from LayoutGeometry import POLYGON, RECT, ARC
+
+# Public newScript methods that write or check what was drawn rather than
+# draw, left untimed so the method times are drawing only
+outputMethods = set(["runScript", "exportDXF", "writeDXF", "writeSonnet", "writeGDS", "writeTiles", \
+    "checkDesign", "flush", "flushText", "profiledCachedText", "layerText", "scriptText", "blockText", \
+    "arrayText", "circleText", "numberText", "close"])
+
+def recordVertices(geometry, kind, layerIndex, index):
+    """ Vertices of the shape of a geometry record: those of a polygon, the
+        4 corners of a rectangle or of a bend sector, none for circles and
+        cell placements (their cell is counted where its block is written)"""
+    if kind == POLYGON:
+        offsets = geometry.layers[layerIndex].offsets.view()
+        return int(offsets[index + 1] - offsets[index])
+    if kind == RECT or kind == ARC:
+        return 4
+    return 0
+
+class ScriptProfile:
+    """ Call and output counters of one newScript"""
+    def __init__(self, script):
+        # Weak, as are the timed methods, so the script still closes when
+        # the last reference to it goes
+        self.script = weakref.ref(script)
+        self.methods = {} # name -> [calls, seconds, self seconds, shapes]
+        self.stack = [] # [start, seconds of calls made, records at start, records of calls made]
+        self.layers = {} # name -> [shapes, vertices, bytes]
+        self.commands = {"PEDIT": 0, "ARRAY": 0}
+        for name in dir(type(script)):
+            if name.startswith("_") or name in outputMethods:
+                continue
+            method = getattr(type(script), name)
+            if callable(method):
+                # The instance attribute wins over the class method, calls
+                # from one method to another included
+                setattr(script, name, self.timed(name, method))
+
+    def timed(self, name, method):
+        """ method (the function of the class) timed as name, for the
+            script only"""
+        stats = self.methods.setdefault(name, [0, 0.0, 0.0, 0])
+        stack = self.stack
+        script = self.script
+        def timedMethod(*args, **kwargs):
+            frame = [time.perf_counter(), 0.0, len(script().geometry.records), 0]
+            stack.append(frame)
+            try:
+                return method(script(), *args, **kwargs)
+            finally:
+                stack.pop()
+                seconds = time.perf_counter() - frame[0]
+                records = len(script().geometry.records) - frame[2]
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] += seconds - frame[1]
+                stats[3] += records - frame[3]
+                if stack:
+                    stack[-1][1] += seconds
+                    stack[-1][3] += records
+        timedMethod.__name__ = name
+        timedMethod.__doc__ = method.__doc__
+        return timedMethod
+
+    def emitted(self, layerName, text, shapes = 1, vertices = 0):
+        """ Counts script text written for shapes with vertices (see
+            recordVertices) on a layer"""
+        stats = self.layers.get(layerName)
+        if stats is None:
+            stats = self.layers[layerName] = [0, 0, 0]
+        stats[0] += shapes
+        stats[1] += vertices
+        stats[2] += len(text)
+
+    def issued(self, command, count = 1):
+        """ Counts whole-drawing commands, PEDIT joins and ARRAYs"""
+        self.commands[command] += count
+
+    def summary(self):
+        """ The counters as a dict, ready for JSON"""
+        return {"methods": dict((name, {"calls": calls, "seconds": seconds, \
+                "selfSeconds": selfSeconds, "shapes": shapes}) \
+                for name, (calls, seconds, selfSeconds, shapes) in sorted(self.methods.items()) if calls), \
+            "layers": dict((name, {"shapes": shapes, "vertices": vertices, "bytes": nBytes}) \
+                for name, (shapes, vertices, nBytes) in sorted(self.layers.items())), \
+            "commands": dict(self.commands)}
+
+    def report(self, nMethods = 15):
+        """ The summary as text, slowest methods (by self time) first"""
+        summary = self.summary()
+        lines = ["%-28s %8s %10s %10s %8s" % ("method", "calls", "seconds", "self", "shapes")]
+        methods = sorted(summary["methods"].items(), key = lambda item: -item[1]["selfSeconds"])
+        for name, stats in methods[:nMethods]:
+            lines.append("%-28s %8d %10.4f %10.4f %8d" % (name, stats["calls"], stats["seconds"], \
+                stats["selfSeconds"], stats["shapes"]))
+        lines.append("%-28s %8s %10s %10s" % ("layer", "shapes", "vertices", "bytes"))
+        for name, stats in summary["layers"].items():
+            lines.append("%-28s %8d %10d %10d" % (name, stats["shapes"], stats["vertices"], stats["bytes"]))
+        lines.append("PEDIT joins %d, ARRAY commands %d" % (summary["commands"]["PEDIT"], \
+            summary["commands"]["ARRAY"]))
+        return "\n".join(lines)
+
+    def dump(self, output):
+        """ Prints the report (output True) or writes the summary as JSON to
+            the file named output"""
+        if output is True:
+            print(self.report())
+        else:
+            with open(output, 'w') as f:
+                json.dump(self.summary(), f, indent = 1)
@@ -0,0 +1,147 @@
+""" Sonnet Writer
+Writes Sonnet project (.son) files straight from a LayoutGeometry, without
+going through AutoCAD and dxfgeo. The GEO block gets the BOX, the dielectric
+layers and one polygon record per shape. Arcs and circles are broken into
+chords within a tolerance, the way dxfgeo does it.
+
+Sonnet measures y downward from the top of the box, so the design is moved
+to the box corner and flipped. LORGN puts the displayed origin back at the
+lower left, so coordinates shown in Sonnet match the design.
+
+The frame layer (a rectangle drawn with addRect) sets the box and is not
+written as metal. Every other layer goes on metallization level 0, or on the
+level given for it in levels (layers missing from levels are left out).
+Placed cells are flattened into plain polygons.
+
+With a precision the vertices are snapped to that grid (e.g. 0.001 um) and
+written with no more decimals than it needs.
+"""
+from math import *
+import time
+import numpy as np
+from GridFormat import GridFormat
+
+class SonnetWriter:
+    """ Writes LayoutGeometry objects to .son files, the same settings for all"""
+    def __init__(self, levels = None, frameLayer = "Frame", cellSize = 1.0, tolerance = 0.1, \
+            dielectrics = [[500.0, 1.0, "Unnamed"], [200.0, 1.0, "Unnamed"]], metal = -1, precision = None):
+        self.levels = levels # Layer name -> metallization level, None: 0 for all
+        self.frameLayer = frameLayer
+        self.cellSize = cellSize # Sonnet cell size in design units (um)
+        self.tolerance = tolerance # Largest chord error for arcs and circles
+        self.dielectrics = dielectrics # [thickness, relative permittivity, name], top first
+        self.metal = metal # Metal type of every polygon, -1 is lossless
+        # Grid the vertices are snapped to, None rounds to 1e-6
+        self.grid = None if precision is None else GridFormat(precision)
+
+    def number(self, x):
+        """ Shortest text for a coordinate, rounded to 1e-6 or on the grid"""
+        if self.grid is not None:
+            return self.grid.number(x)
+        return "%.10g" % (round(x, 6) + 0.0)
+
+    def pointLines(self, points):
+        """ "x y" text of every row of points, on a grid all in one go"""
+        if self.grid is None:
+            number = self.number
+            return ["%s %s" % (number(x), number(y)) for x, y in points.tolist()]
+        numbers = self.grid.numbers(self.grid.units(points))
+        return [x + " " + y for x, y in zip(numbers[0::2], numbers[1::2])]
+
+    def polygonText(self, level, outlines, debugId):
+        """ Polygon records of closed outlines, numbered from debugId"""
+        lines = self.pointLines(np.vstack(outlines))
+        parts = []
+        start = 0
+        for points in outlines:
+            parts.append("%d %d %d N %d 1 1 100 100 0 0 0 Y\n%s\nEND\n" % (level, len(points), \
+                self.metal, debugId, "\n".join(lines[start:start + len(points)])))
+            start += len(points)
+            debugId += 1
+        return "".join(parts)
+
+    def box(self, geometry):
+        """ [xmin, ymin, xmax, ymax] of the Sonnet box: the frame if there
+            is one, else everything drawn"""
+        if self.frameLayer in geometry.layerIndex:
+            box = geometry.layer(self.frameLayer).bbox()
+            if box is not None:
+                return box
+        return geometry.bbox() or [0, 0, 1, 1]
+
+    def header(self):
+        date = time.strftime("%m/%d/%Y %H:%M:%S")
+        return "FTYP SONPROJ 10 ! Sonnet Project File\nVER 13.52\nHEADER\n" \
+            "DAT %s\nMDATE %s\nHDATE %s\n" \
+            "ANN Created by AutoScripter\nEND HEADER\n" \
+            "DIM\nFREQ GHZ\nIND NH\nLNG UM\nANG DEG\nCON /OH\nCAP PF\nRES OH\nEND DIM\n" \
+            "CONTROL\nABS\nOPTIONS  -d \nSPEED 0\nCACHE_ABS 1\nTARG_ABS 300\nQ_ACC N\n" \
+            "END CONTROL\n" % (date, date, date)
+
+    def write(self, geometry, filename):
+        """ Writes one design, returns the number of polygons"""
+        if len(geometry.instances):
+            # Sonnet has no cells, every placement is written out
+            geometry = geometry.flattened()
+        xmin, ymin, xmax, ymax = self.box(geometry)
+        width = xmax - xmin
+        height = ymax - ymin
+        number = self.number
+        with open(filename, 'w', buffering = 1 << 16) as son:
+            son.write(self.header())
+            son.write("GEO\n")
+            son.write("TMET \"Lossless\" 0 SUP 0 0 0 0\nBMET \"Lossless\" 0 SUP 0 0 0 0\n")
+            son.write("BOX %d %s %s %d %d 20 0\n" % (len(self.dielectrics) - 1, number(width), \
+                number(height), 2*int(ceil(width/self.cellSize)), 2*int(ceil(height/self.cellSize))))
+            for thickness, erel, name in self.dielectrics:
+                son.write("      %s %s 1 0 0 0 0 \"%s\"\n" % (number(thickness), number(erel), name))
+            son.write("LORGN 0 %s U \n" % number(height))
+            # Polygons are counted before NUM, so gather them per layer first
+            shapes = []
+            for layer in geometry.layers:
+                if layer.name == self.frameLayer:
+                    continue
+                level = 0 if self.levels is None else self.levels.get(layer.name)
+                if level is None:
+                    continue
+                shapes.append((level, layer))
+            nPolygons = sum(layer.nPolygons() + len(layer.arcs) \
+                + int(sum(c[3]*c[4] for c in layer.circles.view().tolist())) for level, layer in shapes)
+            son.write("NUM %d\n" % nPolygons)
+            debugId = 1
+            for level, layer in shapes:
+                outlines = []
+                for points in layer.flatPolygons(self.tolerance):
+                    # Move to the box corner, flip y and close the outline
+                    outlines.append((np.vstack([points, points[:1]]) - [xmin, ymax])*[1, -1])
+                    if len(outlines) == 1024:
+                        son.write(self.polygonText(level, outlines, debugId))
+                        debugId += len(outlines)
+                        outlines = []
+                if outlines:
+                    son.write(self.polygonText(level, outlines, debugId))
+                    debugId += len(outlines)
+            son.write("END GEO\n")
+        return debugId - 1
+
+def writeSonnet(geometry, filename, **options):
+    """ Writes geometry to a .son file, see SonnetWriter for the options"""
+    return SonnetWriter(**options).write(geometry, filename)
+
+def writeSonnetBatch(variants, **options):
+    """ Writes many designs with the same settings in one call. variants
+        yields (filename, geometry) pairs, a generator keeps only one design
+        in memory at a time. Returns the list of filenames written.
+        e.g. a resonator length sweep:
+            def variants():
+                for length in range(8000, 12000, 500):
+                    a = AutoScripter.newScript(None)
+                    drawChip(a, length)
+                    yield "res%d.son" % length, a.geometry
+            writeSonnetBatch(variants(), cellSize = 2)"""
+    writer = SonnetWriter(**options)
+    filenames = []
+    for filename, geometry in variants:
+        writer.write(geometry, filename)
+        filenames.append(filename)
+    return filenames
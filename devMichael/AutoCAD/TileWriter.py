@@ -0,0 +1,280 @@
+""" Tile Writer
+Splits a wafer-scale design into a grid of tiles and writes every tile to
+files of its own, a few at a time on threads, with a manifest (JSON) saying
+which region each file covers:
+    a = AutoScripter.newScript(None)
+    ...
+    manifest = a.writeTiles("wafer_tiles", tileSize = 10000, outputs = ["dxf", "gds"])
+    for entry in tilesIn(manifest, [0, 0, 20000, 20000]):
+        print(entry["files"]["dxf"])
+The grid is laid over the bounding box of the design, either nTiles = [rows,
+columns] of equal tiles or as many tiles of tileSize (one size or [x, y]) as
+it takes. Shapes are not cut at tile edges: each goes whole to the tile its
+middle lies in, so traces, bends and pads stay the shapes they were drawn as.
+The "extent" of a tile in the manifest is therefore the box of what it holds,
+which can stick out of its "box" by up to half a shape. Circle arrays and
+placed cells that cross tiles are split into one smaller array per tile,
+cells themselves are written to every tile that places them.
+
+Tile files are named <prefix>_r<row>_c<column>, empty tiles are left out.
+"""
+from math import *
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from DXFWriter import writeDXF
+from GDSWriter import writeGDS
+from SonnetWriter import writeSonnet
+from LayoutGeometry import LayoutGeometry, LAYER_MAKE, LAYER_SET, POLYGON, RECT, ARC, \
+    CIRCLE, JOIN, INSERT
+
+class TileGrid:
+    """ A grid of rows by columns tiles of size [x, y] from origin. Points
+        outside go to the nearest edge tile."""
+    def __init__(self, bbox, tileSize = None, nTiles = [2,2]):
+        width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        if tileSize is not None:
+            if not hasattr(tileSize, "__len__"):
+                tileSize = [tileSize, tileSize]
+            self.size = [float(tileSize[0]), float(tileSize[1])]
+            self.shape = [max(1, int(ceil(height/self.size[1]))), max(1, int(ceil(width/self.size[0])))]
+        else:
+            self.shape = [int(nTiles[0]), int(nTiles[1])]
+            self.size = [float(width/self.shape[1]) or 1.0, float(height/self.shape[0]) or 1.0]
+        self.origin = [float(bbox[0]), float(bbox[1])]
+
+    def columns(self, x):
+        return np.clip(np.floor((np.asarray(x) - self.origin[0])/self.size[0]).astype(np.int64), \
+            0, self.shape[1] - 1)
+
+    def rows(self, y):
+        return np.clip(np.floor((np.asarray(y) - self.origin[1])/self.size[1]).astype(np.int64), \
+            0, self.shape[0] - 1)
+
+    def tiles(self, points):
+        """ Tile number (row*columns + column) of each point"""
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        return self.rows(points[:,1])*self.shape[1] + self.columns(points[:,0])
+
+    def box(self, tile):
+        row, column = divmod(tile, self.shape[1])
+        x0 = self.origin[0] + column*self.size[0]
+        y0 = self.origin[1] + row*self.size[1]
+        return [x0, y0, x0 + self.size[0], y0 + self.size[1]]
+
+    def arrayPieces(self, x, y, nx, ny, dx, dy):
+        """ (tile, first column, first row, columns, rows) of the part of an
+            nx by ny array dx, dy apart, first copy at (x, y), in each tile"""
+        pieces = []
+        columns = self.columns(x + np.arange(int(nx))*dx)
+        rows = self.rows(y + np.arange(int(ny))*dy)
+        # Copies are evenly spaced, so each tile holds one run of them
+        columnRuns = np.concatenate([[0], np.flatnonzero(np.diff(columns)) + 1, [len(columns)]]).tolist()
+        rowRuns = np.concatenate([[0], np.flatnonzero(np.diff(rows)) + 1, [len(rows)]]).tolist()
+        for j0, j1 in zip(rowRuns[:-1], rowRuns[1:]):
+            for i0, i1 in zip(columnRuns[:-1], columnRuns[1:]):
+                pieces.append((int(rows[j0])*self.shape[1] + int(columns[i0]), i0, j0, i1 - i0, j1 - j0))
+        return pieces
+
+def shapeTiles(geometry, grid):
+    """ (records, tiles, pieces) of the design in drawing order: one entry
+        per polygon and arc, one per tile for circles and placed cells (the
+        piece is the circle or instance row of the part in that tile) and
+        tile -1 for layer changes and joins, which every tile gets"""
+    records = geometry.records.view()
+    kinds, layers, indices = records[:,0], records[:,1], records[:,2]
+    tiles = np.full(len(records), -1, np.int64)
+    for layerIndex, layer in enumerate(geometry.layers):
+        # Polygons by the middle of their box, arcs by the middle of the sector
+        polygons = np.flatnonzero(((kinds == POLYGON) | (kinds == RECT)) & (layers == layerIndex))
+        if len(polygons):
+            vertices = layer.vertices.view()
+            starts = layer.offsets.view()[:-1]
+            middles = (np.minimum.reduceat(vertices, starts) + np.maximum.reduceat(vertices, starts))/2
+            tiles[polygons] = grid.tiles(middles[indices[polygons]])
+        arcs = np.flatnonzero((kinds == ARC) & (layers == layerIndex))
+        if len(arcs):
+            a = layer.arcs.view()[indices[arcs]]
+            r = (a[:,2] + a[:,3])/2
+            middle = (a[:,4] + a[:,5])/2
+            tiles[arcs] = grid.tiles(np.column_stack([a[:,0] + r*np.cos(middle), a[:,1] + r*np.sin(middle)]))
+    entries = np.flatnonzero((tiles >= 0) | (kinds == LAYER_MAKE) | (kinds == LAYER_SET) | (kinds == JOIN))
+    tiles = tiles[entries]
+    pieces = [None]*len(entries)
+    # Arrays, split into one array per tile
+    split = []
+    for i in np.flatnonzero((kinds == CIRCLE) | (kinds == INSERT)).tolist():
+        if kinds[i] == CIRCLE:
+            cx, cy, r, nx, ny, dx, dy = geometry.layers[layers[i]].circles.view()[indices[i]].tolist()
+            for tile, i0, j0, ni, nj in grid.arrayPieces(cx, cy, nx, ny, dx, dy):
+                split.append((i, tile))
+                pieces.append([cx + i0*dx, cy + j0*dy, r, ni, nj, dx, dy])
+        else:
+            cellIndex, x, y, angle, nx, ny, dx, dy = geometry.instances.view()[indices[i]].tolist()
+            # By the middle of the placed cell, not its origin
+            box = geometry.cells[int(cellIndex)].geometry.bbox() or [0, 0, 0, 0]
+            mx, my = (box[0] + box[2])/2, (box[1] + box[3])/2
+            mx, my = x + cos(angle)*mx - sin(angle)*my, y + sin(angle)*mx + cos(angle)*my
+            for tile, i0, j0, ni, nj in grid.arrayPieces(mx, my, nx, ny, dx, dy):
+                split.append((i, tile))
+                pieces.append([cellIndex, x + i0*dx, y + j0*dy, angle, ni, nj, dx, dy])
+    if split:
+        split = np.array(split, np.int64)
+        entries = np.concatenate([entries, split[:,0]])
+        tiles = np.concatenate([tiles, split[:,1]])
+    order = np.argsort(entries, kind = "stable")
+    return entries[order], tiles[order], [pieces[k] for k in order.tolist()]
+
+def keptEntries(kinds, layers):
+    """ Mask of the tile entries worth keeping: joins with something drawn
+        since the last join, layer changes with something drawn on the layer
+        before the next change, and the first make of every layer"""
+    isLayer = (kinds == LAYER_MAKE) | (kinds == LAYER_SET)
+    isJoin = kinds == JOIN
+    isShape = ~isLayer & ~isJoin
+    keep = isShape.copy()
+    notLayer = np.flatnonzero(~isLayer)
+    keep[notLayer[1:]] |= isJoin[notLayer[1:]] & isShape[notLayer[:-1]]
+    notJoin = np.flatnonzero(~isJoin)
+    keep[notJoin[:-1]] |= isLayer[notJoin[:-1]] & isShape[notJoin[1:]]
+    makes = np.flatnonzero(kinds == LAYER_MAKE)
+    keep[makes[np.unique(layers[makes], return_index = True)[1]]] = True
+    return keep
+
+def tileGeometry(geometry, rows, pieces):
+    """ LayoutGeometry of the records rows of one tile, with the circle and
+        instance rows pieces of its arrays, sharing the cells of geometry"""
+    records = geometry.records.view()[rows]
+    keep = keptEntries(records[:,0], records[:,1])
+    kinds, layers, indices = records[keep,0], records[keep,1], records[keep,2]
+    pieces = [piece for piece, kept in zip(pieces, keep.tolist()) if kept]
+    tile = LayoutGeometry(geometry.cells)
+    layerIds = sorted(set(layers.tolist()) - set([-1]))
+    layerMap = np.full(len(geometry.layers) + 1, -1, np.int64)
+    newIndices = np.full(len(kinds), -1, np.int64)
+    for layerIndex in layerIds:
+        source = geometry.layers[layerIndex]
+        layerMap[layerIndex] = tile._getLayer(source.name, source.color)
+        target = tile.layers[layerMap[layerIndex]]
+        polygons = np.flatnonzero(((kinds == POLYGON) | (kinds == RECT)) & (layers == layerIndex))
+        if len(polygons):
+            offsets = source.offsets.view()
+            starts = offsets[indices[polygons]]
+            counts = offsets[indices[polygons] + 1] - starts
+            # Gather the vertices of all of them in one go
+            first = np.cumsum(counts) - counts
+            vertices = source.vertices.view()[np.repeat(starts - first, counts) + np.arange(counts.sum())]
+            newIndices[polygons] = target.addPlacedPolygons(vertices, counts) + np.arange(len(polygons))
+        arcs = np.flatnonzero((kinds == ARC) & (layers == layerIndex))
+        if len(arcs):
+            newIndices[arcs] = target.arcs.extend(source.arcs.view()[indices[arcs]]) + np.arange(len(arcs))
+    for k in np.flatnonzero((kinds == CIRCLE) | (kinds == INSERT)).tolist():
+        if kinds[k] == CIRCLE:
+            newIndices[k] = tile.layers[layerMap[layers[k]]].circles.append(pieces[k])
+        else:
+            newIndices[k] = tile.instances.append(pieces[k])
+    tile.records.extend(np.column_stack([kinds, layerMap[layers], newIndices]))
+    changes = np.flatnonzero((kinds == LAYER_MAKE) | (kinds == LAYER_SET))
+    if len(changes):
+        tile.current = int(layerMap[layers[changes[-1]]])
+    return tile
+
+def splitTiles(geometry, tileSize = None, nTiles = [2,2]):
+    """ (TileGrid, {tile: LayoutGeometry}) of a design, see the module
+        notes. Tiles with nothing in them are left out."""
+    grid = TileGrid(geometry.bbox() or [0, 0, 1, 1], tileSize, nTiles)
+    rows, tiles, pieces = shapeTiles(geometry, grid)
+    everyTile = tiles < 0
+    result = {}
+    for tile in np.unique(tiles[~everyTile]).tolist():
+        which = np.flatnonzero((tiles == tile) | everyTile)
+        result[tile] = tileGeometry(geometry, rows[which], [pieces[k] for k in which.tolist()])
+    return grid, result
+
+def settle(geometry):
+    """ Copies everything waiting into the buffers of geometry, so threads
+        only ever read them"""
+    geometry.records.view()
+    geometry.instances.view()
+    for layer in geometry.layers:
+        for array in [layer.vertices, layer.offsets, layer.arcs, layer.circles]:
+            array.view()
+
+def writeTile(job):
+    """ Writes one tile to each output, returns its manifest entry"""
+    tile, geometry, box, base, outputs, options = job
+    entry = {"tile": tile, "box": box, "files": {}}
+    t0 = time.perf_counter()
+    for output in outputs:
+        filename = "%s.%s" % (base, output)
+        if output == "scr":
+            import AutoScripter # Circular otherwise, AutoScripter imports this module
+            a = AutoScripter.newScript(filename, closedBends = options.get("closedBends", False), \
+                precision = options.get("precision"))
+            a.geometry = geometry
+            a.close()
+        elif output == "dxf":
+            writeDXF(geometry, filename, options.get("sectorsAsArcs", False))
+        elif output == "gds":
+            writeGDS(geometry, filename, **options.get("gds", {}))
+        elif output == "son":
+            sonnetOptions = dict(options.get("son", {}))
+            if options.get("precision") is not None:
+                sonnetOptions.setdefault("precision", options["precision"])
+            writeSonnet(geometry, filename, **sonnetOptions)
+        else:
+            raise ValueError("Unknown tile output %s" % output)
+        entry["files"][output] = os.path.basename(filename)
+    entry["extent"] = [float(x) for x in geometry.bbox()]
+    entry["nShapes"] = int(np.isin(geometry.records.view()[:,0], [POLYGON, RECT, ARC, CIRCLE, INSERT]).sum())
+    entry["bytes"] = dict((output, os.path.getsize("%s.%s" % (base, output))) for output in outputs)
+    entry["seconds"] = time.perf_counter() - t0
+    return entry
+
+def writeTiles(geometry, directory, prefix = "tile", tileSize = None, nTiles = [2,2], \
+        outputs = ["dxf"], maxWorkers = None, manifest = "manifest.json", **options):
+    """ Splits geometry into tiles (tileSize, or nTiles = [rows, columns])
+        and writes each with outputs ("scr", "dxf", "gds" and/or "son") into
+        directory on maxWorkers threads (None: one per core, 1: in this
+        thread). options: closedBends, precision (see newScript),
+        sectorsAsArcs, and gds and son dicts of writer options. Returns the
+        manifest, also written to directory unless manifest is None."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    t0 = time.perf_counter()
+    grid, tiles = splitTiles(geometry, tileSize, nTiles)
+    jobs = []
+    for tile, part in tiles.items():
+        row, column = divmod(tile, grid.shape[1])
+        base = os.path.join(directory, "%s_r%d_c%d" % (prefix, row, column))
+        jobs.append((tile, part, grid.box(tile), base, list(outputs), options))
+    # The tiles share the cells, whose buffers are filled in on first read
+    for cell in geometry.cells:
+        settle(cell.geometry)
+    if maxWorkers == 1:
+        entries = [writeTile(job) for job in jobs]
+    else:
+        with ThreadPoolExecutor(maxWorkers) as pool:
+            entries = list(pool.map(writeTile, jobs))
+    for entry in entries:
+        entry["row"], entry["column"] = divmod(entry.pop("tile"), grid.shape[1])
+    summary = {"bbox": [float(x) for x in geometry.bbox() or []], "tileSize": grid.size, \
+        "grid": grid.shape, "outputs": list(outputs), "nTiles": len(entries), \
+        "seconds": time.perf_counter() - t0, "tiles": entries}
+    if manifest is not None:
+        path = os.path.join(directory, manifest)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(summary, f, indent = 1)
+        os.replace(path + ".tmp", path)
+    return summary
+
+def tilesIn(manifest, box):
+    """ Manifest entries (from writeTiles or its file name) of the tiles
+        holding anything inside box = [xmin, ymin, xmax, ymax]"""
+    if isinstance(manifest, str):
+        with open(manifest) as f:
+            manifest = json.load(f)
+    return [entry for entry in manifest["tiles"] if entry["extent"][0] <= box[2] \
+        and entry["extent"][2] >= box[0] and entry["extent"][1] <= box[3] and entry["extent"][3] >= box[1]]
@@ -0,0 +1,133 @@
+""" Variant Batch
+Builds many variants of a chip at once, one process per core. A layout
+function draws one variant with a newScript, a parameter grid says which
+variants to make, and every variant is written to its own files:
+    def resonator(a, length, radius):
+        a.addLayer("CPW", [50,250,50])
+        a.addCPWStraightLenAng(4, 4, 500, [0,0], -pi)
+        a.CPWMeander(4, 4, length, radius, 500, pi, a.prevEnd, a.prevAngleRad)
+
+    if __name__ == "__main__":
+        grid = parameterGrid(length = range(8000, 12000, 500), radius = [50, 100])
+        buildBatch(resonator, grid, "sweep", outputs = ["scr", "dxf"])
+The layout function has to be defined at the top level of a module so the
+worker processes can find it, and on Windows the batch has to be started from
+under if __name__ == "__main__".
+
+File names come from the position in the grid and the parameter values, e.g.
+variant_003_length9500_radius50.dxf, so the same grid always gives the same
+names. A manifest (JSON) lists every variant with its parameters, files and
+build time, and the error for variants that failed. A failed variant has no
+files: whatever it had written is deleted.
+"""
+import itertools
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import AutoScripter
+
+def parameterGrid(**axes):
+    """ Every combination of the given parameter values, as a list of dicts.
+        The last parameter changes fastest."""
+    names = list(axes.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[list(axes[name]) for name in names])]
+
+def variantName(prefix, index, params):
+    """ File name (without extension) of variant index with params"""
+    parts = ["%s_%03d" % (prefix, index)]
+    for key, value in params.items():
+        if isinstance(value, float):
+            value = "%g" % value
+        parts.append("%s%s" % (key, value))
+    # Keep the name safe for any file system
+    return re.sub(r"[^A-Za-z0-9_.+-]", "-", "_".join(parts))
+
+# buildBatch options that go to newScript
+scriptOptions = ["closedBends", "cache", "profile", "precision"]
+
+def buildVariant(job):
+    """ Draws and writes one variant, returns its manifest entry. Runs in a
+        worker process, so errors are reported instead of raised. Files are
+        written under temporary names and only renamed once all of them are
+        done; a variant that fails leaves none of its files behind, not even
+        ones from an earlier build."""
+    layout, params, base, outputs, options = job
+    entry = {"name": os.path.basename(base), "params": params, "files": {}}
+    partial = base + ".partial"
+    kinds = [kind for kind in ["scr", "dxf", "gds", "son"] if kind in outputs]
+    scriptArgs = dict((name, options[name]) for name in scriptOptions if name in options)
+    if scriptArgs.get("profile"):
+        # One profile per variant, the workers would race on a shared one
+        scriptArgs["profile"] = partial + ".profile.json"
+        kinds.append("profile")
+    suffixes = dict((kind, ".profile.json" if kind == "profile" else "." + kind) for kind in kinds)
+    t0 = time.perf_counter()
+    try:
+        a = AutoScripter.newScript(partial + ".scr" if "scr" in outputs else None, **scriptArgs)
+        try:
+            layout(a, **params)
+        finally:
+            a.close()
+        sonnetOptions = dict(options.get("son", {}))
+        if options.get("precision") is not None:
+            sonnetOptions.setdefault("precision", options["precision"])
+        if "dxf" in outputs:
+            a.writeDXF(partial + ".dxf")
+        if "gds" in outputs:
+            a.writeGDS(partial + ".gds", **options.get("gds", {}))
+        if "son" in outputs:
+            a.writeSonnet(partial + ".son", **sonnetOptions)
+        for kind in kinds:
+            os.replace(partial + suffixes[kind], base + suffixes[kind])
+            # Relative to the manifest, so the directory can be moved
+            entry["files"][kind] = os.path.basename(base) + suffixes[kind]
+        entry["nPolygons"] = a.geometry.nPolygons()
+        entry["bbox"] = [float(x) for x in a.geometry.bbox() or []]
+        entry["bytes"] = dict((kind, os.path.getsize(os.path.join(os.path.dirname(base), name))) \
+            for kind, name in entry["files"].items())
+    except Exception:
+        entry["error"] = traceback.format_exc()
+        entry["files"] = {}
+        for kind in kinds:
+            for name in [partial + suffixes[kind], base + suffixes[kind]]:
+                if os.path.exists(name):
+                    os.remove(name)
+    entry["seconds"] = time.perf_counter() - t0
+    return entry
+
+def buildBatch(layout, grid, directory = ".", prefix = "variant", outputs = ["scr", "dxf"], \
+        maxWorkers = None, manifest = "manifest.json", **options):
+    """ Builds every variant of grid (a list of parameter dicts, see
+        parameterGrid) with layout(script, **params) in a process pool and
+        writes outputs ("scr", "dxf", "gds" and/or "son") for each into
+        directory. maxWorkers None uses every core, 1 builds in this process.
+        options: closedBends, cache, profile and precision (see
+        newScript), and gds and son dicts of writer options. A profile is
+        written for each variant, as <variant>.profile.json. File names in
+        the manifest are relative to directory.
+        Returns the manifest entries in grid order."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    jobs = [(layout, dict(params), os.path.join(directory, variantName(prefix, i, params)), \
+        list(outputs), options) for i, params in enumerate(grid)]
+    t0 = time.perf_counter()
+    if maxWorkers == 1:
+        entries = [buildVariant(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(maxWorkers) as pool:
+            # Hand out a few jobs at a time so short variants don't wait on long ones
+            chunkSize = max(1, len(jobs)//(4*(maxWorkers or os.cpu_count() or 1)))
+            entries = list(pool.map(buildVariant, jobs, chunksize = chunkSize))
+    if manifest is not None:
+        summary = {"layout": "%s.%s" % (layout.__module__, layout.__name__), \
+            "outputs": list(outputs), "nVariants": len(entries), \
+            "nFailed": sum(1 for entry in entries if "error" in entry), \
+            "seconds": time.perf_counter() - t0, "variants": entries}
+        path = os.path.join(directory, manifest)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(summary, f, indent = 1, default = str)
+        os.replace(path + ".tmp", path)
+    return entries
@@ -0,0 +1,229 @@
+""" Layout Benchmark
+Times building designs of 7 to 10,000 resonators and writing them with every
+backend, and saves the numbers as JSON so runs from different commits can be
+compared. Two workloads:
+    resonators - resonatorSample1.py, one chip of readout line and 7 meandered
+                 resonators per 7 resonators (benchTransform.resonatorChip)
+    trace      - the complex trace at the bottom of AutoScripter.py, one copy
+                 per chip, so it covers the same ground as resonators
+For each size it records the wall time of every newScript method (calls,
+inclusive and self seconds, shapes drawn), the time, peak memory and bytes of
+each backend (scr, dxf, gds, son) and the shape counts. Two more backends can
+be timed: drc, the design rule check, which writes nothing and records the
+number of violations instead of bytes, and tiles, the design split into 4 by 4
+DXF tiles (TileWriter).
+
+Usage: python benchLayout.py [--sizes 7,100,1000,10000] [--workloads resonators,trace]
+           [--backends scr,dxf,gds,son,drc,tiles] [--repeats 1] [--no-memory]
+           [--output bench.json] [--compare old.json]
+Method times and peak memory (tracemalloc) are each measured in a run of their
+own, separate from the timings, which they would slow down.
+"""
+from math import *
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import AutoScripter
+from benchTransform import resonatorChip
+from ScriptProfile import ScriptProfile
+
+def complexTrace(a, nResonators, chipSize = 10000):
+    """ The complex trace of AutoScripter.py, once per chip of 7 resonators,
+        chips on a square grid like resonatorChip"""
+    width = 4
+    gap = 4
+    width2 = 10
+    gap2 = 10
+    nChips = int(ceil(nResonators/7.0))
+    nColumns = int(ceil(sqrt(nChips)))
+    a.addLayer("Frame", [250,50,50])
+    a.addLayer("CPW", [50,250,50])
+    for chip in range(nChips):
+        x0 = chipSize*(chip % nColumns)
+        y0 = chipSize*(chip // nColumns)
+        sign = 1
+        a.setLayer("Frame")
+        a.addRect(base = [x0,y0], xlen = chipSize, ylen = chipSize)
+        a.setLayer("CPW")
+        a.launchPadBegin(150, 300, width, gap, 200, 200, [x0 + 3000,y0 + 200], startAngleRad = pi/2)
+        a.addCPWAngBend(width, gap, 100, -45, a.prevEnd, a.prevAngleRad)
+        a.addCPWStraightLenAng(width, gap, length = 200, start = a.prevEnd, startAngleRad = a.prevAngleRad)
+        a.addCPWAngBend(width, gap, 100, 45, a.prevEnd, a.prevAngleRad)
+        for i in range(2,10):
+            sign = -sign
+            a.addCPWStraightLenAng(width, gap, 100, a.prevEnd, a.prevAngleRad)
+            a.addCPWAngBend(width, gap, 2*(width + gap)*i, -180*sign, a.prevEnd, a.prevAngleRad)
+        for i in range(0,3):
+            a.addCPWStraightLenAng(width, gap, 100, a.prevEnd, a.prevAngleRad)
+            a.addCPWAngBend(width, gap, 2*(width + gap), -90, a.prevEnd, a.prevAngleRad)
+        for i in range(0,3):
+            a.addCPWAngBend(width, gap, 4*(width + gap), 90, a.prevEnd, a.prevAngleRad)
+        a.addCPWStraightLenAng(width, gap, 500, a.prevEnd, a.prevAngleRad)
+        a.CPWMeander(width, gap, 2500, 25, 150, -pi/3, a.prevEnd, a.prevAngleRad)
+        a.addCPWRampLenAng(width, gap, width2, gap2, 50, a.prevEnd, a.prevAngleRad)
+        a.CPWMeander(width2, gap2, 2500, 25, 150, pi/2, a.prevEnd, a.prevAngleRad)
+        a.addCPWRampLenAng(width2, gap2, width/2, gap/2, 100, a.prevEnd, a.prevAngleRad)
+        a.addCPWStraightLenAng(width/2, gap/2, 200, a.prevEnd, a.prevAngleRad)
+        a.addCPWAngBend(width/2, gap/2, 100, 30, a.prevEnd, a.prevAngleRad)
+        a.launchPadEnd(150, 300, width/2, gap/2, 200, 200, a.prevEnd, a.prevAngleRad)
+
+workloads = {"resonators": resonatorChip, "trace": complexTrace}
+def runBackends(a, base, backends):
+    """ {backend: {seconds, bytes}} of writing a with each backend"""
+    results = {}
+    for backend in backends:
+        filename = "%s.%s" % (base, backend)
+        t0 = time.perf_counter()
+        if backend == "scr":
+            a.close()
+        elif backend == "dxf":
+            a.writeDXF(filename)
+        elif backend == "gds":
+            a.writeGDS(filename)
+        elif backend == "son":
+            a.writeSonnet(filename)
+        elif backend == "drc":
+            # Design rules with the 2 um narrowest metal, nothing written
+            violations = a.checkDesign(2.0)
+            results[backend] = {"seconds": time.perf_counter() - t0, "violations": len(violations)}
+            continue
+        elif backend == "tiles":
+            # DXF tiles of 4 by 4, on a thread per core
+            manifest = a.writeTiles(filename, nTiles = [4,4], outputs = ["dxf"])
+            results[backend] = {"seconds": time.perf_counter() - t0, "nTiles": manifest["nTiles"], \
+                "bytes": sum(entry["bytes"]["dxf"] for entry in manifest["tiles"])}
+            continue
+        results[backend] = {"seconds": time.perf_counter() - t0, "bytes": os.path.getsize(filename)}
+    return results
+
+def counts(geometry):
+    layers = geometry.layers
+    return {"records": len(geometry.records), "polygons": geometry.nPolygons(), \
+        "vertices": geometry.nVertices(), "arcs": sum(len(layer.arcs) for layer in layers), \
+        "circles": sum(len(layer.circles) for layer in layers), "instances": len(geometry.instances)}
+
+def benchOne(workload, nResonators, backends, directory, repeats = 1, memory = True):
+    """ Result dict of one workload and size, best of repeats"""
+    base = os.path.join(directory, "%s_%d" % (workload, nResonators))
+    scriptName = base + ".scr" if "scr" in backends else None
+    best = None
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        a = AutoScripter.newScript(scriptName)
+        workloads[workload](a, nResonators)
+        draw = time.perf_counter() - t0
+        result = {"workload": workload, "nResonators": nResonators, \
+            "draw": {"seconds": draw}, "backends": runBackends(a, base, backends), "counts": counts(a.geometry)}
+        a.close()
+        # Each phase is timed best of repeats on its own
+        others = result["backends"]
+        if best is None or draw < best["draw"]["seconds"]:
+            best, others = result, best["backends"] if best else {}
+        for backend, stats in others.items():
+            if stats["seconds"] < best["backends"][backend]["seconds"]:
+                best["backends"][backend] = stats
+        del a
+    # The method times in a run of their own, as timing every call slows
+    # drawing down
+    a = AutoScripter.newScript(scriptName)
+    a.profile = ScriptProfile(a) # Counted, not dumped at close
+    workloads[workload](a, nResonators)
+    best["methods"] = a.profile.summary()["methods"]
+    a.close()
+    del a
+    if memory:
+        # Peak of the traced allocations (NumPy buffers included) per phase
+        tracemalloc.start()
+        a = AutoScripter.newScript(scriptName)
+        workloads[workload](a, nResonators)
+        best["draw"]["peakBytes"] = tracemalloc.get_traced_memory()[1]
+        for backend in backends:
+            tracemalloc.reset_peak()
+            runBackends(a, base, [backend])
+            best["backends"][backend]["peakBytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        a.close()
+        del a
+    for backend in backends:
+        if backend == "tiles":
+            shutil.rmtree("%s.%s" % (base, backend))
+        elif backend != "drc":
+            os.remove("%s.%s" % (base, backend))
+    return best
+
+def environment():
+    """ Where and on what the numbers were taken"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], \
+            cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "date": datetime.datetime.now().isoformat(), \
+        "python": platform.python_version(), "numpy": np.__version__, \
+        "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def compareResults(old, new, threshold = 1.2):
+    """ Lines for every time (over 10 ms) or size in new that is more than
+        threshold times the one in old"""
+    lines = []
+    oldResults = dict(((r["workload"], r["nResonators"]), r) for r in old["results"])
+    for result in new["results"]:
+        before = oldResults.get((result["workload"], result["nResonators"]))
+        if before is None:
+            continue
+        label = "%s %d" % (result["workload"], result["nResonators"])
+        pairs = [("draw seconds", before["draw"]["seconds"], result["draw"]["seconds"])]
+        for backend, stats in result["backends"].items():
+            if backend in before["backends"]:
+                for key in ["seconds", "bytes", "peakBytes"]:
+                    if key in stats and key in before["backends"][backend]:
+                        pairs.append(("%s %s" % (backend, key), before["backends"][backend][key], stats[key]))
+        for name, stats in result["methods"].items():
+            if name in before["methods"] and before["methods"][name]["selfSeconds"] > 0.01:
+                pairs.append(("%s self seconds" % name, before["methods"][name]["selfSeconds"], stats["selfSeconds"]))
+        for what, a, b in pairs:
+            # Times of a few milliseconds are mostly noise
+            if a > (0.01 if what.endswith("seconds") else 0) and b > threshold*a:
+                lines.append("%s: %s %.4g -> %.4g (%.2fx)" % (label, what, a, b, b/a))
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Layout generation benchmark")
+    parser.add_argument("--sizes", default = "7,100,1000,10000")
+    parser.add_argument("--workloads", default = ",".join(sorted(workloads)))
+    parser.add_argument("--backends", default = "scr,dxf,gds,son")
+    parser.add_argument("--repeats", type = int, default = 1)
+    parser.add_argument("--no-memory", dest = "memory", action = "store_false")
+    parser.add_argument("--output", default = "bench.json")
+    parser.add_argument("--compare", default = None, help = "earlier output to compare with")
+    args = parser.parse_args()
+    backends = args.backends.split(",")
+    directory = tempfile.mkdtemp()
+    report = {"environment": environment(), "results": []}
+    try:
+        for workload in args.workloads.split(","):
+            for nResonators in [int(n) for n in args.sizes.split(",")]:
+                result = benchOne(workload, nResonators, backends, directory, args.repeats, args.memory)
+                report["results"].append(result)
+                print("%-10s %6d  draw %8.3f s  %s" % (workload, nResonators, result["draw"]["seconds"], \
+                    "  ".join("%s %.3f s %.1f MB" % (backend, stats["seconds"], stats.get("bytes", 0)/1e6) \
+                    for backend, stats in result["backends"].items())))
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(directory, ignore_errors = True)
+    with open(args.output + ".tmp", 'w') as f:
+        json.dump(report, f, indent = 1)
+    os.replace(args.output + ".tmp", args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            lines = compareResults(json.load(f), report)
+        print("\n".join(lines) if lines else "No regressions against %s" % args.compare)
@@ -0,0 +1,124 @@
+""" Transform Benchmark
+Times the batched NumPy transform and bulk formatting in newScript against the
+original newScript, which rotated every vertex with rotatePoint and wrote it
+with its own "%f,%f" write straight to the script while drawing. The original
+is taken from git (the first commit, or the revision given). The workload is
+resonatorSample1.py grown to 1000 resonators: the sample chip (readout line
+plus 7 meandered resonators) repeated on a grid.
+
+The two scripts draw the same shapes but are not the same bytes: the original
+wrote the closing LINE of every negative bend with a duplicated point, which
+newScript no longer does. Formatting the %f text is most of the time either
+way, so in all the batched path is only 1.1 to 1.25x faster.
+
+Usage: python benchTransform.py [nResonators] [repeats] [revision]
+"""
+from math import *
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import AutoScripter
+
+def resonatorChip(a, nResonators, resonatorsPerChip = 7, chipSize = 10000):
+    """ Draws the design of resonatorSample1.py with nResonators resonators.
+        Each block of resonatorsPerChip resonators gets its own frame and
+        readout line, blocks are laid out on a square grid."""
+    widthReadout = 4
+    gapReadout = 4
+    padWidth = 200
+    padLength  = 200
+    launcherLength = 400
+    launcherWidth  = 350
+    launcherGap = (launcherWidth - padWidth)/2
+    launcherRamp = launcherLength - padLength - launcherGap
+    readoutRadius = 100
+    widthResonator = 4
+    gapResonator = 4
+    readoutHeight = 5000
+    launcherHeight = 500
+    meanderSrtLen = 500
+    meanderRadius = 100
+
+    nChips = int(ceil(nResonators/float(resonatorsPerChip)))
+    nColumns = int(ceil(sqrt(nChips)))
+    a.addLayer("Frame", [250,50,50])
+    a.addLayer("CPW", [50,250,50])
+    for chip in range(nChips):
+        x0 = chipSize*(chip % nColumns)
+        y0 = chipSize*(chip // nColumns)
+        # Frame
+        a.setLayer("Frame")
+        a.addRect(base = [x0,y0], xlen = chipSize, ylen = chipSize)
+        # Readout line
+        a.setLayer("CPW")
+        a.launchPadBegin(padWidth, launcherWidth, widthReadout, gapReadout, padLength, launcherRamp, [x0 + 500,y0 + launcherHeight], startAngleRad = pi/2)
+        a.addCPWStraightLenAng(widthReadout, gapReadout, length = readoutHeight - launcherHeight - launcherLength - readoutRadius, start = a.prevEnd, startAngleRad = a.prevAngleRad)
+        a.addCPWAngBend(widthReadout, gapReadout, readoutRadius, -90, a.prevEnd, a.prevAngleRad)
+        a.addCPWStraightLenAng(widthReadout, gapReadout, length = 9000 - 2*readoutRadius - padWidth/2, start = a.prevEnd, startAngleRad = a.prevAngleRad)
+        a.addCPWAngBend(widthReadout, gapReadout, readoutRadius, -90, a.prevEnd, a.prevAngleRad)
+        a.addCPWStraightLenAng(widthReadout, gapReadout, length = readoutHeight - launcherHeight - launcherLength - readoutRadius, start = a.prevEnd, startAngleRad = a.prevAngleRad)
+        a.launchPadEnd(padWidth, launcherWidth, widthReadout, gapReadout, padLength, launcherRamp, a.prevEnd, a.prevAngleRad)
+        # Resonator Array
+        for i in range(min(resonatorsPerChip, nResonators - chip*resonatorsPerChip)):
+            a.addCPWStraightLenAng(widthResonator, gapResonator, length = meanderSrtLen, start = [x0 + 1200*i + 1750, y0 + readoutHeight - 2*widthResonator - 2*gapResonator], startAngleRad = -pi)
+            a.CPWMeander(widthResonator, gapResonator, 8000+i*500, meanderRadius, meanderSrtLen, pi, a.prevEnd, a.prevAngleRad)
+            a.addCPWRectGap(widthResonator, gapResonator, gapResonator, a.prevEnd, a.prevAngleRad)
+
+def originalModule(revision = None):
+    """ AutoScripter as it was at revision (default the first commit, before
+        the geometry buffers), checked out of git into a temporary directory
+        and imported as AutoScripterOriginal"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if revision is None:
+        revision = subprocess.check_output(["git", "rev-list", "--max-parents=0", "HEAD"], \
+            cwd = here).decode().split()[0]
+    path = subprocess.check_output(["git", "ls-files", "--full-name", "AutoScripter.py"], \
+        cwd = here).decode().strip()
+    source = subprocess.check_output(["git", "show", "%s:%s" % (revision, path)], cwd = here)
+    filename = os.path.join(tempfile.mkdtemp(), "AutoScripterOriginal.py")
+    with open(filename, 'wb') as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("AutoScripterOriginal", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def timeBuild(scriptClass, filename, nResonators, repeats):
+    """ Best of repeats wall times to draw the design and to write it out"""
+    drawTimes = []
+    writeTimes = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        a = scriptClass(filename)
+        resonatorChip(a, nResonators)
+        if hasattr(a, "geometry"):
+            for layer in a.geometry.layers:
+                layer.vertices # Place every vertex
+        t1 = time.perf_counter()
+        if hasattr(a, "close"):
+            a.close()
+        else: # The original writes as it draws and never closes
+            a.script.close()
+        t2 = time.perf_counter()
+        drawTimes.append(t1 - t0)
+        writeTimes.append(t2 - t1)
+    return min(drawTimes), min(writeTimes), os.path.getsize(filename)
+
+if __name__ == "__main__":
+    nResonators = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    original = originalModule(sys.argv[3] if len(sys.argv) > 3 else None)
+    directory = tempfile.mkdtemp()
+    results = []
+    for name, scriptClass in [("per point", original.newScript), ("batched", AutoScripter.newScript)]:
+        filename = os.path.join(directory, "bench_%s.scr" % name.replace(" ", ""))
+        results.append((name,) + timeBuild(scriptClass, filename, nResonators, repeats))
+    print("%d resonators, best of %d" % (nResonators, repeats))
+    # The per point path writes while it draws, so the totals are what compare
+    print("%-10s %9s %9s %9s %12s" % ("", "draw (s)", "write (s)", "total (s)", "bytes"))
+    for name, draw, write, size in results:
+        print("%-10s %9.3f %9.3f %9.3f %12d" % (name, draw, write, draw + write, size))
+    print("speedup    %28.2fx" % (sum(results[0][1:3])/sum(results[1][1:3])))
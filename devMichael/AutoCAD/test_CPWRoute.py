@@ -0,0 +1,80 @@
+""" Tests of the closed-form length, end and box of CPWRoute against the
+geometry it draws and the same calls chained by hand"""
+from math import *
+import numpy as np
+import pytest
+import AutoScripter
+from CPWRoute import CPWRoute
+from DesignRules import layerShapes
+
+def route(lengthTotal = 8000, startPhaseRad = pi):
+    return CPWRoute(4, 4, [1750, 4984], -pi/2).straight(500).ramp(200, 10, 6) \
+        .bend(120, 90).meander(lengthTotal, 100, 500, startPhaseRad).bend(100, -45).straight(300)
+
+def byHand(lengthTotal = 8000, startPhaseRad = pi):
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    a.addCPWStraightLenAng(4, 4, 500, [1750, 4984], -pi/2)
+    a.addCPWRampLenAng(4, 4, 10, 6, 200, a.prevEnd, a.prevAngleRad)
+    a.addCPWAngBend(10, 6, 120, 90, a.prevEnd, a.prevAngleRad)
+    a.CPWMeander(10, 6, lengthTotal, 100, 500, startPhaseRad, a.prevEnd, a.prevAngleRad)
+    a.addCPWAngBend(10, 6, 100, -45, a.prevEnd, a.prevAngleRad)
+    a.addCPWStraightLenAng(10, 6, 300, a.prevEnd, a.prevAngleRad)
+    return a
+
+def drawn(r):
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    end = r.draw(a)
+    return a, end
+
+def shapesBox(geometry):
+    """ Box of the layer's shapes with arcs broken into fine chords"""
+    points = np.vstack(layerShapes(geometry.layer("Gap"), 1e-4)[1])
+    return list(points.min(axis = 0)) + list(points.max(axis = 0))
+
+def test_sameAsByHand():
+    for lengthTotal, startPhaseRad in [(8000, pi), (6321, 0), (4450, pi/3), (2900, 4)]:
+        a, end = drawn(route(lengthTotal, startPhaseRad))
+        b = byHand(lengthTotal, startPhaseRad)
+        assert a.geometry.records.view().tolist() == b.geometry.records.view().tolist()
+        assert np.allclose(a.geometry.layer("Gap").vertices.view(), b.geometry.layer("Gap").vertices.view())
+        assert np.allclose(a.geometry.layer("Gap").arcs.view(), b.geometry.layer("Gap").arcs.view())
+        assert np.allclose(end[0], b.prevEnd)
+
+def test_end():
+    for lengthTotal, startPhaseRad in [(8000, pi), (6321, 0), (4450, pi/3), (2900, 4)]:
+        r = route(lengthTotal, startPhaseRad)
+        (x, y), angle = r.end()
+        a, (end, prevAngleRad) = drawn(r)
+        assert np.allclose([x, y], end, atol = 1e-9)
+        turns = (angle - prevAngleRad)/(2*pi)
+        assert abs(turns - round(turns)) < 1e-9
+
+def test_length():
+    for lengthTotal, startPhaseRad in [(8000, pi), (6321, 0), (4450, pi/3)]:
+        r = route(lengthTotal, startPhaseRad)
+        assert abs(r.length() - (500 + 200 + 120*pi/2 + lengthTotal + 100*pi/4 + 300)) < 1e-9
+        # The pieces drawn add up to the same
+        total = sum(piece[1]*abs(piece[2])*pi/180 if piece[0] == "bend" else piece[1] \
+            for pose, piece in r.pieces())
+        assert abs(total - r.length()) < 1e-9
+
+def test_bbox():
+    for lengthTotal, startPhaseRad in [(8000, pi), (6321, 0), (4450, pi/3), (2900, 4)]:
+        r = route(lengthTotal, startPhaseRad)
+        a, end = drawn(r)
+        assert np.allclose(r.bbox(), shapesBox(a.geometry), atol = 1e-3)
+    assert CPWRoute(4, 4).bbox() is None
+
+def test_cannotDraw():
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    # Bend tighter than the trace is wide
+    with pytest.raises(ValueError):
+        CPWRoute(4, 4).straight(100).bend(5, 90).draw(a)
+    # Meander shorter than its first bend
+    with pytest.raises(ValueError):
+        CPWRoute(4, 4).meander(100, 100, 500, pi).draw(a)
+    # Nothing was drawn
+    assert a.geometry.layer("Gap").bbox() is None
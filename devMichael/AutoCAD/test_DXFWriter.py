@@ -0,0 +1,71 @@
+""" Tests of the DXF writer: written files read back with LayoutReader, and
+audited with ezdxf where it is installed"""
+from math import *
+import numpy as np
+import pytest
+import AutoScripter
+from LayoutReader import readDXF
+
+def design():
+    a = AutoScripter.newScript(None)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 1000, 500)
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 100, [0, 250], 0)
+    a.addCPWAngBend(4, 4, 50, 90, a.prevEnd, a.prevAngleRad)
+    a.addCircleArray([600, 100], 5, [20, 30], [2, 3])
+    cell = a.makeCell("addCPWStraightLenAng", 4, 4, 20)
+    a.placeCell(cell, [500, 300], 0, [1, 3], [0, 40])
+    a.placeCell(cell, [800, 300], pi/2)
+    return a, cell
+
+@pytest.mark.parametrize("sectorsAsArcs", [False, True])
+def test_audit(tmp_path, sectorsAsArcs):
+    ezdxf = pytest.importorskip("ezdxf")
+    a, cell = design()
+    filename = str(tmp_path / "chip.dxf")
+    a.writeDXF(filename, sectorsAsArcs = sectorsAsArcs)
+    doc = ezdxf.readfile(filename)
+    auditor = doc.audit()
+    assert not auditor.has_errors
+    assert doc.dxfversion == "AC1015"
+    assert doc.layers.get("CPW").rgb == (50, 250, 50)
+    entities = {}
+    for entity in doc.modelspace():
+        entities.setdefault((entity.dxf.layer, entity.dxftype()), []).append(entity)
+    assert len(entities[("Frame", "LWPOLYLINE")]) == 1
+    assert len(entities[("CPW", "CIRCLE")]) == 6
+    if sectorsAsArcs:
+        assert len(entities[("CPW", "ARC")]) == 4
+        assert len(entities[("CPW", "LINE")]) == 4
+        assert len(entities[("CPW", "LWPOLYLINE")]) == 2
+    else:
+        polylines = entities[("CPW", "LWPOLYLINE")]
+        assert len(polylines) == 4
+        assert all(p.closed for p in polylines)
+        assert sum(1 for p in polylines if p.has_arc) == 2
+    inserts = entities[("CPW", "INSERT")]
+    assert sorted((i.dxf.name, i.dxf.column_count, round(i.dxf.rotation)) for i in inserts) == \
+        [(cell.name, 1, 90), (cell.name, 3, 0)]
+    assert len(doc.blocks.get(cell.name).query("LWPOLYLINE")) == 2
+
+@pytest.mark.parametrize("sectorsAsArcs", [False, True])
+def test_readBack(tmp_path, sectorsAsArcs):
+    # Read back with LayoutReader: the same shapes and vertices on each
+    # layer, circle arrays as single circles, and the cell placements
+    a, cell = design()
+    filename = str(tmp_path / "chip.dxf")
+    a.writeDXF(filename, sectorsAsArcs = sectorsAsArcs)
+    g = readDXF(filename)
+    for drawn in a.geometry.layers:
+        read = g.layer(drawn.name)
+        assert read.color == drawn.color
+        assert (read.nPolygons(), len(read.vertices), len(read.arcs)) == \
+            (drawn.nPolygons(), len(drawn.vertices), len(drawn.arcs))
+        for i in range(drawn.nPolygons()):
+            assert np.allclose(read.polygon(i), drawn.polygon(i))
+        assert np.allclose(read.arcs.view(), drawn.arcs.view())
+    assert len(g.layer("CPW").circles) == 6
+    assert [c.name for c in g.cells] == [cell.name]
+    assert g.cells[0].geometry.nPolygons() == 2
+    assert np.allclose(g.instances.view(), a.geometry.instances.view())
@@ -0,0 +1,111 @@
+""" Tests of the spacing, overlap and frame checks of DesignRules"""
+from math import *
+import AutoScripter
+from DesignRules import checkDesign
+
+def layout(*polygons):
+    """ A script drawing polygons on one layer"""
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    for points in polygons:
+        a.geometry.addPolygon(points)
+    return a
+
+def rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+def rules(violations):
+    return sorted(violation.rule for violation in violations)
+
+def test_touching():
+    # Pieces of one trace meeting edge to edge, and a corner
+    a = layout(rect(0, 0, 10, 4), rect(10, 0, 20, 4), rect(20, 4, 24, 14))
+    assert checkDesign(a.geometry, 2.0) == []
+
+def test_spacing():
+    a = layout(rect(0, 0, 10, 4), rect(0, 5, 10, 9))
+    violations = checkDesign(a.geometry, 2.0)
+    assert rules(violations) == ["spacing"]
+    assert abs(violations[0].distance - 1.0) < 1e-9
+    assert checkDesign(a.geometry, 1.0) == []
+
+def test_crossing():
+    a = layout(rect(0, 0, 10, 10), rect(5, 5, 15, 15))
+    violations = checkDesign(a.geometry, 2.0)
+    assert rules(violations) == ["overlap"]
+    assert violations[0].location in [[10, 5], [5, 10]]
+    # Long edges crossing: reported where they cross, not at an end
+    a = layout([[0, 0], [100, 0], [100, 100]], [[0, 60], [100, 40], [100, 50]])
+    violations = checkDesign(a.geometry, 2.0)
+    assert rules(violations) == ["overlap"]
+    assert [round(x, 9) for x in violations[0].location] == [50, 50]
+
+def test_duplicate():
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    a.addRect([0, 0], 10, 4)
+    a.addRect([0, 0], 10, 4)
+    assert rules(checkDesign(a.geometry, 2.0)) == ["overlap"]
+
+def test_sharedEdge():
+    # Overlapping along the bottom edge, and one inside the other sharing
+    # its left edge
+    a = layout(rect(0, 0, 10, 10), rect(5, 0, 15, 10))
+    assert rules(checkDesign(a.geometry, 2.0)) == ["overlap"]
+    a = layout(rect(0, 0, 10, 10), rect(0, 0, 5, 10))
+    assert rules(checkDesign(a.geometry, 2.0)) == ["overlap"]
+
+def test_inside():
+    # Wholly inside, and with its corners on the other's edges
+    a = layout(rect(0, 0, 100, 100), rect(40, 40, 60, 60))
+    assert rules(checkDesign(a.geometry, 2.0)) == ["overlap"]
+    a = layout(rect(0, 0, 10, 10), [[5, 0], [10, 5], [5, 10], [0, 5]])
+    assert rules(checkDesign(a.geometry, 2.0)) == ["overlap"]
+
+def test_spacingBesideTouch():
+    # A U whose left arm touches a bar above it, the right arm too close
+    u = [[0, 0], [30, 0], [30, 10], [26, 10], [26, 4], [4, 4], [4, 10], [0, 10]]
+    bar = [[-5, 10], [4, 10], [4, 11], [32, 11], [32, 14], [-5, 14]]
+    a = layout(u, bar)
+    violations = checkDesign(a.geometry, 2.0)
+    assert rules(violations) == ["spacing"]
+    assert abs(violations[0].distance - 1.0) < 1e-9
+
+def test_bend():
+    # Chords of a bend meet the straight on either side of it
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    a.addCPWStraightLenAng(10, 4, 50, [0, 0], 0.0)
+    a.addCPWAngBend(10, 4, 60, pi/2, a.prevEnd, a.prevAngleRad)
+    a.addCPWStraightLenAng(10, 4, 50, a.prevEnd, a.prevAngleRad)
+    assert checkDesign(a.geometry, 2.0) == []
+
+def bend(width, tolerance):
+    """ Violations of a 30 degree bend between straights, the center
+        conductor width wide"""
+    a = AutoScripter.newScript(None)
+    a.addLayer("Gap")
+    a.addCPWStraightLenAng(width, 2, 100, [0, 0], 0.0)
+    a.addCPWAngBend(width, 2, 100, 30, a.prevEnd, a.prevAngleRad)
+    a.addCPWStraightLenAng(width, 2, 100, a.prevEnd, a.prevAngleRad)
+    return checkDesign(a.geometry, 2.0, tolerance = tolerance)
+
+def test_bendAtSpacing():
+    # The chords of the bend come closer than the true arcs
+    for tolerance in [0.1, 0.01, 0.001]:
+        assert bend(2.0, tolerance) == []
+
+def test_bendUnderSpacing():
+    # Short by more than the chord allowance of the two arcs
+    for tolerance in [0.01, 0.001]:
+        violations = bend(1.95, tolerance)
+        assert "arc" in [kind for violation in violations for name, kind, i in violation.shapes]
+        assert rules(violations) == ["spacing"]*len(violations)
+
+def test_frame():
+    a = layout(rect(0, 0, 10, 4), rect(95, 0, 105, 4))
+    a.addLayer("Frame")
+    a.addRect([0, 0], 100, 100)
+    violations = checkDesign(a.geometry, 2.0)
+    assert rules(violations) == ["frame"]
+    assert violations[0].shapes == [("Gap", "polygon", 1)]
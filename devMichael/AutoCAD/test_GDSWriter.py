@@ -0,0 +1,125 @@
+""" Tests of the GDSII writer: the records of written designs, and the
+designs read back with gdstk where it is installed"""
+from math import *
+import struct
+import pytest
+import AutoScripter
+import GDSWriter
+from GDSWriter import structureName
+
+def design():
+    a = AutoScripter.newScript(None)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 1000, 500)
+    a.addLayer("CPW gaps", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 100, [0, 250], 0)
+    a.addCPWAngBend(4, 4, 50, 90, a.prevEnd, a.prevAngleRad)
+    cell = a.makeCell("addCPWStraightLenAng", 4, 4, 20)
+    a.placeCell(cell, [500, 100], 0, [1, 3], [0, 40])
+    return a, cell
+
+def records(filename):
+    """ (record type, data) of every record in a GDSII file"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    position = 0
+    found = []
+    while position < len(data):
+        length, recordType = struct.unpack(">HH", data[position:position + 4])
+        found.append((recordType, data[position + 4:position + length]))
+        position += length
+    assert position == len(data)
+    return found
+
+def fromReal8(data):
+    """ Value of an 8 byte GDSII real"""
+    high, low = struct.unpack(">II", data)
+    sign = -1 if high & 0x80000000 else 1
+    exponent = (high >> 24) & 0x7F
+    mantissa = ((high & 0xFFFFFF) << 32) | low
+    return sign*mantissa/2.0**56*16.0**(exponent - 64)
+
+def structures(found):
+    """ {structure name: records between its STRNAME and ENDSTR}, in order"""
+    result = {}
+    for i, (recordType, data) in enumerate(found):
+        if recordType == GDSWriter.STRNAME:
+            name = data.rstrip(b"\0").decode("ascii")
+            end = [t for t, d in found[i:]].index(GDSWriter.ENDSTR) + i
+            result[name] = found[i + 1:end]
+    return result
+
+def test_records(tmp_path):
+    filename = str(tmp_path / "chip.gds")
+    a, cell = design()
+    # 1 + 4 boundaries, 2 in the cell, 1 AREF
+    assert a.writeGDS(filename) == 8
+    found = records(filename)
+    types = [recordType for recordType, data in found]
+    assert types[:4] == [GDSWriter.HEADER, GDSWriter.BGNLIB, GDSWriter.LIBNAME, GDSWriter.UNITS]
+    assert types[-1] == GDSWriter.ENDLIB and types.count(GDSWriter.ENDLIB) == 1
+    assert struct.unpack(">h", found[0][1]) == (600,)
+    # Units: 1 nm database units on a 1 um design
+    units = found[3][1]
+    assert abs(fromReal8(units[:8]) - 1e-3) < 1e-18 and abs(fromReal8(units[8:]) - 1e-9) < 1e-24
+    assert [fromReal8(GDSWriter.real8(x)) for x in [0, 1, -2.5, 90, 1e-9]] == [0, 1, -2.5, 90, 1e-9]
+    assert types.count(GDSWriter.BGNSTR) == types.count(GDSWriter.ENDSTR) == 4
+    # The cell before the layers, the top structure last
+    parts = structures(found)
+    assert list(parts) == [cell.name, "L1_Frame", "L2_CPW_gaps", "TOP"]
+    frame = parts["L1_Frame"]
+    assert [t for t, d in frame] == [GDSWriter.BOUNDARY, GDSWriter.LAYER, GDSWriter.DATATYPE, \
+        GDSWriter.XY, GDSWriter.ENDEL]
+    assert struct.unpack(">h", frame[1][1]) == (1,)
+    points = struct.unpack(">10i", frame[3][1])
+    assert points == (0, 0, 1000000, 0, 1000000, 500000, 0, 500000, 0, 0)
+    assert [t for t, d in parts["L2_CPW_gaps"]].count(GDSWriter.BOUNDARY) == 4
+    assert [t for t, d in parts[cell.name]].count(GDSWriter.BOUNDARY) == 2
+    # Both layers placed at the origin, the cell array as an AREF
+    top = parts["TOP"]
+    topTypes = [t for t, d in top]
+    assert topTypes.count(GDSWriter.SREF) == 2 and topTypes.count(GDSWriter.AREF) == 1
+    aref = topTypes.index(GDSWriter.AREF)
+    assert top[aref + 1][1].rstrip(b"\0").decode("ascii") == cell.name
+    # 3 columns 40 um apart in 1 row: origin, past the last column, above the row
+    assert struct.unpack(">hh", top[aref + 2][1]) == (3, 1)
+    assert struct.unpack(">6i", top[aref + 3][1]) == (500000, 100000, 620000, 100000, 500000, 100000)
+
+def test_readBack(tmp_path):
+    gdstk = pytest.importorskip("gdstk")
+    filename = str(tmp_path / "chip.gds")
+    a, cell = design()
+    a.writeGDS(filename)
+    library = gdstk.read_gds(filename)
+    cells = dict((c.name, c) for c in library.cells)
+    assert sorted(cells) == sorted(["TOP", "L1_Frame", "L2_CPW_gaps", cell.name])
+    assert [top.name for top in library.top_level()] == ["TOP"]
+    assert len(cells["L1_Frame"].polygons) == 1
+    assert cells["L1_Frame"].polygons[0].layer == 1
+    # Two straight gaps and the two sectors of the bend
+    assert len(cells["L2_CPW_gaps"].polygons) == 4
+    assert len(cells[cell.name].polygons) == 2
+    top = cells["TOP"]
+    assert sorted(r.cell.name for r in top.references) == sorted(["L1_Frame", "L2_CPW_gaps", cell.name])
+    array = [r for r in top.references if r.cell.name == cell.name][0]
+    assert (array.repetition.columns, array.repetition.rows) == (3, 1)
+    assert [round(x, 6) for x in top.bounding_box()[1]] == [1000, 500]
+
+def test_layerNamedLikeTop(tmp_path):
+    gdstk = pytest.importorskip("gdstk")
+    # Layer structures have their own prefix, so a layer may be called TOP
+    filename = str(tmp_path / "top.gds")
+    a = AutoScripter.newScript(None)
+    a.addLayer("TOP")
+    a.addRect([0, 0], 10, 10)
+    a.writeGDS(filename)
+    assert sorted(c.name for c in gdstk.read_gds(filename).cells) == ["L1_TOP", "TOP"]
+
+def test_nameClash(tmp_path):
+    a = AutoScripter.newScript(None)
+    a.addLayer("CPW")
+    a.addRect([0, 0], 10, 10)
+    with pytest.raises(ValueError):
+        a.writeGDS(str(tmp_path / "clash.gds"), topName = "L1_CPW")
+    assert structureName("gap 2 (um)") == "gap_2__um_"
+    assert len(structureName("x"*40)) == 32
@@ -0,0 +1,72 @@
+""" Tests of the on-disk geometry cache: the script comes out the same with
+and without it"""
+from math import *
+import json
+import os
+import AutoScripter
+from GeometryCache import GeometryCache
+
+def chip(a, length):
+    a.addLayer("CPW", [50,250,50])
+    a.launchPadBegin(150, 300, 4, 4, 200, 200, [0, 0], startAngleRad = pi/2)
+    a.CPWMeander(4, 4, length, 50, 300, pi, a.prevEnd, a.prevAngleRad)
+    a.launchPadEnd(150, 300, 4, 4, 200, 200, a.prevEnd, a.prevAngleRad)
+
+def run(tmp_path, length, cache = None):
+    """ Script text of chip, and the cache (hits, misses)"""
+    filename = str(tmp_path / "chip.scr")
+    a = AutoScripter.newScript(filename, cache = cache)
+    chip(a, length)
+    counts = None if a.cache is None else (a.cache.hits, a.cache.misses)
+    a.close()
+    with open(filename) as f:
+        return f.read(), counts
+
+def test_coldWarmEdited(tmp_path):
+    cache = str(tmp_path / "cache")
+    plain = run(tmp_path, 3000)[0]
+    assert run(tmp_path, 3000, cache) == (plain, (0, 3))
+    assert run(tmp_path, 3000, cache) == (plain, (3, 0))
+    # A longer meander: the first pad still hits, the end pad moved with it
+    edited = run(tmp_path, 3500)[0]
+    assert edited != plain
+    assert run(tmp_path, 3500, cache) == (edited, (1, 2))
+    assert run(tmp_path, 3500, cache) == (edited, (3, 0))
+
+def test_corruptEntry(tmp_path):
+    cache = str(tmp_path / "cache")
+    plain = run(tmp_path, 3000, cache)[0]
+    with open(os.path.join(cache, "index.json")) as f:
+        index = json.load(f)
+    dataPath = os.path.join(cache, index["data"])
+    entries = sorted(index["entries"].values())
+    # Garble the counts at the start of the first entry and cut the last
+    # one short
+    with open(dataPath, 'r+b') as f:
+        f.seek(entries[0][0])
+        f.write(b"\xff"*16)
+        f.truncate(entries[-1][0] + entries[-1][1]//2)
+    assert run(tmp_path, 3000, cache) == (plain, (1, 2))
+    # Dropped and stored again
+    assert run(tmp_path, 3000, cache) == (plain, (3, 0))
+
+def test_dataFileGone(tmp_path):
+    cache = str(tmp_path / "cache")
+    plain = run(tmp_path, 3000, cache)[0]
+    store = GeometryCache(cache)
+    dataPath = store.dataPath
+    store.close()
+    os.remove(dataPath)
+    assert run(tmp_path, 3000, cache) == (plain, (0, 3))
+
+def test_sharedCache(tmp_path):
+    # A GeometryCache passed in stays open for the next script
+    cache = GeometryCache(str(tmp_path / "cache"))
+    plain = run(tmp_path, 3000)[0]
+    assert run(tmp_path, 3000, cache) == (plain, (0, 3))
+    assert run(tmp_path, 3000, cache) == (plain, (3, 3))
+    assert cache.writable
+    assert run(tmp_path, 3500, cache)[1] == (4, 5)
+    cache.close()
+    # Saved for the next process
+    assert run(tmp_path, 3500, str(tmp_path / "cache"))[1] == (3, 0)
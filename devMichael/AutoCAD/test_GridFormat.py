@@ -0,0 +1,102 @@
+""" Tests of GridFormat and of scripts and Sonnet projects written on a grid"""
+from math import *
+import numpy as np
+import AutoScripter
+from GridFormat import GridFormat
+from LayoutReader import readScript
+
+def test_number():
+    grid = GridFormat(0.001)
+    assert grid.decimals == 3
+    assert grid.number(12.3456789) == "12.346"
+    assert grid.number(-0.5) == "-.5"
+    assert grid.number(0.0004) == "0"
+    assert grid.number(-0.0004) == "0"
+    assert grid.number(2.5001) == "2.5"
+    assert grid.number(100.0) == "100"
+    # Whole units keep their zeros
+    grid = GridFormat(10)
+    assert grid.decimals == 0
+    assert [grid.number(x) for x in [1234, -4, 100]] == ["1230", "0", "100"]
+    # Snapped to the grid, not just rounded to its decimals
+    grid = GridFormat(0.25)
+    assert [grid.number(x) for x in [0.1, 0.2, 1.4, -0.9]] == ["0", ".25", "1.5", "-1"]
+
+def test_numbers():
+    grid = GridFormat(0.01)
+    assert grid.numbers(grid.units([1.005, -0.001, 30, 2.5, 30])) == ["1", "0", "30", "2.5", "30"]
+    assert grid.numbers([]) == []
+
+def test_pointLines():
+    grid = GridFormat(0.001)
+    points = grid.units([[10, 20], [10.5, 20], [10.5, 19.25], [0, 0], [-1, 0]])
+    lines = grid.pointLines(points, [True, False, False, True, False])
+    assert lines == ["10,20", "@.5,0", "@0,-.75", "0,0", "@-1,0"]
+    assert grid.pointLines([], []) == []
+
+def design(filename, precision, closedBends = False):
+    a = AutoScripter.newScript(filename, closedBends = closedBends, precision = precision)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 1000.0004, 500)
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 100.123456, [100.1, 250.3], pi/7)
+    a.addCPWAngBend(4, 4, 50, 90, a.prevEnd, a.prevAngleRad)
+    a.addCPWAngBend(4, 4, 50, -60, a.prevEnd, a.prevAngleRad)
+    a.addCPWRampLenAng(4, 4, 10, 6, 77.7, a.prevEnd, a.prevAngleRad)
+    return a
+
+def test_readBack(tmp_path):
+    # Polygons come back as the grid points of the drawn ones, bends as
+    # sectors again
+    for closedBends in [False, True]:
+        filename = str(tmp_path / "grid.scr")
+        a = design(filename, 0.01, closedBends)
+        a.close()
+        with open(filename) as f:
+            assert "@" in f.read()
+        g = readScript(filename)
+        for name in ["Frame", "CPW"]:
+            drawn, read = a.geometry.layer(name), g.layer(name)
+            assert read.nPolygons() == drawn.nPolygons()
+            for i in range(drawn.nPolygons()):
+                snapped = np.round(drawn.polygon(i)/0.01)*0.01
+                assert np.allclose(read.polygon(i), snapped, rtol = 0, atol = 1e-9)
+        drawnArcs = a.geometry.layer("CPW").arcs.view()
+        readArcs = g.layer("CPW").arcs.view()
+        assert len(readArcs) == len(drawnArcs) == 4
+        # Same centers and radii, whichever way round the reader keeps them.
+        # ARC writes its center on the grid, a closed bend has its center
+        # found from three snapped points, within the reader's tolerance.
+        atol = 0.1 if closedBends else 1e-9
+        assert np.allclose(readArcs[:,:2], np.round(drawnArcs[:,:2]/0.01)*0.01, rtol = 0, atol = atol)
+        assert np.allclose(np.sort(np.abs(readArcs[:,2:4]), axis = 1), \
+            np.sort(np.abs(drawnArcs[:,2:4]), axis = 1), rtol = 0, atol = max(atol, 0.01))
+
+def geoPoints(filename):
+    """ Every polygon point in the GEO block of a Sonnet project"""
+    with open(filename) as f:
+        lines = f.read().split("\n")
+    geo = lines[lines.index("GEO"):lines.index("END GEO")]
+    points = []
+    for i, line in enumerate(geo):
+        if line.endswith(" 0 0 0 Y"):
+            n = int(line.split()[1])
+            points += [[float(x) for x in point.split()] for point in geo[i + 1:i + 1 + n]]
+    return np.array(points)
+
+def test_sonnet(tmp_path):
+    # The script's precision is used for the project too, unless overridden
+    fine = str(tmp_path / "fine.son")
+    coarse = str(tmp_path / "coarse.son")
+    overridden = str(tmp_path / "overridden.son")
+    design(None, None).writeSonnet(fine)
+    design(None, 0.5).writeSonnet(coarse)
+    design(None, 0.5).writeSonnet(overridden, precision = 0.25)
+    finePoints, coarsePoints = geoPoints(fine), geoPoints(coarse)
+    assert finePoints.shape == coarsePoints.shape
+    assert not np.allclose(finePoints*2, np.round(finePoints*2))
+    assert np.allclose(coarsePoints*2, np.round(coarsePoints*2))
+    assert np.abs(coarsePoints - finePoints).max() <= 0.25 + 1e-9
+    overriddenPoints = geoPoints(overridden)
+    assert np.allclose(overriddenPoints*4, np.round(overriddenPoints*4))
+    assert not np.allclose(overriddenPoints*2, np.round(overriddenPoints*2))
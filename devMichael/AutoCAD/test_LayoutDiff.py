@@ -0,0 +1,45 @@
+""" Tests of the shape by shape layout diff"""
+from math import *
+import AutoScripter
+from LayoutDiff import diffLayouts, diffSummary
+
+def chip(length = 3000, padAt = [0, 0], resonator = True, extra = False):
+    a = AutoScripter.newScript(None)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 5000, 5000)
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 1000, [500, 4000], 0)
+    if resonator:
+        a.CPWMeander(4, 4, length, 50, 300, pi, a.prevEnd, a.prevAngleRad)
+    a.addCircleArray(padAt, 5, [20, 20], [2, 2])
+    if extra:
+        a.addRect([100, 100], 10, 10)
+    return a
+
+def test_unchanged():
+    diff = diffLayouts(chip(), chip())
+    assert diff["Frame"] == {"unchanged": 1, "added": [], "removed": [], "moved": [], "changed": []}
+    counts = diff["CPW"]
+    assert counts["unchanged"] == chip().geometry.layer("CPW").nPolygons() + \
+        len(chip().geometry.layer("CPW").arcs) + 4
+    assert not (counts["added"] or counts["removed"] or counts["moved"] or counts["changed"])
+
+def test_movedAddedRemoved():
+    old = chip()
+    new = chip(padAt = [100, 50], extra = True)
+    diff = diffLayouts(old, new)["CPW"]
+    # The 4 circles of the array moved together
+    assert len(diff["moved"]) == 4
+    assert all(kind[1] == "circle" and offset == [100.0, 50.0] for kind, _, offset in diff["moved"])
+    assert diff["added"] == [("CPW", "polygon", new.geometry.layer("CPW").nPolygons() - 1)]
+    assert diff["removed"] == [] and diff["changed"] == []
+    diff = diffLayouts(old, chip(resonator = False))["CPW"]
+    assert len(diff["removed"]) == old.geometry.layer("CPW").nPolygons() - 2 + len(old.geometry.layer("CPW").arcs)
+    assert diff["unchanged"] == 2 + 4
+    assert "removed" in diffSummary({"CPW": diff})
+
+def test_changed():
+    # A longer meander only lengthens the two gaps of its last straight
+    diff = diffLayouts(chip(3000), chip(3050))["CPW"]
+    assert diff["changed"] == [(("CPW", "polygon", i), ("CPW", "polygon", i)) for i in [14, 15]]
+    assert not (diff["moved"] or diff["added"] or diff["removed"])
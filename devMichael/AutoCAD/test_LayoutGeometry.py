@@ -0,0 +1,117 @@
+""" Tests of storing shapes in LayoutGeometry and reading them back"""
+from math import *
+import numpy as np
+import pytest
+import AutoScripter
+from LayoutReader import readDXF
+from LayoutGeometry import LayoutGeometry, Cell, LAYER_MAKE, LAYER_SET, POLYGON, RECT, ARC, CIRCLE, JOIN, INSERT
+
+def design():
+    """ Two layers with a rectangle, a rotated triangle, an arc and a circle
+        array, and a join"""
+    g = LayoutGeometry()
+    g.addLayer("Frame", [250,50,50])
+    g.addPolygon([[0, 0], [100, 0], [100, 50], [0, 50]], rect = True)
+    g.addLayer("CPW", [50,250,50])
+    g.addPolygon([[0, 0], [10, 0], [0, 5]], pi/2, [20, 10])
+    g.addArc([50, 25], 5, 9, 0, pi/2)
+    g.addCircle([10, 40], 2, [3, 4], [2, 3])
+    g.addJoin()
+    g.setLayer("Frame")
+    return g
+
+def test_roundTrip():
+    g = design()
+    assert g.layerNames() == ["Frame", "CPW"]
+    assert g.layer("CPW").color == [50,250,50]
+    assert g.currentLayerName() == "Frame"
+    assert g.records.view().tolist() == [[LAYER_MAKE, 0, -1], [RECT, 0, 0], [LAYER_MAKE, 1, -1], \
+        [POLYGON, 1, 0], [ARC, 1, 0], [CIRCLE, 1, 0], [JOIN, -1, -1], [LAYER_SET, 0, -1]]
+    assert g.nPolygons() == 2
+    assert g.nVertices() == 7
+    polygons = [p.tolist() for p in g.layer("Frame").polygons()]
+    assert polygons == [[[0, 0], [100, 0], [100, 50], [0, 50]]]
+    assert np.allclose(g.layer("CPW").polygon(0), [[20, 10], [20, 20], [15, 10]])
+    assert g.layer("CPW").arcs.view().tolist() == [[50, 25, 5, 9, 0, pi/2]]
+    # nRepeat = [rows, columns] is kept as columns, rows
+    assert g.layer("CPW").circles.view().tolist() == [[10, 40, 2, 3, 2, 4, 3]]
+    assert g.bbox() == [0, 0, 100, 50]
+    assert LayoutGeometry().bbox() is None
+
+def test_fragment():
+    g = design()
+    first = 2
+    fragment = g.fragment(first)
+    h = LayoutGeometry()
+    h.addLayer("Other")
+    h.addFragment(fragment)
+    assert h.layerNames() == ["Other", "Frame", "CPW"]
+    assert h.currentLayerName() == "Frame"
+    names = lambda geometry, records: [(k, geometry.layers[l].name if l >= 0 else None) for k, l, i in records]
+    assert names(h, h.records.view()[1:].tolist()) == names(g, g.records.view()[first:].tolist())
+    assert np.array_equal(h.layer("CPW").vertices.view(), g.layer("CPW").vertices.view())
+    assert np.array_equal(h.layer("CPW").arcs.view(), g.layer("CPW").arcs.view())
+    assert np.array_equal(h.layer("CPW").circles.view(), g.layer("CPW").circles.view())
+    assert h.layer("Frame").nPolygons() == 0
+
+def test_fragmentWithCells():
+    g = design()
+    cell = Cell("pad", LayoutGeometry(g.cells))
+    g.addCell(cell)
+    g.addInstance(0, [0, 0])
+    assert g.fragment(0) is None
+
+def test_flattened():
+    g = LayoutGeometry()
+    cell = Cell("pad", LayoutGeometry(g.cells))
+    cell.geometry.useLayer("CPW")
+    cell.geometry.addPolygon([[0, 0], [4, 0], [4, 2], [0, 2]], rect = True)
+    cell.geometry.addArc([0, 0], 1, 2, 0, pi)
+    g.addCell(cell)
+    g.addLayer("CPW")
+    g.addInstance(0, [100, 0], pi/2, [0, 10], [1, 2])
+    assert g.nPolygons() == 0
+    flat = g.flattened()
+    assert [kind for kind, layer, index in flat.records.view().tolist()] == [POLYGON, ARC, POLYGON, ARC]
+    layer = flat.layer("CPW")
+    assert np.allclose(layer.polygon(0), [[100, 0], [100, 4], [98, 4], [98, 0]])
+    assert np.allclose(layer.polygon(1), [[110, 0], [110, 4], [108, 4], [108, 0]])
+    assert np.allclose(layer.arcs.view(), [[100, 0, 1, 2, pi/2, 3*pi/2], [110, 0, 1, 2, pi/2, 3*pi/2]])
+    assert np.allclose(g.bbox(), [98, -2, 112, 4])
+    assert np.allclose(flat.bbox(), [98, -2, 112, 4])
+
+def test_geometryOnly():
+    # Without a script file nothing is written, not even loose points
+    a = AutoScripter.newScript(None)
+    a.addLayer("CPW")
+    a.addRect([0, 0], 10, 5)
+    a.rotateAndWritePoint(pi/2, 1, 0, [0, 0])
+    with pytest.raises(ValueError):
+        a.runScript("C:\\AutoCAD")
+    with pytest.raises(ValueError):
+        a.exportDXF()
+    a.close()
+    assert a.geometry.nPolygons() == 1
+
+def test_functionCells(tmp_path):
+    # Two lambdas of the same name drawing different pieces are two cells,
+    # named so AutoCAD and DXF take them as block names
+    filename = str(tmp_path / "cells.scr")
+    a = AutoScripter.newScript(filename)
+    a.addLayer("CPW")
+    small = lambda script, size: script.addRect([0, 0], size, size)
+    large = lambda script, size: script.addRect([0, 0], 2*size, size)
+    cells = [a.makeCell(small, 10), a.makeCell(large, 10), a.makeCell(small, 10)]
+    assert cells[0] is cells[2] and cells[0] is not cells[1]
+    assert [cell.name for cell in cells[:2]] == ["lambda_0", "lambda_1"]
+    assert [cell.geometry.bbox() for cell in cells[:2]] == [[0, 0, 10, 10], [0, 0, 20, 10]]
+    for i, cell in enumerate(cells[:2]):
+        a.placeCell(cell, [100*i, 0])
+    a.close()
+    with open(filename) as f:
+        text = f.read()
+    assert "lambda_0\n" in text and "lambda_1\n" in text and "<" not in text
+    a.writeDXF(str(tmp_path / "cells.dxf"))
+    read = readDXF(str(tmp_path / "cells.dxf"))
+    assert [cell.name for cell in read.cells] == ["lambda_0", "lambda_1"]
+    assert [cell.geometry.bbox() for cell in read.cells] == [[0, 0, 10, 10], [0, 0, 20, 10]]
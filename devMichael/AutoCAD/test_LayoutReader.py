@@ -0,0 +1,69 @@
+""" Tests of reading the sample scripts and DXF files, and scripts written by
+newScript, back with LayoutReader"""
+from math import *
+import os
+import AutoScripter
+from LayoutReader import readLayout
+from LayoutDiff import diffLayouts
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def sample(name):
+    return os.path.join(here, name)
+
+def shapeCounts(geometry):
+    return dict((layer.name, (layer.nPolygons(), len(layer.arcs), len(layer.circles))) \
+        for layer in geometry.layers if layer.nPolygons() or len(layer.arcs) or len(layer.circles))
+
+def unchanged(diff):
+    """ {layer: unchanged count} of a diff with nothing else in it"""
+    for layerDiff in diff.values():
+        assert [len(layerDiff[kind]) for kind in ["added", "removed", "moved", "changed"]] == [0, 0, 0, 0]
+    return dict((name, layerDiff["unchanged"]) for name, layerDiff in diff.items())
+
+def test_readoutSimple():
+    # The readout line with its 7 resonators of resonatorSample1.py
+    g = readLayout(sample("ReadoutSimple.scr"))
+    assert g.layerNames() == ["Frame", "CPW"]
+    assert g.layer("CPW").color == [50,250,50]
+    assert shapeCounts(g) == {"Frame": (1, 0, 0), "CPW": (203, 174, 0)}
+    assert [float(x) for x in g.bbox()] == [0, 0, 10000, 10000]
+    assert g.readStats["conflicts"] == 0
+
+def test_scriptAndDXF():
+    # The script and the DXF exported from it hold the same shapes
+    diff = diffLayouts(sample("ReadoutSimple.scr"), sample("ReadoutSimple.dxf"))
+    assert unchanged(diff) == {"Frame": 1, "CPW": 377}
+
+def test_conflict():
+    theirs = readLayout(sample("test.scr"))
+    ours = readLayout(sample("test.scr"), conflict = "ours")
+    assert theirs.readStats["conflicts"] == ours.readStats["conflicts"] == 1
+    assert (len(theirs), len(ours)) == (212, 30)
+    assert shapeCounts(theirs) == {"Frame": (1, 0, 0), "CPW": (86, 82, 0)}
+    assert shapeCounts(ours) == {"Frame": (1, 0, 0), "CPW": (21, 4, 0)}
+
+def test_roundTrip(tmp_path):
+    # Everything newScript writes comes back as drawn: bends as sectors,
+    # closed bends as polylines, circle arrays and placed cells
+    for closedBends in [False, True]:
+        filename = str(tmp_path / ("round%d.scr" % closedBends))
+        a = AutoScripter.newScript(filename, closedBends = closedBends)
+        a.addLayer("Frame", [250,50,50])
+        a.addRect([0, 0], 2000, 2000)
+        a.addLayer("CPW", [50,250,50])
+        a.addCPWStraightLenAng(4, 4, 200, [100, 1000], 0)
+        a.addCPWAngBend(4, 4, 50, 90, a.prevEnd, a.prevAngleRad)
+        a.CPWMeander(4, 4, 3000, 25, 150, pi, a.prevEnd, a.prevAngleRad)
+        a.addCPWRectGap(4, 4, 4, a.prevEnd, a.prevAngleRad)
+        a.addCircleArray([1500, 200], 5, [20, 30], [3, 4])
+        cell = a.makeCell("CPWMeander", 4, 4, 1000, 20, 100, pi)
+        a.placeCell(cell, [1200, 1500], -pi/2, [2, 1], [0, 150])
+        a.close()
+        g = readLayout(filename)
+        assert g.layerNames() == ["Frame", "CPW"]
+        assert len(g.instances) == 1
+        counts = unchanged(diffLayouts(a, g))
+        assert counts["Frame"] == 1
+        assert counts["CPW"] == a.geometry.flattened().layer("CPW").nPolygons() + \
+            len(a.geometry.flattened().layer("CPW").arcs) + 12
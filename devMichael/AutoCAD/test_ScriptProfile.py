@@ -0,0 +1,42 @@
+""" Tests of the shape and vertex counts of ScriptProfile"""
+from math import *
+import AutoScripter
+
+def layerCounts(tmp_path, **options):
+    """ Profile layer counts of a rectangle and a bend"""
+    a = AutoScripter.newScript(str(tmp_path / "profiled.scr"), profile = True, **options)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 100, 50)
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWAngBend(4, 4, 50, -90, [0, 25], 0)
+    a.flush()
+    return a.profile.summary()["layers"], a.profile.summary()["commands"]
+
+def test_counts(tmp_path):
+    layers, commands = layerCounts(tmp_path)
+    # The 4 corners of the rectangle, the bend as two sectors of 4 corners
+    assert (layers["Frame"]["shapes"], layers["Frame"]["vertices"]) == (1, 4)
+    assert (layers["CPW"]["shapes"], layers["CPW"]["vertices"]) == (2, 8)
+    assert commands == {"PEDIT": 1, "ARRAY": 0}
+
+def test_countsClosedBends(tmp_path):
+    layers, commands = layerCounts(tmp_path, closedBends = True)
+    assert (layers["CPW"]["shapes"], layers["CPW"]["vertices"]) == (2, 8)
+    assert commands == {"PEDIT": 0, "ARRAY": 0}
+
+def test_countsCached(tmp_path):
+    # Text from the cache is counted like text formatted on the spot
+    cache = str(tmp_path / "cache")
+    counts = []
+    for run in range(3):
+        a = AutoScripter.newScript(str(tmp_path / "cached.scr"), profile = True, cache = cache)
+        a.addLayer("CPW", [50,250,50])
+        a.cached("addCPWAngBend", 4, 4, 50, -90, [0, 25], 0)
+        a.cached("addCPWStraightLenAng", 4, 4, 100, a.prevEnd, a.prevAngleRad)
+        a.flush()
+        counts.append(a.profile.summary())
+        a.close()
+    assert counts[0]["layers"] == counts[1]["layers"] == counts[2]["layers"]
+    assert counts[0]["layers"]["CPW"]["shapes"] == 4
+    assert counts[0]["layers"]["CPW"]["vertices"] == 16
+    assert counts[0]["commands"] == counts[2]["commands"]
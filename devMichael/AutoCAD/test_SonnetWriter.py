@@ -0,0 +1,43 @@
+""" Tests of the Sonnet writer: the GEO block of a written project"""
+from math import *
+import AutoScripter
+
+def geoLines(filename):
+    with open(filename) as f:
+        lines = f.read().split("\n")
+    return lines[lines.index("GEO"):lines.index("END GEO") + 1]
+
+def design():
+    a = AutoScripter.newScript(None)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([100, 200], 1000, 500)
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 100, [100, 450], 0)
+    a.addCPWAngBend(4, 4, 50, 90, a.prevEnd, a.prevAngleRad)
+    a.addCircleArray([600, 300], 5, [20, 30], [2, 3])
+    return a
+
+def test_geo(tmp_path):
+    filename = str(tmp_path / "chip.son")
+    assert design().writeSonnet(filename, cellSize = 2) == 2 + 2 + 6
+    geo = geoLines(filename)
+    # The frame sets the box: 1000 by 500 um in 2 um cells
+    box = [line for line in geo if line.startswith("BOX ")]
+    assert box == ["BOX 1 1000 500 1000 500 20 0"]
+    assert "LORGN 0 500 U " in geo
+    assert [line for line in geo if line.startswith("NUM ")] == ["NUM 10"]
+    polygons = [i for i, line in enumerate(geo) if line.endswith(" 0 0 0 Y")]
+    assert len(polygons) == 10
+    # The first straight gap, moved to the box corner with y flipped and closed
+    nPoints = int(geo[polygons[0]].split()[1])
+    points = [[float(x) for x in line.split()] for line in geo[polygons[0] + 1:polygons[0] + 1 + nPoints]]
+    assert nPoints == 5 and points[0] == points[-1]
+    assert all(0 <= x <= 1000 and 0 <= y <= 500 for x, y in points)
+    # The gap below the center conductor, 444 to 448 um up from the bottom
+    assert sorted(set(y for x, y in points)) == [252, 256]
+
+def test_levels(tmp_path):
+    # Layers missing from levels are left out
+    filename = str(tmp_path / "none.son")
+    assert design().writeSonnet(filename, levels = {}) == 0
+    assert "NUM 0" in geoLines(filename)
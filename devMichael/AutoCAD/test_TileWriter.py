@@ -0,0 +1,69 @@
+""" Tests of splitting a design into tiles and writing them"""
+from math import *
+import json
+import os
+import AutoScripter
+from LayoutGeometry import LayoutGeometry
+from LayoutDiff import diffLayouts
+from TileWriter import splitTiles, writeTiles, tilesIn
+
+def wafer():
+    """ Two rows of resonators on a 3000 by 2000 frame, a circle array and a
+        cell array across the middle"""
+    a = AutoScripter.newScript(None)
+    a.addLayer("Frame", [250,50,50])
+    a.addRect([0, 0], 3000, 2000)
+    a.addLayer("CPW", [50,250,50])
+    for y in [0, 1000]:
+        a.addCPWStraightLenAng(4, 4, 2800, [100, y + 400], 0)
+        for x in range(200, 2500, 500):
+            a.addCPWStraightLenAng(4, 4, 20, [x, y + 380], -pi/2)
+            a.CPWMeander(4, 4, 1500, 30, 150, pi, a.prevEnd, a.prevAngleRad)
+    a.addCircleArray([50, 1000], 5, [100, 100], [1, 29])
+    cell = a.makeCell("addCPWStraightLenAng", 4, 4, 20)
+    a.placeCell(cell, [40, 1100], 0, [1, 29], [0, 100])
+    return a
+
+def shapeCount(geometry):
+    layers = geometry.layers
+    return sum(layer.nPolygons() + len(layer.arcs) + int(sum(c[3]*c[4] for c in layer.circles.view().tolist())) \
+        for layer in layers) + sum(int(i[4]*i[5]) for i in geometry.instances.view().tolist())
+
+def test_everyShapeOnce():
+    a = wafer()
+    grid, tiles = splitTiles(a.geometry, nTiles = [2, 3])
+    assert grid.shape == [2, 3]
+    assert sorted(tiles) == list(range(6))
+    # Put back together the tiles hold every shape once
+    assert sum(shapeCount(tile) for tile in tiles.values()) == shapeCount(a.geometry)
+    whole = LayoutGeometry()
+    for tile in tiles.values():
+        whole.appendTransformed(tile, 0.0, [0.0, 0.0])
+    diff = diffLayouts(a, whole)
+    for layerDiff in diff.values():
+        assert not (layerDiff["added"] or layerDiff["removed"] or layerDiff["moved"] or layerDiff["changed"])
+    assert diff["CPW"]["unchanged"] == shapeCount(a.geometry.flattened()) - 1
+    # Each shape sits in the tile its middle is in
+    for tile, part in tiles.items():
+        x0, y0, x1, y1 = grid.box(tile)
+        for points in part.layer("CPW").polygons():
+            mx, my = (points.min(axis = 0) + points.max(axis = 0))/2
+            assert x0 <= mx <= x1 and y0 <= my <= y1
+
+def test_writeTiles(tmp_path):
+    a = wafer()
+    directory = str(tmp_path / "tiles")
+    manifest = a.writeTiles(directory, tileSize = 1000, outputs = ["dxf", "gds"], maxWorkers = 2)
+    assert manifest["grid"] == [2, 3]
+    assert manifest["nTiles"] == len(manifest["tiles"]) == 6
+    names = sorted(entry["files"]["dxf"] for entry in manifest["tiles"])
+    assert names == ["tile_r%d_c%d.dxf" % (row, column) for row in range(2) for column in range(3)]
+    for entry in manifest["tiles"]:
+        for kind, filename in entry["files"].items():
+            assert os.path.getsize(os.path.join(directory, filename)) == entry["bytes"][kind]
+    with open(os.path.join(directory, "manifest.json")) as f:
+        assert json.load(f)["nTiles"] == 6
+    # The frame is a shape of the middle tile, so that tile reaches everywhere
+    inside = tilesIn(os.path.join(directory, "manifest.json"), [2500, 1500, 2600, 1600])
+    assert sorted((entry["row"], entry["column"]) for entry in inside) == [(1, 1), (1, 2)]
+    assert tilesIn(manifest, [4000, 4000, 4100, 4100]) == []
@@ -0,0 +1,68 @@
+""" Tests of building a small variant batch in this process"""
+from math import *
+import json
+import os
+from VariantBatch import parameterGrid, buildBatch, variantName
+
+def resonator(a, length, radius):
+    a.addLayer("CPW", [50,250,50])
+    a.addCPWStraightLenAng(4, 4, 500, [0, 0], -pi)
+    a.CPWMeander(4, 4, length, radius, 200, pi, a.prevEnd, a.prevAngleRad)
+    if length > 3000:
+        raise ValueError("too long")
+
+def test_batch(tmp_path):
+    directory = str(tmp_path)
+    grid = parameterGrid(length = [2000, 2500], radius = [50])
+    assert grid == [{"length": 2000, "radius": 50}, {"length": 2500, "radius": 50}]
+    entries = buildBatch(resonator, grid, directory, prefix = "res", outputs = ["scr", "dxf"], \
+        maxWorkers = 1, profile = True)
+    names = ["res_000_length2000_radius50", "res_001_length2500_radius50"]
+    assert [entry["name"] for entry in entries] == names == [variantName("res", i, params) for i, params in enumerate(grid)]
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert (manifest["nVariants"], manifest["nFailed"], manifest["outputs"]) == (2, 0, ["scr", "dxf"])
+    assert manifest["layout"] == "test_VariantBatch.resonator"
+    for entry, name in zip(manifest["variants"], names):
+        assert entry["files"] == {"scr": name + ".scr", "dxf": name + ".dxf", "profile": name + ".profile.json"}
+        for kind, filename in entry["files"].items():
+            assert os.path.getsize(os.path.join(directory, filename)) == entry["bytes"][kind] > 0
+        with open(os.path.join(directory, entry["files"]["profile"])) as f:
+            assert "methods" in json.load(f)
+    assert entries[0]["nPolygons"] < entries[1]["nPolygons"]
+
+def test_failedVariant(tmp_path):
+    directory = str(tmp_path)
+    grid = parameterGrid(length = [2000, 4000], radius = [50])
+    # Left over from an earlier build of the failing variant
+    stale = os.path.join(directory, variantName("variant", 1, grid[1]) + ".scr")
+    with open(stale, 'w') as f:
+        f.write("PLINE\n")
+    entries = buildBatch(resonator, grid, directory, outputs = ["scr", "dxf"], maxWorkers = 1, profile = True)
+    assert "error" not in entries[0]
+    assert "too long" in entries[1]["error"] and entries[1]["files"] == {}
+    # Nothing of the failed variant is left, half written or stale
+    name = entries[0]["name"]
+    assert sorted(os.listdir(directory)) == sorted(["manifest.json", name + ".scr", name + ".dxf", \
+        name + ".profile.json"])
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert manifest["nFailed"] == 1
+    assert "too long" in manifest["variants"][1]["error"]
+
+def test_pool(tmp_path):
+    # Two worker processes: jobs and the layout function are pickled, and
+    # entries come back in grid order
+    directory = str(tmp_path)
+    grid = parameterGrid(length = [2000, 2200, 2400, 4000, 2600], radius = [50])
+    entries = buildBatch(resonator, grid, directory, outputs = ["scr"], maxWorkers = 2)
+    names = [variantName("variant", i, params) for i, params in enumerate(grid)]
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert [entry["name"] for entry in manifest["variants"]] == [entry["name"] for entry in entries] == names
+    assert [entry["params"]["length"] for entry in manifest["variants"]] == [2000, 2200, 2400, 4000, 2600]
+    assert manifest["nFailed"] == 1 and "too long" in manifest["variants"][3]["error"]
+    good = [entry for entry in manifest["variants"] if "error" not in entry]
+    assert sorted(os.listdir(directory)) == sorted(["manifest.json"] + [entry["files"]["scr"] for entry in good])
+    nPolygons = [entry["nPolygons"] for entry in good]
+    assert nPolygons == sorted(nPolygons)